@@ -81,9 +81,9 @@ while lores_size[0] > 1600:
     lores_size = (lores_size[0] // 2 & ~1, lores_size[1] // 2 & ~1)
 still_kwargs = {"lores": {"size": lores_size}, "display": "lores", "encode": "lores", "buffer_count": 1}
 picam2.still_configuration = picam2.create_still_configuration(**still_kwargs)
+# Work out all the sensor modes now, as that leaves the camera unconfigured, so configure it afterwards.
+list(picam2.sensor_modes)
 picam2.configure("still")
-# Read the sensor modes
-_ = picam2.sensor_modes
 
 app = QApplication([])
 
@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+
+# Compare the PiSP_COMP1 decompression engine against the original implementation, using
+# synthetic compressed data so that no camera is required.
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from picamera2.decompress import PispDecompressor
+
+
+def legacy_decompress(array):
+    # The original Helpers.decompress, kept here for comparison.
+    offset = 2048
+
+    words = array.view(np.int32)
+    words = words.reshape((words.shape[0], words.shape[1] // 2, 2))
+    qmode = words & 3
+    pix0 = (words >> 2) & 511
+    pix1 = ((words >> 11) & 127) - 64
+    pix2 = (words >> 18) & 127
+    pix3 = (words >> 25) & 127
+    q1 = np.copy(pix0)
+    q2 = pix1 + 448
+    np.maximum(pix0, pix0 - pix1, where=(qmode * pix0 < 768), out=q1)
+    np.maximum(pix0, pix0 + pix1, where=(qmode * pix0 < 768), out=q2)
+    q0 = np.minimum(1536 >> qmode, np.maximum(0, q1 - 64)) + pix2
+    q3 = np.minimum(1536 >> qmode, np.maximum(0, q2 - 64)) + pix3
+    np.maximum(np.maximum(16 * q0, 32 * (q0 - 160)), 64 * qmode * q0, out=pix0)
+    np.maximum(np.maximum(16 * q1, 32 * (q1 - 160)), 64 * qmode * q1, out=pix1)
+    np.maximum(np.maximum(16 * q2, 32 * (q2 - 160)), 64 * qmode * q2, out=pix2)
+    np.maximum(np.maximum(16 * q3, 32 * (q3 - 160)), 64 * qmode * q3, out=pix3)
+    q2 = (words >> 2) & 32767
+    q3 = (words >> 17) & 32767
+    q0 = (q2 & 15) + 16 * ((q2 >> 8) // 11)
+    q1 = (q2 >> 4) % 176
+    q2 = (q3 & 15) + 16 * ((q3 >> 8) // 11)
+    q3 = (q3 >> 4) % 176
+    np.maximum(256 * q0, 512 * (q0 - 47), out=pix0, where=(qmode == 3))
+    np.maximum(256 * q1, 512 * (q1 - 47), out=pix1, where=(qmode == 3))
+    np.maximum(256 * q2, 512 * (q2 - 47), out=pix2, where=(qmode == 3))
+    np.maximum(256 * q3, 512 * (q3 - 47), out=pix3, where=(qmode == 3))
+    res = np.stack((pix0, pix1, pix2, pix3), axis=2).reshape(array.shape)
+
+    res = np.clip(res + offset, 0, 65535).astype(np.uint16)
+    return res.view(np.uint8)
+
+
+def make_compressed(width, height, seed=0):
+    """Make a synthetic PiSP_COMP1 frame. Every 32-bit word is a valid compressed block,
+    so random words are used, with the quantisation modes weighted towards the finer
+    ones as they would be in a typical image."""
+    rng = np.random.default_rng(seed)
+    stride = (width + 7) // 8 * 8
+    words = rng.integers(0, 1 << 32, (height, stride // 4), dtype=np.uint32)
+    qmode = rng.choice(4, size=words.shape, p=[0.5, 0.3, 0.15, 0.05]).astype(np.uint32)
+    words = (words & ~np.uint32(3)) | qmode
+    return words.view(np.uint8)
+
+
+def time_it(func, repeats):
+    func()  # warm up
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1000
+
+
+def benchmark(w, h, repeats, threads):
+    compressed = make_compressed(w, h)
+    out = np.empty(compressed.shape, dtype=np.uint16)
+    with PispDecompressor(num_threads=1) as single, PispDecompressor(num_threads=threads) as threaded:
+        if not np.array_equal(single.decompress(compressed).view(np.uint8), legacy_decompress(compressed)):
+            raise RuntimeError("Decompressed images do not match")
+        return {
+            "legacy": time_it(lambda: legacy_decompress(compressed), repeats),
+            "1 thread": time_it(lambda: single.decompress(compressed, out=out), repeats),
+            f"{threads} threads": time_it(lambda: threaded.decompress(compressed, out=out), repeats),
+        }
+
+
+SIZES = {"vga": (640, 480), "1080p": (1920, 1080), "12mp": (4056, 3040)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark PiSP_COMP1 decompression")
+    parser.add_argument("--sizes", nargs="+", default=list(SIZES), choices=list(SIZES))
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    for name in args.sizes:
+        w, h = SIZES[name]
+        print(f"{name} ({w}x{h}):")
+        for label, ms in benchmark(w, h, args.repeats, args.threads).items():
+            print(f"    {label:20s} {ms:8.2f} ms")
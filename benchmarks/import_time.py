@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+
+# Measure how long "import picamera2" takes, using python -X importtime in a fresh interpreter
+# for each run, and show the modules that take longest. It fails (with exit status 1) if the
+# import goes over --budget-ms, or if it loads any of the modules that should only be imported
+# when the features needing them are used, so it can guard the startup time in CI.
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Modules that "import picamera2" must leave alone.
+DEFERRED = [
+    "PIL",
+    "pidng",
+    "piexif",
+    "simplejpeg",
+    "av",
+    "cv2",
+    "PyQt5",
+    "PyQt6",
+    "PySide6",
+    "pykms",
+    "kms",
+    "OpenGL",
+    "prctl",
+    "multiprocessing",
+    "asyncio",
+]
+
+
+def import_times(module):
+    """Import module in a new interpreter, returning {module name: (self us, cumulative us)}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True, check=False
+    )
+    if result.returncode:
+        raise RuntimeError(f"Failed to import {module}:\n{result.stderr}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def benchmark(module, runs):
+    totals = []
+    for _ in range(runs):
+        times = import_times(module)
+        totals.append(times[module][1] / 1000)
+    deferred = sorted(name for name in times if name in DEFERRED)
+    slowest = sorted(times.items(), key=lambda item: item[1][0], reverse=True)
+    return statistics.median(totals), deferred, slowest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure, and optionally check, the time taken to import picamera2")
+    parser.add_argument("--module", default="picamera2")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="number of slowest modules to list")
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if the median import takes longer")
+    args = parser.parse_args()
+
+    total_ms, deferred, slowest = benchmark(args.module, args.runs)
+    print(f"import {args.module}: {total_ms:.1f} ms (median of {args.runs})")
+    print("Slowest modules (self time, last run):")
+    for name, (self_us, cumulative_us) in slowest[: args.top]:
+        print(f"    {name:50s} {self_us / 1000:8.2f} ms {cumulative_us / 1000:8.2f} ms cumulative")
+
+    failed = False
+    if deferred:
+        print("Modules that should not have been imported:", ", ".join(deferred))
+        failed = True
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"Import took {total_ms:.1f} ms, over the budget of {args.budget_ms:.1f} ms")
+        failed = True
+    sys.exit(1 if failed else 0)
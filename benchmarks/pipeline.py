@@ -0,0 +1,85 @@
+#!/usr/bin/python3
+
+# Measure the throughput and latency of the whole Picamera2 pipeline using a virtual camera.
+# Frames go through the real process_requests, callbacks, encoders and outputs, but no camera
+# (or Raspberry Pi) is required, only the libcamera Python bindings.
+
+import argparse
+import io
+import time
+
+from picamera2 import Picamera2, Tracer
+from picamera2.encoders import JpegEncoder
+from picamera2.outputs import FileOutput
+from picamera2.virtual_camera import use_virtual_camera
+
+
+def busy(ms):
+    # Stands in for application work in a callback.
+    def work(request):
+        stop = time.perf_counter() + ms / 1000
+        while time.perf_counter() < stop:
+            pass
+
+    return work if ms else None
+
+
+def benchmark(w, h, framerate, seconds, buffer_count, callback_ms, encode, threaded, jitter):
+    manager = use_virtual_camera(size=(w, h), framerate=framerate, jitter=jitter)
+    camera = manager.cameras[0]
+    picam2 = Picamera2()
+    try:
+        config = picam2.create_video_configuration(
+            {"size": (w, h), "format": "YUV420"}, buffer_count=buffer_count, controls={"FrameRate": framerate}
+        )
+        picam2.configure(config)
+        picam2.tracer = Tracer(max_events=0)
+        picam2.post_callback = busy(callback_ms)
+        if threaded:
+            picam2.request_pipeline.start_threads()
+        if encode:
+            picam2.start_encoder(JpegEncoder(), FileOutput(io.BytesIO()))
+        picam2.start()
+        time.sleep(0.5)  # let things settle
+        picam2.tracer.reset()
+        produced, dropped = camera.frames_produced, camera.frames_dropped
+        start = time.perf_counter()
+        time.sleep(seconds)
+        elapsed = time.perf_counter() - start
+        produced, dropped = camera.frames_produced - produced, camera.frames_dropped - dropped
+        summary = picam2.tracer.summary()
+        if encode:
+            picam2.stop_encoder()
+        picam2.stop()
+    finally:
+        picam2.close()
+
+    results = {"fps": produced / elapsed, "dropped": dropped}
+    for stage, stats in summary.items():
+        results[f"{stage} p50 ms"] = stats["p50"]
+        results[f"{stage} p99 ms"] = stats["p99"]
+    return results
+
+
+SIZES = {"vga": (640, 480), "1080p": (1920, 1080), "12mp": (4056, 3040)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Picamera2 pipeline with a virtual camera")
+    parser.add_argument("--sizes", nargs="+", default=["vga", "1080p"], choices=list(SIZES))
+    parser.add_argument("--framerate", type=float, default=30.0)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--buffer-count", type=int, default=6)
+    parser.add_argument("--callback-ms", type=float, default=0.0, help="time spent in a post_callback")
+    parser.add_argument("--encode", action="store_true", help="also JPEG encode every frame")
+    parser.add_argument("--threaded", action="store_true", help="run callbacks and encoders on their own threads")
+    parser.add_argument("--jitter", type=float, default=0.0, help="frame timing jitter in seconds")
+    args = parser.parse_args()
+
+    for name in args.sizes:
+        w, h = SIZES[name]
+        print(f"{name} ({w}x{h}):")
+        results = benchmark(
+            w, h, args.framerate, args.seconds, args.buffer_count, args.callback_ms, args.encode, args.threaded, args.jitter
+        )
+        for label, value in results.items():
+            print(f"    {label:50s} {value:8.2f}")
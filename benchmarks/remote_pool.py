@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+
+# Measure how many frames a remote.Pool can process, using a virtual camera so that no camera
+# hardware is needed. Each worker does a token amount of work on the frame it is sent, so the
+# result is mostly the cost of getting requests to the workers and their results back.
+
+import argparse
+import time
+
+import numpy as np
+
+from picamera2 import Picamera2, Pool, RemoteMappedArray
+from picamera2.virtual_camera import use_virtual_camera
+
+
+def run(request):
+    with RemoteMappedArray(request, "main") as m:
+        return int(np.sum(m.array[::64, ::64]))
+
+
+def benchmark(w, h, framerate, seconds, workers):
+    use_virtual_camera(size=(w, h), framerate=framerate)
+    picam2 = Picamera2()
+    try:
+        picam2.configure(picam2.create_video_configuration({"size": (w, h), "format": "YUV420"}, buffer_count=12))
+        with Pool(run, workers, picam2) as pool:
+            picam2.start()
+            futures = []
+            start = time.perf_counter()
+            while time.perf_counter() - start < seconds:
+                request = picam2.capture_request()
+                futures.append(pool.send(request))
+                request.release()
+            for future in futures:
+                future.result()
+            elapsed = time.perf_counter() - start
+            picam2.stop()
+    finally:
+        picam2.close()
+        Picamera2._cm.set_backend(None)
+    return {"fps": len(futures) / elapsed}
+
+
+SIZES = {"vga": (640, 480), "1080p": (1920, 1080), "12mp": (4056, 3040)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark remote.Pool with a virtual camera")
+    parser.add_argument("--sizes", nargs="+", default=["1080p"], choices=list(SIZES))
+    parser.add_argument("--framerate", type=float, default=30.0)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    args = parser.parse_args()
+
+    for name in args.sizes:
+        w, h = SIZES[name]
+        for workers in args.workers:
+            results = benchmark(w, h, args.framerate, args.seconds, workers)
+            for label, value in results.items():
+                print(f"{name} ({w}x{h}), {workers} workers: {label} {value:8.2f}")
@@ -0,0 +1,442 @@
+#!/usr/bin/python3
+
+# Run the Picamera2 benchmark suite, covering the capture, conversion, encoding and output hot
+# paths at several resolutions. Synthetic buffers are used, so no camera is required.
+#
+# Results can be saved as JSON with --output, and compared against an earlier run with
+# --baseline, in which case the script fails if anything is more than --threshold percent slower.
+#
+#     python3 run_benchmarks.py --output baseline.json
+#     python3 run_benchmarks.py --baseline baseline.json --threshold 10
+
+import argparse
+import io
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from functools import partial
+from types import SimpleNamespace
+
+import decompress
+import numpy as np
+import yuv_to_rgb
+
+from picamera2.allocators import VirtualAllocator
+from picamera2.controls import Controls
+from picamera2.converters import YUV420_to_RGB
+from picamera2.encoders import JpegEncoder
+from picamera2.motion import MotionDetector
+from picamera2.outputs import CircularOutput, CircularOutput2, EncodedPacket, FileOutput
+from picamera2.request import CompletedRequest, Helpers
+
+SIZES = {"vga": (640, 480), "1080p": (1920, 1080), "12mp": (4056, 3040)}
+
+METADATA = {
+    "SensorTimestamp": 1000000000,
+    "ExposureTime": 10000,
+    "AnalogueGain": 2.0,
+    "DigitalGain": 1.0,
+    "ColourGains": (1.9, 1.6),
+    "ColourCorrectionMatrix": (1.8, -0.6, -0.2, -0.3, 1.6, -0.3, 0.0, -0.6, 1.6),
+    "SensorBlackLevels": (4096, 4096, 4096, 4096),
+}
+
+
+def time_it(func, repeats, number=1):
+    """Return the median time, in ms, of one call to func."""
+    func()  # warm up
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    return np.median(times) * 1000
+
+
+def stream_config(fmt, w, h):
+    """Return a stream configuration like Picamera2's, with rows aligned to 64 bytes."""
+    if fmt in ("YUV420", "YVU420"):
+        stride, height = (w + 63) // 64 * 64, h * 3 // 2
+    elif fmt in ("XBGR8888", "XRGB8888"):
+        stride, height = (w * 4 + 63) // 64 * 64, h
+    elif fmt in ("BGR888", "RGB888"):
+        stride, height = (w * 3 + 63) // 64 * 64, h
+    elif fmt.endswith("_PISP_COMP1"):
+        stride, height = (w + 7) // 8 * 8, h
+    else:
+        stride, height = (w * 2 + 63) // 64 * 64, h
+    return {"format": fmt, "size": (w, h), "stride": stride, "framesize": stride * height}
+
+
+class SyntheticCamera:
+    """Just enough of a Picamera2 object for Helpers and CompletedRequests to work with,
+    with one buffer of random data per stream in memory from a VirtualAllocator."""
+
+    def __init__(self, configs):
+        self.options = {}
+        self.array_pool = None
+        self.camera = SimpleNamespace(id="benchmark")
+        self.camera_properties = {"Model": "benchmark"}
+        self.camera_config = dict(configs)
+        self.request_lock = threading.Lock()
+        self.stop_count = 0
+        self.configure_count = 0
+        self.started = False
+        self.helpers = Helpers(self)
+        self.allocator = VirtualAllocator()
+        libcamera_config = [
+            SimpleNamespace(buffer_count=1, frame_size=config["framesize"], stream=name) for name, config in configs.items()
+        ]
+        self.allocator.allocate(libcamera_config, None)
+        self.stream_map = {name: name for name in configs}
+        rng = np.random.default_rng(0)
+        self.buffers = {}
+        for name, config in configs.items():
+            fb = self.allocator.buffers(name)[0]
+            if config["format"].endswith("_PISP_COMP1"):
+                data = decompress.make_compressed(*config["size"]).reshape(-1)
+            else:
+                data = rng.integers(0, 256, config["framesize"], dtype=np.uint8)
+            array = np.array(self.allocator.mapped_buffers[fb], copy=False, dtype=np.uint8)
+            array[:] = data[: len(array)]
+            self.buffers[name] = array
+
+    def request(self):
+        request = SimpleNamespace(buffers={name: self.allocator.buffers(name)[0] for name in self.stream_map}, metadata={})
+        return CompletedRequest(request, self)
+
+    def close(self):
+        self.buffers = {}
+        self.allocator.close()
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    """Register a benchmark, a function (w, h, args) returning a dictionary of results in ms."""
+
+    def register(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return register
+
+
+@benchmark("make_array")
+def bench_make_array(w, h, args):
+    results = {}
+    for fmt in ("YUV420", "XBGR8888", "BGR888"):
+        camera = SyntheticCamera({fmt: stream_config(fmt, w, h)})
+        buffer, config = camera.buffers[fmt], camera.camera_config[fmt]
+        out = np.empty_like(camera.helpers._make_array_shared(buffer, config))
+        results[fmt] = time_it(partial(camera.helpers.make_array, buffer, config), args.repeats)
+        results[f"{fmt}, out"] = time_it(partial(camera.helpers.make_array, buffer, config, out=out), args.repeats)
+        camera.close()
+    return results
+
+
+@benchmark("_make_array_shared")
+def bench_make_array_shared(w, h, args):
+    results = {}
+    for fmt in ("YUV420", "XBGR8888", "BGR888", "SRGGB12"):
+        camera = SyntheticCamera({fmt: stream_config(fmt, w, h)})
+        buffer, config = camera.buffers[fmt], camera.camera_config[fmt]
+        results[fmt] = time_it(partial(camera.helpers._make_array_shared, buffer, config), args.repeats, number=100)
+        camera.close()
+    return results
+
+
+@benchmark("make_image")
+def bench_make_image(w, h, args):
+    results = {}
+    for fmt in ("XBGR8888", "BGR888"):
+        camera = SyntheticCamera({fmt: stream_config(fmt, w, h)})
+        buffer, config = camera.buffers[fmt], camera.camera_config[fmt]
+        results[fmt] = time_it(partial(camera.helpers.make_image, buffer, config), args.repeats)
+        camera.close()
+    return results
+
+
+@benchmark("save")
+def bench_save(w, h, args):
+    jpg, png = os.path.join(args.workdir, "test.jpg"), os.path.join(args.workdir, "test.png")
+    results = {}
+    camera = SyntheticCamera({"XBGR8888": stream_config("XBGR8888", w, h)})
+    buffer, config = camera.buffers["XBGR8888"], camera.camera_config["XBGR8888"]
+    image = camera.helpers.make_image(buffer, config)
+    results["jpeg"] = time_it(partial(camera.helpers.save, image, METADATA, jpg), args.repeats)
+    results["png"] = time_it(partial(camera.helpers.save, image, METADATA, png), args.repeats)
+    results["jpeg, simplejpeg"] = time_it(partial(camera.helpers.save_jpeg, buffer, METADATA, config, jpg), args.repeats)
+    camera.close()
+    camera = SyntheticCamera({"YUV420": stream_config("YUV420", w, h)})
+    buffer, config = camera.buffers["YUV420"], camera.camera_config["YUV420"]
+    results["jpeg, simplejpeg, YUV420"] = time_it(
+        partial(camera.helpers.save_jpeg, buffer, METADATA, config, jpg), args.repeats
+    )
+    camera.close()
+    return results
+
+
+@benchmark("save_dng")
+def bench_save_dng(w, h, args):
+    dng = os.path.join(args.workdir, "test.dng")
+    results = {}
+    for fmt in ("SRGGB12", "BGGR16_PISP_COMP1"):
+        camera = SyntheticCamera({fmt: stream_config(fmt, w, h)})
+        buffer, config = camera.buffers[fmt], camera.camera_config[fmt]
+        results[fmt] = time_it(partial(camera.helpers.save_dng, buffer, METADATA, config, dng), args.repeats)
+        camera.close()
+    return results
+
+
+@benchmark("decompress")
+def bench_decompress(w, h, args):
+    return decompress.benchmark(w, h, args.repeats, args.threads)
+
+
+@benchmark("YUV420_to_RGB")
+def bench_yuv420_to_rgb(w, h, args):
+    config = stream_config("YUV420", w, h)
+    yuv = np.random.default_rng(0).integers(0, 256, config["framesize"], dtype=np.uint8)
+    convert = partial(YUV420_to_RGB, yuv, (config["stride"], h), final_width=w // 2)
+    results = {"YUV420_to_RGB": time_it(convert, args.repeats)}
+    results.update(yuv_to_rgb.benchmark(w, h, args.repeats, args.threads))
+    return results
+
+
+@benchmark("MotionDetector")
+def bench_motion_detector(w, h, args):
+    # Motion detection normally runs on a lores stream, so use a quarter of the width and height.
+    camera = SyntheticCamera({"lores": stream_config("YUV420", w // 4, h // 4)})
+    request = camera.request()
+    results = {}
+    for downsample in (1, 2):
+        detector = MotionDetector(camera, "lores", downsample=downsample)
+        results[f"{w // 4}x{h // 4}, downsample {downsample}"] = time_it(
+            partial(detector._consume, request), args.repeats, number=100
+        )
+    request.release()
+    camera.close()
+    return results
+
+
+@benchmark("CompletedRequest")
+def bench_completed_request(w, h, args):
+    # The per-frame cost of wrapping a finished libcamera request and recycling it, with three
+    # streams as in a typical video configuration, for a camera that is running.
+    camera = SyntheticCamera(
+        {
+            "main": stream_config("XBGR8888", w, h),
+            "lores": stream_config("YUV420", w // 4, h // 4),
+            "raw": stream_config("SRGGB12", w, h),
+        }
+    )
+    camera.started = True
+    camera.camera.queue_request = lambda request: None
+    camera.camera_ctrl_info = {}
+    camera.controls = Controls(camera)
+    buffers = {name: camera.allocator.buffers(name)[0] for name in camera.stream_map}
+    request = SimpleNamespace(buffers=buffers, metadata={}, reuse=lambda: None)
+
+    def cycle():
+        CompletedRequest(request, camera).release()
+
+    results = {"3 streams": time_it(cycle, args.repeats, number=1000)}
+    camera.close()
+    return results
+
+
+@benchmark("JpegEncoder.encode_func")
+def bench_jpeg_encoder(w, h, args):
+    results = {}
+    for fmt in ("YUV420", "XBGR8888"):
+        camera = SyntheticCamera({"main": stream_config(fmt, w, h)})
+        request = camera.request()
+        encoder = JpegEncoder(num_threads=1, q=90)
+        results[fmt] = time_it(partial(encoder.encode_func, request, "main"), args.repeats)
+        encoder.threads.shutdown()
+        request.release()
+        camera.close()
+    return results
+
+
+def encoded_frames(w, h, count=30):
+    # Roughly the size of high quality JPEGs, with one keyframe in every 10 (for circular outputs).
+    frame = bytes(w * h // 8)
+    return [(frame, i % 10 == 0) for i in range(count)]
+
+
+def output_frames(output, frames):
+    # Timestamps (in us) keep going up from one run to the next, as circular outputs expect.
+    timestamp = itertools.count(0, 33333)
+
+    def run():
+        for frame, keyframe in frames:
+            output.outputframe(frame, keyframe, next(timestamp))
+
+    return run
+
+
+@benchmark("FileOutput")
+def bench_file_output(w, h, args):
+    frames = encoded_frames(w, h)
+    results = {}
+    with open(os.devnull, "wb") as devnull:
+        output = FileOutput(devnull)
+        output.start()
+        results["/dev/null"] = time_it(output_frames(output, frames), args.repeats) / len(frames)
+        output.recording = False
+    with tempfile.TemporaryFile() as file:
+        output = FileOutput(file)
+        output.start()
+        write_frames = output_frames(output, frames)
+
+        def write_file():
+            file.seek(0)
+            write_frames()
+
+        results["file"] = time_it(write_file, args.repeats) / len(frames)
+        output.recording = False
+    return results
+
+
+@benchmark("CircularOutput")
+def bench_circular_output(w, h, args):
+    frames = encoded_frames(w, h)
+    results = {}
+    output = CircularOutput(buffersize=150)
+    output.start()
+    results["buffering"] = time_it(output_frames(output, frames), args.repeats) / len(frames)
+    output.recording = False
+    with open(os.devnull, "wb") as devnull:
+        output = CircularOutput(devnull, buffersize=150)
+        output.start()
+        results["writing"] = time_it(output_frames(output, frames), args.repeats) / len(frames)
+        output.stop()
+    return results
+
+
+@benchmark("CircularOutput2")
+def bench_circular_output2(w, h, args):
+    frames = encoded_frames(w, h, count=300)
+    results = {}
+    output = CircularOutput2(buffer_duration_ms=5000)
+    output.start()
+    results["buffering"] = time_it(output_frames(output, frames), args.repeats) / len(frames)
+    with open(os.devnull, "wb") as devnull:
+        output.open_output(FileOutput(devnull))
+        results["writing"] = time_it(output_frames(output, frames), args.repeats) / len(frames)
+        output.stop()
+    return results
+
+
+@benchmark("EncodedPacket fan-out")
+def bench_packet_fan_out(w, h, args):
+    # One borrowed encoder buffer shared by a file, both kinds of circular buffer and a socket-like
+    # output that needs bytes, as V4L2Encoder does it.
+    buffer = memoryview(bytearray(w * h // 8))
+    timestamp = itertools.count(0, 33333)
+    with open(os.devnull, "wb") as devnull:
+        outputs = [FileOutput(devnull), CircularOutput(buffersize=150), CircularOutput2(), FileOutput(_KeepingFile())]
+        for output in outputs:
+            output.start()
+
+        def fan_out():
+            packet = EncodedPacket(buffer, True, next(timestamp), release=lambda: None)
+            for output in outputs:
+                output.outputpacket(packet)
+            packet.release()
+
+        results = {"4 outputs": time_it(fan_out, args.repeats, number=30)}
+        for output in outputs:
+            output.recording = False
+    return results
+
+
+class _KeepingFile(io.BufferedIOBase):
+    # A file-like object that might keep what it's given, so needs bytes.
+    def write(self, data):
+        self.data = data
+        return len(data)
+
+
+def run(args):
+    """Run the selected benchmarks, printing each result as it arrives, and return them all."""
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        args.workdir = workdir
+        for name, func in BENCHMARKS.items():
+            if args.only and not any(only in name for only in args.only):
+                continue
+            for size in args.sizes:
+                w, h = SIZES[size]
+                for label, ms in func(w, h, args).items():
+                    key = f"{name}/{label}/{size}"
+                    results[key] = {"ms": float(ms), "fps": 1000 / ms if ms else None}
+                    print(f"{key:60s} {ms:10.4f} ms", flush=True)
+    return {
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+        },
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "repeats": args.repeats,
+        "threads": args.threads,
+        "results": results,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print the change in each result against the baseline, returning the keys that got slower than the threshold."""
+    regressions = []
+    print(f"\n{'benchmark':60s} {'baseline':>10s} {'now':>10s} {'change':>8s}")
+    for key, result in results["results"].items():
+        old = baseline["results"].get(key)
+        if old is None or not old["ms"]:
+            continue
+        change = (result["ms"] - old["ms"]) / old["ms"] * 100
+        flag = ""
+        if change > threshold:
+            regressions.append(key)
+            flag = "  SLOWER"
+        print(f"{key:60s} {old['ms']:10.4f} {result['ms']:10.4f} {change:+7.1f}%{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Picamera2 benchmark suite")
+    parser.add_argument("--sizes", nargs="+", default=list(SIZES), choices=list(SIZES))
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--only", nargs="+", help="run only benchmarks whose names contain one of these strings")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="compare the results against this JSON file")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percentage slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        sys.exit(0)
+
+    results = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) more than {args.threshold}% slower than the baseline")
+            sys.exit(1)
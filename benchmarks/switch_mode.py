@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+
+# Measure how long switch_mode_and_capture_array takes to go from a preview configuration to a
+# still one and back, first with every switch configuring from scratch, and then with both
+# configurations warmed in Picamera2.configuration_cache. Uses a virtual camera, so no camera
+# (or Raspberry Pi) is required, only the libcamera Python bindings.
+
+import argparse
+import statistics
+import time
+
+from picamera2 import Picamera2
+from picamera2.virtual_camera import use_virtual_camera
+
+
+def cycles(picam2, still_config, count):
+    times = []
+    for _ in range(count):
+        start = time.perf_counter()
+        picam2.switch_mode_and_capture_array(still_config)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def configures(picam2, preview_config, still_config, count):
+    # Just the configure calls, with the camera stopped, which is the part the cache speeds up.
+    times = []
+    for _ in range(count):
+        start = time.perf_counter()
+        picam2.configure(still_config)
+        picam2.configure(preview_config)
+        times.append((time.perf_counter() - start) * 1000 / 2)
+    return times
+
+
+def benchmark(w, h, framerate, count):
+    use_virtual_camera(size=(w, h), framerate=framerate)
+    picam2 = Picamera2()
+    results = {}
+    try:
+        preview_config = picam2.create_preview_configuration({"size": (w // 2, h // 2)})
+        still_config = picam2.create_still_configuration({"size": (w, h)})
+        for label in ["cold", "warm"]:
+            if label == "warm":
+                picam2.configuration_cache.warm({"viewfinder": preview_config, "capture": still_config})
+            results[f"{label} configure ms"] = statistics.median(configures(picam2, preview_config, still_config, count))
+            picam2.configure(preview_config)
+            picam2.start()
+            picam2.capture_array()
+            results[f"{label} switch_mode_and_capture ms"] = statistics.median(cycles(picam2, still_config, count))
+            picam2.stop()
+        stats = picam2.configuration_cache.stats()
+        results["cache hits"] = stats["hits"]
+        results["cache misses"] = stats["misses"]
+    finally:
+        picam2.close()
+    return results
+
+
+SIZES = {"vga": (640, 480), "1080p": (1920, 1080), "12mp": (4056, 3040)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark switching configurations with and without the configuration cache")
+    parser.add_argument("--sizes", nargs="+", default=["1080p", "12mp"], choices=list(SIZES))
+    parser.add_argument("--framerate", type=float, default=30.0)
+    parser.add_argument("--count", type=int, default=20, help="switches to time for each case")
+    args = parser.parse_args()
+
+    for name in args.sizes:
+        w, h = SIZES[name]
+        print(f"{name} ({w}x{h}):")
+        results = benchmark(w, h, args.framerate, args.count)
+        for label, value in results.items():
+            print(f"    {label:50s} {value:8.2f}")
@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+
+# Compare the YUV to RGB conversion engine against the original YUV420_to_RGB implementation.
+# This uses synthetic images, so no camera is required.
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from picamera2.converters import YUV2RGB_JPEG, YUVToRGBConverter
+
+
+def legacy_YUV420_to_RGB(YUV_in, size, matrix=YUV2RGB_JPEG, rb_swap=True, final_width=0):
+    # The original converters.YUV420_to_RGB, kept here for comparison.
+    w, h = size
+    w2 = w // 2
+    h2 = h // 2
+    n = w * h
+    n2 = n // 2
+    n4 = n // 4
+
+    YUV = np.empty((h2, w2, 3), dtype=int)
+    YUV[:, :, 0] = YUV_in[:n].reshape(h, w)[0::2, 0::2]
+    YUV[:, :, 1] = YUV_in[n : n + n4].reshape(h2, w2) - 128.0
+    YUV[:, :, 2] = YUV_in[n + n4 : n + n2].reshape(h2, w2) - 128.0
+
+    if rb_swap:
+        matrix = matrix[:, [2, 1, 0]]
+    RGB = np.dot(YUV, matrix).clip(0, 255).astype(np.uint8)
+
+    if final_width and final_width != w2:
+        RGB = RGB[:, :final_width, :]
+
+    return RGB
+
+
+def time_it(func, repeats):
+    func()  # warm up
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return np.median(times) * 1000
+
+
+def benchmark(w, h, repeats, threads):
+    rng = np.random.default_rng(0)
+    stride = (w + 63) // 64 * 64
+    yuv = rng.integers(0, 256, stride * h * 3 // 2, dtype=np.uint8)
+    half = YUVToRGBConverter("YUV420", (w, h), stride, full_resolution=False)
+    full = YUVToRGBConverter("YUV420", (w, h), stride)
+    out = np.empty(full.shape, dtype=np.uint8)
+
+    results = {
+        "legacy half resolution": time_it(lambda: legacy_YUV420_to_RGB(yuv, (stride, h)), repeats),
+        "half resolution": time_it(lambda: half.convert(yuv), repeats),
+        "full resolution": time_it(lambda: full.convert(yuv, out=out), repeats),
+    }
+    with YUVToRGBConverter("YUV420", (w, h), stride, num_threads=threads) as threaded:
+        results[f"full resolution, {threads} threads"] = time_it(lambda: threaded.convert(yuv, out=out), repeats)
+    return results
+
+
+SIZES = {"vga": (640, 480), "1080p": (1920, 1080), "12mp": (4056, 3040)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark YUV to RGB conversion")
+    parser.add_argument("--sizes", nargs="+", default=list(SIZES), choices=list(SIZES))
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    for name in args.sizes:
+        w, h = SIZES[name]
+        print(f"{name} ({w}x{h}):")
+        for label, ms in benchmark(w, h, args.repeats, args.threads).items():
+            print(f"    {label:40s} {ms:8.2f} ms")
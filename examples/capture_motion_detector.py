@@ -0,0 +1,40 @@
+#!/usr/bin/python3
+
+# Record an mp4 file whenever there is motion, starting a couple of seconds before it began.
+# The MotionDetector looks at every lores frame in the camera thread, so the application
+# itself has nothing to do.
+
+import time
+
+from picamera2 import Picamera2
+from picamera2.encoders import H264Encoder
+from picamera2.motion import CircularOutputTrigger, MotionDetector
+from picamera2.outputs import CircularOutput2, PyavOutput
+
+lsize = (320, 240)
+picam2 = Picamera2()
+main = {"size": (1280, 720), "format": "YUV420"}
+lores = {"size": lsize, "format": "YUV420"}
+video_config = picam2.create_video_configuration(main, lores=lores)
+picam2.configure(video_config)
+
+circular = CircularOutput2(buffer_duration_ms=5000)
+picam2.start_recording(H264Encoder(bitrate=1000000), circular)
+
+
+def make_output(detector):
+    print("New motion, level", detector.level)
+    return PyavOutput(f"{int(time.time())}.mp4")
+
+
+trigger = CircularOutputTrigger(circular, make_output, preroll_ms=2000)
+detector = MotionDetector(picam2, "lores", start_frames=2, stop_frames=60, on_start=trigger.start, on_stop=trigger.stop)
+
+with detector:
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Finished")
+
+picam2.stop_recording()
@@ -4,15 +4,34 @@ from concurrent.futures import TimeoutError
 import libcamera
 
 from .configuration import CameraConfiguration, StreamConfiguration
+from .configuration_cache import ConfigurationCache
 from .controls import Controls
-from .converters import YUV420_to_RGB
+from .converters import YUV420_to_RGB, YUVToRGBConverter
+from .frame_fanout import Frame, FrameFanout
+from .frame_stream import FrameStream
 from .job import CancelledError
+from .lazy import lazy_attributes
 from .metadata import Metadata
+from .motion import MotionDetector
 from .picamera2 import Picamera2, Preview
 from .platform import Platform, get_platform
-from .remote import Pool, Process, RemoteMappedArray, RemoteRequest
 from .request import CompletedRequest, MappedArray
+from .save_queue import SaveQueue
 from .sensor_format import SensorFormat
+from .sensor_modes import SensorModes
+from .tracing import Tracer
+
+# Imported when first used, so that "import picamera2" doesn't have to load asyncio or multiprocessing.
+__getattr__, __dir__ = lazy_attributes(
+    __name__,
+    {
+        "AsyncPicamera2": ".async_picamera2",
+        "Pool": ".remote",
+        "Process": ".remote",
+        "RemoteMappedArray": ".remote",
+        "RemoteRequest": ".remote",
+    },
+)
 
 if os.environ.get("XDG_SESSION_TYPE", None) == "wayland":
     # The code here works through the X wayland layer, but not otherwise.
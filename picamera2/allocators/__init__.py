@@ -2,3 +2,4 @@ from .allocator import Allocator
 from .dmaallocator import DmaAllocator
 from .libcameraallocator import LibcameraAllocator
 from .persistent_allocator import PersistentAllocator
+from .virtual_allocator import VirtualAllocator
@@ -20,28 +20,47 @@ _log = logging.getLogger("picamera2")
 
 
 class DmaAllocator(Allocator):
-    """DmaHeap Allocator"""
+    """DmaHeap Allocator
+
+    Buffers are mapped once, when they are allocated. A reconfigure unmaps the old buffers
+    straight away unless requests are still using them, in which case they are "orphaned" and
+    unmapped when the last of those requests is released. Everything done per frame is a
+    dictionary lookup or two, however many buffers there are.
+    """
 
     def __init__(self):
         super().__init__()
         self.dmaHeap = DmaHeap()
-        self.mapped_buffers = {}
-        self.mapped_buffers_used = {}
+        self.mapped_buffers = {}  # every mapped FrameBuffer, including orphaned ones
+        self.buffers_in_use = {}  # FrameBuffer -> number of requests using it
+        self.orphaned_buffers = set()  # mapped buffers left over from an earlier allocation
         self.frame_buffers = {}
         self.open_fds = []
-        self.libcamera_fds = []
+        self.libcamera_fds = set()
+        self.unmapped_buffers = 0
         self.sync = self.DmaSync
 
+    @property
+    def live_mappings(self):
+        """The number of buffers that are currently mapped, including orphaned ones."""
+        return len(self.mapped_buffers)
+
+    @property
+    def orphaned_mappings(self):
+        """The number of mapped buffers waiting for requests from an earlier allocation to be released."""
+        return len(self.orphaned_buffers)
+
     def allocate(self, libcamera_config, _):
-        # Delete old buffers
-        self.libcamera_fds = []
-        self.cleanup()
+        # Delete old buffers, or leave them for whoever is still using them.
+        self._orphan(list(self.mapped_buffers))
         # Close our copies of fds
-        for fd in self.open_fds:
-            os.close(fd)
-        self.frame_buffers = {}
-        self.open_fds = []
+        self._close_fds()
+        self._allocate(libcamera_config)
 
+    def _allocate(self, libcamera_config):
+        self.open_fds = []
+        self.libcamera_fds = set()
+        self.frame_buffers = {}
         for c, stream_config in enumerate(libcamera_config):
             stream = stream_config.stream
             fb = []
@@ -58,8 +77,7 @@ class DmaAllocator(Allocator):
                 plane[0].offset = 0
                 plane[0].length = stream_config.frame_size
 
-                self.libcamera_fds.append(plane[0].fd)
-                self.mapped_buffers_used[plane[0].fd] = False
+                self.libcamera_fds.add(plane[0].fd)
 
                 fb.append(libcamera.FrameBuffer(plane))
                 memory = mmap.mmap(plane[0].fd, stream_config.frame_size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
@@ -69,40 +87,54 @@ class DmaAllocator(Allocator):
             msg = f"Allocated {len(fb)} buffers for stream {c} with fds {[f.planes[0].fd for f in self.frame_buffers[stream]]}"
             _log.debug(msg)
 
+    def _close_fds(self):
+        for fd in self.open_fds:
+            os.close(fd)
+        self.open_fds = []
+        self.libcamera_fds = set()
+        self.frame_buffers = {}
+
+    def _orphan(self, buffers):
+        """Unmap these buffers now, or once the requests using them have been released."""
+        for buffer in buffers:
+            if self.buffers_in_use.get(buffer):
+                self.orphaned_buffers.add(buffer)
+            elif buffer in self.mapped_buffers:
+                self._unmap(buffer)
+
+    def _unmap(self, buffer):
+        self.mapped_buffers.pop(buffer).close()
+        self.orphaned_buffers.discard(buffer)
+        self.unmapped_buffers += 1
+
     def buffers(self, stream):
         return self.frame_buffers[stream]
 
     def acquire(self, buffers):
+        in_use = self.buffers_in_use
         for buffer in buffers.values():
-            fd = buffer.planes[0].fd
-            self.mapped_buffers_used[fd] = True
+            in_use[buffer] = in_use.get(buffer, 0) + 1
 
     def release(self, buffers):
+        in_use = self.buffers_in_use
         for buffer in buffers.values():
-            fd = buffer.planes[0].fd
-            self.mapped_buffers_used[fd] = False
-        self.cleanup()
+            count = in_use.pop(buffer, 0) - 1
+            if count > 0:
+                in_use[buffer] = count
+            elif self.orphaned_buffers and buffer in self.orphaned_buffers:
+                self._unmap(buffer)
 
     def cleanup(self):
-        for k, v in self.mapped_buffers.items():
-            fd = k.planes[0].fd
-            if not self.mapped_buffers_used[fd] and fd not in self.libcamera_fds:
-                # Not in use by any requests, and not currently allocated
-                v.close()
-                del self.mapped_buffers_used[fd]
-        for k in [k for k, v in self.mapped_buffers.items() if v.closed]:
-            del self.mapped_buffers[k]
+        """Unmap any orphaned buffers that are no longer in use."""
+        self._orphan(list(self.orphaned_buffers))
 
     def close(self):
-        self.libcamera_fds = []
-        self.cleanup()
+        self._orphan(list(self.mapped_buffers))
         # Close our copies of fds
-        for fd in self.open_fds:
-            os.close(fd)
-        self.frame_buffers = {}
-        self.open_fds = []
+        self._close_fds()
         if self.dmaHeap is not None:
             self.dmaHeap.close()
+            self.dmaHeap = None
 
     def __del__(self):
         self.close()
@@ -1,4 +1,5 @@
 import logging
+import os
 
 from picamera2.allocators import DmaAllocator
 
@@ -6,7 +7,12 @@ _log = logging.getLogger("picamera2")
 
 
 class PersistentAllocator(DmaAllocator):
-    """Persistent DmaHeap Allocator"""
+    """Persistent DmaHeap Allocator
+
+    Keeps a set of buffers for each use case, so that switching back to a use case reuses its
+    buffers rather than allocating new ones. The mappings, and the counts of which buffers are
+    in use, are shared by all the use cases.
+    """
 
     def __init__(self):
         super().__init__()
@@ -18,43 +24,37 @@ class PersistentAllocator(DmaAllocator):
             _log.error("Must set use_case before using persistent allocator")
         self.buffer_key = use_case
 
-        self.open_fds = []
-        self.libcamera_fds = []
-        self.frame_buffers = {}
-        self.mapped_buffers = {}
-        self.mapped_buffers_used = {}
-
+        # The buffers kept for a use case can only be reused if they are still the right sizes.
+        layout = [(stream_config.frame_size, stream_config.buffer_count) for stream_config in libcamera_config]
         buffers = self.buffer_dict.get(self.buffer_key)
+        if buffers is not None and buffers[3] != layout:
+            self.deallocate(self.buffer_key)
+            buffers = None
         if buffers is None:
-            super().allocate(libcamera_config, use_case)
-            self.buffer_dict[self.buffer_key] = (
-                self.open_fds,
-                self.libcamera_fds,
-                self.frame_buffers,
-                self.mapped_buffers,
-                self.mapped_buffers_used,
-            )
+            self._allocate(libcamera_config)
+            self.buffer_dict[self.buffer_key] = (self.open_fds, self.libcamera_fds, self.frame_buffers, layout)
         else:
-            (self.open_fds, self.libcamera_fds, self.frame_buffers, self.mapped_buffers, self.mapped_buffers_used) = buffers
-
-    def cleanup(self):
-        pass
+            (self.open_fds, self.libcamera_fds, self.frame_buffers, _) = buffers
 
     def deallocate(self, buffer_key=None):
         """Deallocate a set of buffers if no longer in use"""
         if buffer_key is None:
             buffer_key = self.buffer_key
 
-        tmp = super().__new__(DmaAllocator)
-        tmp.dmaHeap = None
-
-        (tmp.open_fds, tmp.libcamera_fds, tmp.frame_buffers, tmp.mapped_buffers, tmp.mapped_buffers_used) = self.buffer_dict[
-            buffer_key
-        ]
-        tmp.close()
-        del self.buffer_dict[buffer_key]
+        open_fds, _, frame_buffers, _ = self.buffer_dict.pop(buffer_key)
+        # Buffers that requests are still using are unmapped once they have been released.
+        self._orphan([buffer for buffers in frame_buffers.values() for buffer in buffers])
+        for fd in open_fds:
+            os.close(fd)
+        if buffer_key == self.buffer_key:
+            self.open_fds = []
+            self.libcamera_fds = set()
+            self.frame_buffers = {}
 
     def close(self):
         for k in list(self.buffer_dict.keys()):
             self.deallocate(k)
         assert self.buffer_dict == {}
+        if self.dmaHeap is not None:
+            self.dmaHeap.close()
+            self.dmaHeap = None
@@ -0,0 +1,87 @@
+import logging
+import mmap
+import os
+
+from picamera2.allocators.allocator import Allocator, Sync
+
+_log = logging.getLogger("picamera2")
+
+
+class VirtualPlane:
+    def __init__(self, fd, length):
+        self.fd = fd
+        self.offset = 0
+        self.length = length
+
+
+class VirtualFrameMetadata:
+    class Plane:
+        def __init__(self, bytes_used):
+            self.bytes_used = bytes_used
+
+    def __init__(self, length):
+        self.status = None
+        self.sequence = 0
+        self.timestamp = 0
+        self.planes = [self.Plane(length)]
+
+
+class VirtualFrameBuffer:
+    """A frame buffer in anonymous shared memory, looking enough like a libcamera.FrameBuffer."""
+
+    def __init__(self, fd, length):
+        self.planes = [VirtualPlane(fd, length)]
+        self.metadata = VirtualFrameMetadata(length)
+
+
+class VirtualAllocator(Allocator):
+    """Allocates memfd buffers for the virtual camera
+
+    Memfds are mapped just once, and need no DMA syncs, so they behave like dmabufs
+    without needing a dma heap (or a Raspberry Pi).
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.mapped_buffers = {}
+        self.frame_buffers = {}
+        self.open_fds = []
+        self.sync = self.VirtualSync
+
+    def allocate(self, libcamera_config, _):
+        # Requests still holding old buffers keep their mappings alive until they're done with.
+        self.close()
+        for c, stream_config in enumerate(libcamera_config):
+            fb = []
+            for i in range(stream_config.buffer_count):
+                fd = os.memfd_create(f"picamera2-virtual-{c}-{i}")
+                self.open_fds.append(fd)
+                os.ftruncate(fd, stream_config.frame_size)
+                fb.append(VirtualFrameBuffer(fd, stream_config.frame_size))
+                self.mapped_buffers[fb[-1]] = mmap.mmap(fd, stream_config.frame_size, mmap.MAP_SHARED)
+            self.frame_buffers[stream_config.stream] = fb
+            _log.debug(f"Allocated {len(fb)} virtual buffers for stream {c}")
+
+    def buffers(self, stream):
+        return self.frame_buffers[stream]
+
+    def close(self):
+        for fd in self.open_fds:
+            os.close(fd)
+        self.open_fds = []
+        self.frame_buffers = {}
+        self.mapped_buffers = {}
+
+    class VirtualSync(Sync):
+        """No syncing is needed, just return the buffer's mapping"""
+
+        def __init__(self, allocator, fb, write):
+            self.__mm = allocator.mapped_buffers.get(fb, None)
+
+        def __enter__(self):
+            if self.__mm is None:
+                raise RuntimeError("failed to find buffer in VirtualSync")
+            return self.__mm
+
+        def __exit__(self, exc_type=None, exc_value=None, exc_traceback=None):
+            pass
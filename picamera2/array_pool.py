@@ -0,0 +1,91 @@
+"""Pool of reusable output arrays for captures."""
+
+import threading
+import weakref
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+class ArrayPool:
+    """Recycle the arrays that capture_array and friends copy camera images into.
+
+    Copying a large image into a freshly allocated array every frame puts a lot of strain
+    on the memory allocator. When the pool is enabled, arrays are instead taken from a
+    set of free arrays kept for each stream configuration (format, size and stride), and
+    applications hand them back with release() once they're finished with them.
+
+    Arrays that are never released are simply garbage collected as normal. Configuring
+    the camera invalidates the pool, so arrays from a previous configuration are never
+    handed out again.
+
+    The hits and misses counters report how often a free array was available, which
+    helps when choosing the pool size.
+    """
+
+    def __init__(self, size=4, enabled=False):
+        """Create a pool keeping up to size free arrays for each stream configuration."""
+        self.size = size
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._free = defaultdict(list)
+        self._issued: Dict[int, Any] = {}
+
+    @staticmethod
+    def _key(config):
+        return (config["format"], tuple(config["size"]), config["stride"])
+
+    def get(self, config, shape, dtype) -> Optional[np.ndarray]:
+        """Return an array for a copy of an image from the given stream configuration.
+
+        Returns None if the pool is not enabled.
+        """
+        if not self.enabled:
+            return None
+        key = self._key(config)
+        dtype = np.dtype(dtype)
+        with self._lock:
+            free = self._free[key]
+            while free:
+                array = free.pop()
+                if array.shape == shape and array.dtype == dtype:
+                    self.hits += 1
+                    break
+            else:
+                array = None
+                self.misses += 1
+            generation = self._generation
+        if array is None:
+            array = np.empty(shape, dtype=dtype)
+            weakref.finalize(array, self._issued.pop, id(array), None)
+        self._issued[id(array)] = (key, generation)
+        return array
+
+    def release(self, array) -> None:
+        """Give an array obtained from the pool back, so that it can be used again.
+
+        Arrays that didn't come from the pool, or that belong to an earlier camera
+        configuration, are ignored.
+        """
+        with self._lock:
+            issued = self._issued.get(id(array))
+            if issued is None:
+                return
+            key, generation = issued
+            free = self._free[key]
+            if generation == self._generation and len(free) < self.size and all(a is not array for a in free):
+                free.append(array)
+
+    def invalidate(self) -> None:
+        """Forget all the free arrays, and ignore any that are released later."""
+        with self._lock:
+            self._generation += 1
+            self._free.clear()
+
+    def reset_counters(self) -> None:
+        self.hits = 0
+        self.misses = 0
@@ -0,0 +1,125 @@
+"""An asyncio interface to Picamera2."""
+
+import asyncio
+import contextlib
+from typing import Any, AsyncIterator
+
+from .job import Job
+from .request import CompletedRequest
+
+
+def _release_result(future) -> None:
+    # A request nobody is waiting for any more must go back to the camera.
+    if not future.cancelled() and future.exception() is None:
+        future.result().release()
+
+
+class AsyncPicamera2:
+    """Drive a Picamera2 object from asyncio code.
+
+    Each method starts the same operation as the Picamera2 method of the same name, but
+    returns an awaitable rather than blocking. Results are handed back to the asyncio event
+    loop by the camera's own event loop as soon as they are ready, so no threads are tied up
+    waiting for them, and a single asyncio loop can look after several cameras.
+
+    The camera must still be configured and started through the Picamera2 object.
+
+    Example::
+
+        camera = AsyncPicamera2(picam2)
+        array = await camera.capture_array("main")
+        async for request in camera:
+            process(request)  # the request is released when the loop moves on
+    """
+
+    def __init__(self, picam2) -> None:
+        self.picam2 = picam2
+
+    @staticmethod
+    async def _wait(job: Job, release=False):
+        try:
+            return await job
+        except asyncio.CancelledError:
+            # The job itself can't be cancelled, so a request it returns must be released once it arrives.
+            if release:
+                job._future.add_done_callback(_release_result)
+            raise
+
+    async def capture_request(self, flush=None) -> CompletedRequest:
+        """Fetch the next completed request, which the caller must release."""
+        return await self._wait(self.picam2.capture_request(wait=False, flush=flush), release=True)
+
+    @contextlib.asynccontextmanager
+    async def captured_request(self, flush=None) -> AsyncIterator[CompletedRequest]:
+        """Fetch the next completed request, releasing it when the context exits."""
+        request = await self.capture_request(flush=flush)
+        try:
+            yield request
+        finally:
+            request.release()
+
+    async def capture_metadata(self) -> dict[str, Any]:
+        return await self._wait(self.picam2.capture_metadata(wait=False))
+
+    async def capture_array(self, name="main", out=None):
+        return await self._wait(self.picam2.capture_array(name, wait=False, out=out))
+
+    async def capture_arrays(self, names=("main",), out=None):
+        return await self._wait(self.picam2.capture_arrays(names, wait=False, out=out))
+
+    async def capture_buffer(self, name="main"):
+        return await self._wait(self.picam2.capture_buffer(name, wait=False))
+
+    async def capture_buffers(self, names=("main",)):
+        return await self._wait(self.picam2.capture_buffers(names, wait=False))
+
+    async def capture_image(self, name="main"):
+        return await self._wait(self.picam2.capture_image(name, wait=False))
+
+    async def capture_file(self, file_output, name="main", format=None, exif_data=None):
+        return await self._wait(self.picam2.capture_file(file_output, name, format, wait=False, exif_data=exif_data))
+
+    async def switch_mode_and_capture_request(self, camera_config, delay=0) -> CompletedRequest:
+        return await self._wait(
+            self.picam2.switch_mode_and_capture_request(camera_config, wait=False, delay=delay), release=True
+        )
+
+    async def switch_mode_and_capture_array(self, camera_config, name="main", delay=0):
+        return await self._wait(self.picam2.switch_mode_and_capture_array(camera_config, name, wait=False, delay=delay))
+
+    async def switch_mode_and_capture_arrays(self, camera_config, names=("main",), delay=0):
+        return await self._wait(self.picam2.switch_mode_and_capture_arrays(camera_config, names, wait=False, delay=delay))
+
+    async def switch_mode_and_capture_buffer(self, camera_config, name="main", delay=0):
+        return await self._wait(self.picam2.switch_mode_and_capture_buffer(camera_config, name, wait=False, delay=delay))
+
+    async def switch_mode_and_capture_buffers(self, camera_config, names=("main",), delay=0):
+        return await self._wait(self.picam2.switch_mode_and_capture_buffers(camera_config, names, wait=False, delay=delay))
+
+    async def switch_mode_and_capture_image(self, camera_config, name="main", delay=0):
+        return await self._wait(self.picam2.switch_mode_and_capture_image(camera_config, name, wait=False, delay=delay))
+
+    async def switch_mode_and_capture_file(
+        self, camera_config, file_output, name="main", format=None, exif_data=None, delay=0
+    ):
+        return await self._wait(
+            self.picam2.switch_mode_and_capture_file(
+                camera_config, file_output, name, format, wait=False, exif_data=exif_data, delay=delay
+            )
+        )
+
+    async def autofocus_cycle(self) -> bool:
+        """Run an autofocus cycle, returning whether it succeeded."""
+        return await self._wait(self.picam2.autofocus_cycle(wait=False))
+
+    async def requests(self) -> AsyncIterator[CompletedRequest]:
+        """Yield each completed request in turn, releasing it when the next one is wanted."""
+        while True:
+            request = await self.capture_request()
+            try:
+                yield request
+            finally:
+                request.release()
+
+    def __aiter__(self) -> AsyncIterator[CompletedRequest]:
+        return self.requests()
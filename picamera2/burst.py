@@ -0,0 +1,158 @@
+"""Capturing bursts of consecutive frames straight to disk."""
+
+import io
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Optional
+
+from .request import MappedArray
+
+FORMATS = ("jpg", "jpeg", "png", "dng")
+
+
+class Burst:
+    """Capture a burst of consecutive frames, encoding and saving them on worker threads.
+
+    The burst takes the next n requests directly from the camera event loop (without going
+    through a Job for each one), and each request is handed back to the camera as soon as
+    its image has been encoded. So the encoders, and the number of camera buffers, are the
+    only limits on how fast the burst can go. JPEGs are encoded with simplejpeg where
+    possible, and for DNG files the raw buffer is copied out and the request released
+    straight away, before the DNG is made.
+
+    The sink is either a filename pattern, such as "burst{:03d}.jpg", which is formatted
+    with the frame index, or a function called as sink(index, data, metadata), where data
+    is the encoded file as bytes. Called functions run on the worker threads, so frames may
+    not arrive in order.
+
+    Any frames the camera dropped during the burst are detected from gaps in the
+    SensorTimestamps, and reported in the result.
+
+    Bursts are normally created by Picamera2.capture_burst.
+    """
+
+    def __init__(self, picam2, n, name="main", sink="burst{:03d}.jpg", format=None, num_workers=None, signal_function=None):
+        if n < 1:
+            raise RuntimeError("Burst must have at least one frame")
+        if callable(sink):
+            format = format or "jpg"
+        elif not isinstance(sink, str):
+            raise RuntimeError("Burst sink must be a filename pattern or a function")
+        format = picam2.helpers._get_format_str(sink, format)
+        if format not in FORMATS:
+            raise RuntimeError(f"Cannot save a burst in format {format!r}")
+        self.n = n
+        self.name = name
+        self.format = format
+        self._picam2 = picam2
+        self._sink = sink
+        self._signal_function = signal_function
+        self._executor = ThreadPoolExecutor(max_workers=num_workers or 4, thread_name_prefix="picamera2-burst")
+        self._future = Future()
+        self._future.set_running_or_notify_cancel()
+        self._lock = threading.Lock()
+        self._last_timestamp = None
+        self._start_time = None
+        self.received = 0
+        self.encoded = 0
+        self.dropped = 0
+        self.metadata: list[Optional[dict[str, Any]]] = [None] * n
+
+    def start(self) -> None:
+        """Start collecting frames from the camera."""
+        self._picam2.add_request_consumer(self._consume)
+
+    def _consume(self, request) -> None:
+        # Runs in the camera event loop, so the encoding must happen elsewhere.
+        if self.received >= self.n or self._future.done() or request.stream_map.get(self.name) is None:
+            return
+        metadata = request.get_metadata()
+        timestamp = metadata.get("SensorTimestamp")
+        frame_duration = metadata.get("FrameDuration")
+        if self._last_timestamp is not None and timestamp is not None and frame_duration:
+            # Timestamps are in ns, frame durations in us.
+            missing = round((timestamp - self._last_timestamp) / (frame_duration * 1000)) - 1
+            self.dropped += max(0, missing)
+        self._last_timestamp = timestamp
+        if self._start_time is None:
+            self._start_time = time.monotonic()
+        index = self.received
+        self.received += 1
+        request.acquire()
+        try:
+            self._executor.submit(self._encode, index, request, metadata)
+        except RuntimeError:
+            # The burst has been cancelled.
+            request.release()
+
+    def _encode(self, index, request, metadata) -> None:
+        helpers = self._picam2.helpers
+        target = io.BytesIO() if callable(self._sink) else self._sink.format(index)
+        try:
+            config = request.config[self.name]
+            if self.format == "dng":
+                # Copy the raw pixels out untouched, so the buffer can go straight back.
+                buffer = request.make_buffer(self.name)
+                request.release()
+                request = None
+                helpers.save_dng(buffer, metadata, config, target)
+            elif helpers._use_fast_jpeg(config, target, self.format, request.FASTER_JPEG):
+                with MappedArray(request, self.name, write=False) as m:
+                    output_bytes = helpers._encode_jpeg(m.array, config)
+                request.release()
+                request = None
+                helpers._write_jpeg(output_bytes, helpers._prepare_exif(metadata, None), target)
+            else:
+                image = request.make_image(self.name)
+                helpers.save(image, metadata, target, self.format)
+            if callable(self._sink):
+                self._sink(index, target.getvalue(), metadata)
+        except Exception as e:
+            self._finish(e)
+        finally:
+            if request is not None:
+                request.release()
+        self.metadata[index] = metadata
+        with self._lock:
+            self.encoded += 1
+            finished = self.encoded == self.n
+        if finished:
+            self._finish()
+
+    def _finish(self, exception=None) -> None:
+        # This never runs in the camera event loop, so it's safe to remove the consumer.
+        with self._lock:
+            if self._future.done():
+                return
+            if exception is not None:
+                self._future.set_exception(exception)
+            else:
+                result = {"metadata": self.metadata, "dropped": self.dropped, "elapsed": time.monotonic() - self._start_time}
+                self._future.set_result(result)
+        self._picam2.remove_request_consumer(self._consume)
+        self._executor.shutdown(wait=False)
+        if self._signal_function:
+            self._signal_function(self)
+
+    def cancel(self) -> None:
+        """Stop the burst early. Frames already received are still saved."""
+        self._picam2.remove_request_consumer(self._consume)
+        with self._lock:
+            if not self._future.done():
+                self._future.set_exception(RuntimeError(f"Burst cancelled after {self.received} frames"))
+        self._executor.shutdown(wait=False)
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def get_result(self, timeout: Optional[float] = None) -> dict[str, Any]:
+        """Wait for the burst to finish and return its result.
+
+        The result is a dictionary holding the list of each frame's "metadata", the
+        number of frames "dropped" by the camera during the burst, and the "elapsed"
+        time in seconds from the first frame arriving to the last being saved.
+
+        :raises TimeoutError: The burst did not finish within the timeout
+        """
+        return self._future.result(timeout=timeout)
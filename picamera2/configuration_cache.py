@@ -0,0 +1,212 @@
+"""Cache of validated camera configurations, to make switching between them quick."""
+
+import itertools
+import threading
+from collections import deque
+
+from .allocators import DmaAllocator, PersistentAllocator
+from .configuration import CameraConfiguration
+
+
+def _fingerprint(value):
+    """Return a hashable value that is equal for equal configurations."""
+    if isinstance(value, CameraConfiguration):
+        value = value.make_dict()
+    if isinstance(value, dict):
+        return tuple(sorted((key, _fingerprint(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_fingerprint(item) for item in value)
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    # Transforms and colour spaces describe themselves fully as strings.
+    return (type(value).__name__, str(value))
+
+
+def _copy_config(camera_config):
+    """Copy a camera configuration, and the dictionaries in it, so that it can be changed safely."""
+    return {key: value.copy() if isinstance(value, dict) else value for key, value in camera_config.items()}
+
+
+class CachedConfiguration:
+    """Everything configure() works out for one configuration, apart from what libcamera must redo."""
+
+    __slots__ = (
+        "name",
+        "camera_config",
+        "libcamera_config",
+        "lores_index",
+        "raw_index",
+        "camera_ctrl_info",
+        "camera_properties",
+        "use_case",
+    )
+
+    def __init__(
+        self, name, camera_config, libcamera_config, lores_index, raw_index, camera_ctrl_info, camera_properties, use_case
+    ):
+        self.name = name
+        self.camera_config = _copy_config(camera_config)
+        self.libcamera_config = libcamera_config
+        self.lores_index = lores_index
+        self.raw_index = raw_index
+        self.camera_ctrl_info = dict(camera_ctrl_info)
+        self.camera_properties = dict(camera_properties)
+        self.use_case = use_case
+
+    def make_camera_config(self):
+        """Return a new copy of the final camera configuration."""
+        return _copy_config(self.camera_config)
+
+
+class ConfigurationCache:
+    """Keep validated configurations, so that switching between them skips most of configure().
+
+    Configuring the camera normally means checking the configuration, asking libcamera to
+    generate and validate a configuration from it, reading back the controls and properties,
+    and allocating new buffers. Once a configuration has been "warmed", all of that is kept,
+    and configuring it again only has to call libcamera's configure, so switch_mode and the
+    switch_mode_and_capture functions become much quicker. On a Raspberry Pi the camera's
+    DmaAllocator is replaced by a PersistentAllocator, so the buffers are kept too, at the cost
+    of holding on to memory for every warmed configuration.
+
+    A configuration is recognised by name (the names given to warm, which may not be the
+    built-in "preview", "still" or "video"), or by having exactly the same contents as the
+    configuration it was warmed with, or as the configuration that was finally applied, so
+    switch_mode_and_capture_file switching back to the current configuration also finds it.
+
+    Configurations that were not warmed, and have no use case of their own, keep their buffers
+    under UNCACHED_USE_CASE in the cache's PersistentAllocator.
+
+    Example::
+
+        picam2.configuration_cache.warm({"viewfinder": preview_config, "capture": still_config})
+        picam2.start()
+        picam2.switch_mode_and_capture_file("capture", "image.jpg")
+    """
+
+    RESERVED_NAMES = ("preview", "still", "video")
+    UNCACHED_USE_CASE = "configuration-cache-uncached"
+
+    def __init__(self, picam2):
+        self._picam2 = picam2
+        self._lock = threading.Lock()
+        self._names = {}
+        self._fingerprints = {}
+        self._use_cases = itertools.count()
+        self.allocator = None  # the PersistentAllocator that warm installed, if it did
+        self.hits = 0
+        self.misses = 0
+        self.switch_times = deque(maxlen=100)  # seconds taken by each recent switch_mode
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
+
+    def warm(self, configs):
+        """Configure each of the given configurations once, keeping the results.
+
+        :param configs: Dictionary of configurations (dicts or CameraConfigurations), keyed by name.
+            Configurations already warmed under the same name are replaced. The names may not be
+            any of RESERVED_NAMES, which always mean the camera's own configurations.
+
+        The camera must be stopped, and is left configured as it was before (if it was).
+        """
+        picam2 = self._picam2
+        if picam2.started:
+            raise RuntimeError("Camera must be stopped to warm configurations")
+        reserved = [name for name in configs if name in self.RESERVED_NAMES]
+        if reserved:
+            raise RuntimeError(f"Cannot warm configurations with the reserved names {reserved}")
+        previous = picam2.camera_config or None
+        if type(picam2.allocator) is DmaAllocator:
+            picam2.allocator = self.allocator = PersistentAllocator()
+        for name, config in configs.items():
+            self.remove(name)
+            picam2._configure(config, cache_name=name)
+        if previous is not None:
+            picam2.configure_(previous)
+
+    def lookup(self, camera_config):
+        """Return the CachedConfiguration for a name or configuration, or None."""
+        if not self._names:
+            return None
+        with self._lock:
+            if isinstance(camera_config, str):
+                cached = self._names.get(camera_config)
+            else:
+                cached = self._fingerprints.get(_fingerprint(camera_config))
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return cached
+
+    @staticmethod
+    def fingerprint(camera_config):
+        """Return a hashable value that is the same for configurations with the same contents."""
+        return _fingerprint(camera_config)
+
+    def add(self, name, requested, camera_config, initial_config=None, **kwargs):
+        """Record a configuration that has just been applied.
+
+        requested is the fingerprint of the configuration as it was asked for, taken before
+        configuring (which fills in parts of it), and camera_config is the final configuration.
+        initial_config is the configuration the application passed in. Configuring writes into
+        its stream dictionaries, so it is also recognised as it is afterwards.
+        """
+        cached = CachedConfiguration(name, camera_config, **kwargs)
+        with self._lock:
+            self._names[name] = cached
+            self._fingerprints[requested] = cached
+            self._fingerprints[_fingerprint(camera_config)] = cached
+            if initial_config is not None and not isinstance(initial_config, str):
+                self._fingerprints[_fingerprint(initial_config)] = cached
+        return cached
+
+    def use_case(self):
+        """Return a use case that no other configuration's buffers are kept under."""
+        return f"configuration-cache-{next(self._use_cases)}"
+
+    def uncached_use_case(self, camera_config):
+        """Return the use case to allocate a configuration that was not warmed under."""
+        use_case = camera_config.get("use_case")
+        if use_case is None and self.allocator is not None and self._picam2.allocator is self.allocator:
+            # This allocator was put in by warm, so the application never had to set a use case.
+            use_case = self.UNCACHED_USE_CASE
+        return use_case
+
+    def remove(self, name):
+        """Forget a warmed configuration, releasing its buffers unless the camera is using them."""
+        with self._lock:
+            cached = self._names.pop(name, None)
+            if cached is None:
+                return
+            for fingerprint in [key for key, value in self._fingerprints.items() if value is cached]:
+                del self._fingerprints[fingerprint]
+        allocator = self._picam2.allocator
+        if isinstance(allocator, PersistentAllocator) and cached.use_case != allocator.buffer_key:
+            if cached.use_case in allocator.buffer_dict:
+                allocator.deallocate(cached.use_case)
+
+    def clear(self):
+        """Forget all the warmed configurations."""
+        for name in list(self._names):
+            self.remove(name)
+
+    def record_switch(self, seconds):
+        self.switch_times.append(seconds)
+
+    def stats(self):
+        """Return the hit and miss counts, and switch_mode times in ms, as a dictionary."""
+        times = sorted(self.switch_times)
+        return {
+            "configurations": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "switches": len(times),
+            "last_switch_ms": self.switch_times[-1] * 1000 if times else None,
+            "median_switch_ms": times[len(times) // 2] * 1000 if times else None,
+            "max_switch_ms": times[-1] * 1000 if times else None,
+        }
@@ -41,6 +41,11 @@ class Controls:
             return real_field[2](real_value)
         return super().__getattribute__(name)
 
+    @property
+    def dirty(self):
+        """Whether any controls have been set, and so need to be sent to the camera."""
+        return bool(self._controls)
+
     def __repr__(self):
         return f"<Controls: {self.make_dict()}>"
 
@@ -1,3 +1,6 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
 # fmt: off
@@ -6,6 +9,185 @@ YUV2RGB_SMPTE170M = np.array([[1.164, 1.164, 1.164], [0.0, -0.392, 2.017], [1.59
 YUV2RGB_REC709    = np.array([[1.164, 1.164, 1.164], [0.0, -0.213, 2.112], [1.793, -0.533, 0.0]])  # noqa: E501
 # fmt: on
 
+# Planar and semi-planar formats, with chroma subsampled in both directions.
+_PLANAR_FORMATS = {"YUV420": False, "YVU420": True}
+_SEMI_PLANAR_FORMATS = {"NV12": False, "NV21": True}
+# Packed 4:2:2 formats, giving the byte offsets of Y0, U and V within each group of 4 bytes.
+_PACKED_FORMATS = {"YUYV": (0, 1, 3), "YVYU": (0, 3, 1), "UYVY": (1, 0, 2), "VYUY": (1, 2, 0)}
+
+# Fixed point precision of the lookup tables.
+_SHIFT = 16
+
+
+class YUVToRGBConverter:
+    """Convert YUV images to interleaved 3-channel RGB images.
+
+    The converter is created once for a given format, size and stride, and then its
+    convert method can be called on every frame. The input may be a 1d buffer or the
+    array from a MappedArray (or capture_array) for the stream, including any padding.
+
+    Arithmetic is done in fixed point using lookup tables built from the colour matrix,
+    so there is no floating point and no large intermediate array. The output can be
+    full resolution (chroma is replicated) or half resolution, and the work can be
+    split into bands of rows and spread across a pool of threads.
+
+    Like YUV420_to_RGB, by default the R and B channels are swapped, so that the result
+    has the same channel order as an "RGB888" camera image (that is, BGR order).
+    """
+
+    def __init__(
+        self, format, size, stride=None, matrix=YUV2RGB_JPEG, full_resolution=True, rb_swap=True, num_threads=1, chunk_rows=64
+    ):
+        if format not in _PLANAR_FORMATS and format not in _SEMI_PLANAR_FORMATS and format not in _PACKED_FORMATS:
+            raise RuntimeError(f"Format {format} not supported for YUV to RGB conversion")
+        w, h = size
+        if w % 2 or h % 2:
+            raise RuntimeError("Image width and height must be even")
+        self.format = format
+        self.size = (w, h)
+        if stride is None:
+            stride = w * 2 if format in _PACKED_FORMATS else w
+        self.stride = stride
+        self.full_resolution = full_resolution
+        # Packed formats have full vertical chroma resolution.
+        self._vsub = 1 if format in _PACKED_FORMATS else 2
+        self.shape = (h, w, 3) if full_resolution else (h // 2, w // 2, 3)
+
+        if rb_swap:
+            matrix = matrix[:, [2, 1, 0]]
+        values = np.arange(256)
+        self._lut_y = [np.round(matrix[0, c] * values * (1 << _SHIFT)).astype(np.int32) for c in range(3)]
+        # The Y terms are usually the same for all the channels, so only need looking up once.
+        self._same_y = bool(np.all(matrix[0] == matrix[0, 0]))
+        self._lut_u = [
+            np.round(matrix[1, c] * (values - 128) * (1 << _SHIFT)).astype(np.int32) if matrix[1, c] else None
+            for c in range(3)
+        ]
+        self._lut_v = [
+            np.round(matrix[2, c] * (values - 128) * (1 << _SHIFT)).astype(np.int32) if matrix[2, c] else None
+            for c in range(3)
+        ]
+
+        # Bands of output rows, which must cover whole rows of chroma.
+        chunk_rows = max(self._vsub, chunk_rows - chunk_rows % self._vsub)
+        self._chunks = [(r, min(r + chunk_rows, self.shape[0])) for r in range(0, self.shape[0], chunk_rows)]
+        self.num_threads = num_threads
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """Make a converter for the given stream configuration, such as picam2.camera_config["lores"]."""
+        return cls(config["format"], config["size"], config["stride"], **kwargs)
+
+    def _planes(self, array):
+        """Return views of the Y, U and V planes (without padding) of the input image."""
+        w, h = self.size
+        stride = self.stride
+        flat = array.reshape(-1)
+        if flat.dtype != np.uint8:
+            raise RuntimeError("YUV image must be an array of bytes")
+        if self.format in _PACKED_FORMATS:
+            y_off, u_off, v_off = _PACKED_FORMATS[self.format]
+            groups = flat[: h * stride].reshape(h, stride // 4, 4)[:, : w // 2]
+            pairs = flat[: h * stride].reshape(h, stride // 2, 2)[:, :w]
+            return pairs[..., y_off], groups[..., u_off], groups[..., v_off]
+        y = flat[: h * stride].reshape(h, stride)[:, :w]
+        if self.format in _PLANAR_FORMATS:
+            n4 = (stride // 2) * (h // 2)
+            u = flat[h * stride : h * stride + n4].reshape(h // 2, stride // 2)[:, : w // 2]
+            v = flat[h * stride + n4 : h * stride + 2 * n4].reshape(h // 2, stride // 2)[:, : w // 2]
+            swap = _PLANAR_FORMATS[self.format]
+        else:
+            uv = flat[h * stride : h * stride + (h // 2) * stride].reshape(h // 2, stride // 2, 2)[:, : w // 2]
+            u, v = uv[..., 0], uv[..., 1]
+            swap = _SEMI_PLANAR_FORMATS[self.format]
+        return (y, v, u) if swap else (y, u, v)
+
+    def _chroma(self, u, v):
+        """Look up the chroma contribution to each output channel, at chroma resolution."""
+        terms = []
+        for lut_u, lut_v in zip(self._lut_u, self._lut_v):
+            if lut_u is None and lut_v is None:
+                terms.append(None)
+            elif lut_v is None:
+                terms.append(lut_u.take(u))
+            elif lut_u is None:
+                terms.append(lut_v.take(v))
+            else:
+                term = lut_u.take(u)
+                term += lut_v.take(v)
+                terms.append(term)
+        return terms
+
+    def _combine(self, y, chroma, out):
+        """Add luma (full size) and chroma terms together, writing the clipped result into out."""
+        yv = self._lut_y[0].take(y) if self._same_y else None
+        acc = np.empty(y.shape, dtype=np.int32)
+        for c in range(3):
+            luma = yv if self._same_y else self._lut_y[c].take(y)
+            if chroma[c] is None:
+                acc[...] = luma
+            else:
+                np.add(luma, chroma[c], out=acc)
+            acc >>= _SHIFT
+            np.clip(acc, 0, 255, out=acc)
+            out[..., c] = acc
+
+    def _convert_rows(self, y, u, v, out, r0, r1):
+        vsub = self._vsub
+        if self.full_resolution:
+            chroma = self._chroma(u[r0 // vsub : r1 // vsub], v[r0 // vsub : r1 // vsub])
+            for dy in range(vsub):
+                for dx in range(2):
+                    self._combine(y[r0 + dy : r1 : vsub, dx::2], chroma, out[r0 + dy : r1 : vsub, dx::2])
+        else:
+            step = 2 // vsub
+            rows = slice(2 * r0 // vsub, 2 * r1 // vsub, step)
+            self._combine(y[2 * r0 : 2 * r1 : 2, 0::2], self._chroma(u[rows], v[rows]), out[r0:r1])
+
+    def convert(self, array, out=None):
+        """Convert a YUV image, returning the RGB result.
+
+        :param array: The YUV image, either a 1d buffer or a 2d array of the stream's image
+        :param out: Optional uint8 array of shape self.shape to write the result into
+        :return: The RGB image
+        """
+        if out is None:
+            out = np.empty(self.shape, dtype=np.uint8)
+        elif out.shape != self.shape or out.dtype != np.uint8:
+            raise RuntimeError(f"Output array must have shape {self.shape} and dtype uint8")
+        y, u, v = self._planes(array)
+        if self.num_threads > 1 and len(self._chunks) > 1:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.num_threads)
+            futures = [self._executor.submit(self._convert_rows, y, u, v, out, r0, r1) for r0, r1 in self._chunks]
+            for future in futures:
+                future.result()
+        else:
+            for r0, r1 in self._chunks:
+                self._convert_rows(y, u, v, out, r0, r1)
+        return out
+
+    def close(self):
+        """Shut down any worker threads."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+
+def YUV_to_RGB(array, format, size, stride=None, matrix=YUV2RGB_JPEG, full_resolution=True, rb_swap=True, out=None):
+    """Convert a single YUV image to interleaved RGB. Use a YUVToRGBConverter when converting every frame."""
+    return YUVToRGBConverter(format, size, stride, matrix, full_resolution, rb_swap).convert(array, out=out)
+
 
 def YUV420_to_RGB(YUV_in, size, matrix=YUV2RGB_JPEG, rb_swap=True, final_width=0):
     """Convert a YUV420 image to an interleaved RGB image of half resolution.
@@ -14,22 +196,10 @@ def YUV420_to_RGB(YUV_in, size, matrix=YUV2RGB_JPEG, rb_swap=True, final_width=0
     at the end with the final_width parameter.
     """
     w, h = size
-    w2 = w // 2
-    h2 = h // 2
-    n = w * h
-    n2 = n // 2
-    n4 = n // 4
-
-    YUV = np.empty((h2, w2, 3), dtype=int)
-    YUV[:, :, 0] = YUV_in[:n].reshape(h, w)[0::2, 0::2]
-    YUV[:, :, 1] = YUV_in[n : n + n4].reshape(h2, w2) - 128.0
-    YUV[:, :, 2] = YUV_in[n + n4 : n + n2].reshape(h2, w2) - 128.0
-
-    if rb_swap:
-        matrix = matrix[:, [2, 1, 0]]
-    RGB = np.dot(YUV, matrix).clip(0, 255).astype(np.uint8)
-
-    if final_width and final_width != w2:
+    converter = YUVToRGBConverter("YUV420", size, w, matrix, full_resolution=False, rb_swap=rb_swap)
+    RGB = converter.convert(YUV_in)
+
+    if final_width and final_width != w // 2:
         RGB = RGB[:, :final_width, :]
 
     return RGB
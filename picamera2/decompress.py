@@ -0,0 +1,165 @@
+"""Decompression of raw images in the PiSP_COMP1 compressed format."""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import numpy as np
+
+# This is the standard configuration used in the drivers.
+OFFSET = 2048
+
+
+class PispDecompressor:
+    """Decompress PiSP_COMP1 raw images into 16-bit pixels.
+
+    The image is processed in bands of rows, which can be spread across a pool of worker
+    threads. Each thread keeps its scratch buffers between calls, so decompressing one
+    frame after another does not keep allocating memory. The result can be written into
+    a caller-supplied uint16 array.
+
+    A decompressor can be used by itself, for example to decompress raw frames that were
+    saved earlier, as well as by Helpers.decompress when saving DNG files.
+    """
+
+    def __init__(self, num_threads: Optional[int] = None, tile_rows: int = 16):
+        self.num_threads = num_threads if num_threads is not None else min(4, os.cpu_count() or 1)
+        self.tile_rows = tile_rows
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _scratch(self, shape):
+        # Per-thread scratch buffers, kept as long as the tile shape doesn't change.
+        scratch = getattr(self._local, "scratch", None)
+        if scratch is None or scratch["shape"] != shape:
+            scratch = {"shape": shape, "cond": np.empty(shape, dtype=bool)}
+            for name in ("qmode", "limit", "tmp", "pix0", "pix1", "pix2", "pix3", "q0", "q1", "q2", "q3"):
+                scratch[name] = np.empty(shape, dtype=np.int32)
+            self._local.scratch = scratch
+        return scratch
+
+    def _decompress_tile(self, words, out):
+        # words is an int32 array of shape (rows, n, 2), holding pairs of words from the two
+        # interleaved colour components. Each word holds 4 pixels, and out has shape (rows, n, 4, 2).
+        # Note that signed arithmetic is used throughout.
+        s = self._scratch(words.shape)
+        tmp, cond = s["tmp"], s["cond"]
+        qmode = np.bitwise_and(words, 3, out=s["qmode"])
+        pix0 = np.right_shift(words, 2, out=s["pix0"])
+        pix0 &= 511
+        pix1 = np.right_shift(words, 11, out=s["pix1"])
+        pix1 &= 127
+        pix1 -= 64
+        pix2 = np.right_shift(words, 18, out=s["pix2"])
+        pix2 &= 127
+        pix3 = np.right_shift(words, 25, out=s["pix3"])
+        pix3 &= 127
+
+        np.multiply(qmode, pix0, out=tmp)
+        np.less(tmp, 768, out=cond)
+        q1 = s["q1"]
+        q1[...] = pix0
+        np.subtract(pix0, pix1, out=tmp)
+        np.maximum(pix0, tmp, where=cond, out=q1)
+        q2 = np.add(pix1, 448, out=s["q2"])
+        np.add(pix0, pix1, out=tmp)
+        np.maximum(pix0, tmp, where=cond, out=q2)
+
+        limit = np.right_shift(1536, qmode, out=s["limit"])
+        q0 = np.subtract(q1, 64, out=s["q0"])
+        np.maximum(q0, 0, out=q0)
+        np.minimum(q0, limit, out=q0)
+        q0 += pix2
+        q3 = np.subtract(q2, 64, out=s["q3"])
+        np.maximum(q3, 0, out=q3)
+        np.minimum(q3, limit, out=q3)
+        q3 += pix3
+
+        qmode64 = np.multiply(qmode, 64, out=limit)
+        for q, pix in ((q0, pix0), (q1, pix1), (q2, pix2), (q3, pix3)):
+            np.multiply(q, 16, out=pix)
+            np.subtract(q, 160, out=tmp)
+            tmp *= 32
+            np.maximum(pix, tmp, out=pix)
+            np.multiply(qmode64, q, out=tmp)
+            np.maximum(pix, tmp, out=pix)
+
+        # Quantisation mode 3 packs its pixels differently. It's only worth the effort if there are any.
+        np.equal(qmode, 3, out=cond)
+        if cond.any():
+            mode3 = words[cond]
+            a = (mode3 >> 2) & 32767
+            b = (mode3 >> 17) & 32767
+            quads = ((a & 15) + 16 * ((a >> 8) // 11), (a >> 4) % 176, (b & 15) + 16 * ((b >> 8) // 11), (b >> 4) % 176)
+            for q, pix in zip(quads, (pix0, pix1, pix2, pix3)):
+                pix[cond] = np.maximum(256 * q, 512 * (q - 47))
+
+        for i, pix in enumerate((pix0, pix1, pix2, pix3)):
+            pix += OFFSET
+            np.clip(pix, 0, 65535, out=pix)
+            out[:, :, i, :] = pix
+
+    def decompress(self, array: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Decompress a PiSP_COMP1 image.
+
+        :param array: The compressed image, a 2d uint8 array of shape (height, stride)
+        :param out: Optional uint16 array of the same shape to write the pixels into
+        :return: A uint16 array of shape (height, stride), one pixel for each compressed byte
+        """
+        if array.ndim != 2 or array.dtype != np.uint8 or array.shape[1] % 8:
+            raise RuntimeError("Compressed image must be a 2d uint8 array with a stride that is a multiple of 8")
+        if not array[0].data.c_contiguous:
+            array = np.ascontiguousarray(array)
+        if out is None:
+            out = np.empty(array.shape, dtype=np.uint16)
+        elif out.shape != array.shape or out.dtype != np.uint16:
+            raise RuntimeError(f"Output array must have shape {array.shape} and dtype uint16")
+
+        h, stride = array.shape
+        words = array.view(np.int32).reshape((h, stride // 8, 2))  # Assume all Pis are little-endian.
+        pixels = out.reshape((h, stride // 8, 4, 2))
+        tiles = [(r, min(r + self.tile_rows, h)) for r in range(0, h, self.tile_rows)]
+        if self.num_threads > 1 and len(tiles) > 1:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.num_threads)
+            futures = [self._executor.submit(self._decompress_tile, words[r0:r1], pixels[r0:r1]) for r0, r1 in tiles]
+            for future in futures:
+                future.result()
+        else:
+            for r0, r1 in tiles:
+                self._decompress_tile(words[r0:r1], pixels[r0:r1])
+        return out
+
+    def close(self) -> None:
+        """Shut down any worker threads."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+
+_decompressor = None
+_decompressor_lock = threading.Lock()
+
+
+def decompress(array: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Decompress a PiSP_COMP1 image using a shared PispDecompressor.
+
+    :param array: The compressed image, a 2d uint8 array of shape (height, stride)
+    :param out: Optional uint16 array of the same shape to write the pixels into
+    :return: A uint16 array of shape (height, stride)
+    """
+    global _decompressor
+    with _decompressor_lock:
+        if _decompressor is None:
+            _decompressor = PispDecompressor()
+    return _decompressor.decompress(array, out=out)
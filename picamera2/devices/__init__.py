@@ -1,6 +1,6 @@
 try:
     # Hailo requires hailo_platform package, which may not be installed on non-Hailo platforms.
-    from .hailo import Hailo, hailo_architecture
+    from .hailo import Hailo, HailoStream, Letterbox, hailo_architecture
 except ModuleNotFoundError:
     pass
 from .imx500 import IMX500
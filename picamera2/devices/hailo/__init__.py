@@ -1 +1,2 @@
 from .hailo import Hailo, hailo_architecture
+from .stream import HailoStream, Letterbox
@@ -1,4 +1,5 @@
 import subprocess
+import threading
 from concurrent.futures import Future
 from functools import partial
 
@@ -30,7 +31,7 @@ class Hailo:
     TARGET = None
     TARGET_REF_COUNT = 0
 
-    def __init__(self, hef_path, batch_size=None, output_type='FLOAT32'):
+    def __init__(self, hef_path, batch_size=None, output_type='FLOAT32', max_free_bindings=None):
         """
         Initialize the HailoAsyncInference class with the provided HEF model file path.
 
@@ -38,6 +39,7 @@ class Hailo:
             hef_path (str): Path to the HEF model file.
             batch_size (int): Batch size for inference.
             output_type (str): Format type of the output stream.
+            max_free_bindings (int): Most bindings to keep for reuse, defaults to four batches' worth.
         """
         params = VDevice.create_params()
         params.scheduling_algorithm = HailoSchedulingAlgorithm.ROUND_ROBIN
@@ -54,6 +56,11 @@ class Hailo:
         self._set_input_output(output_type)
         self.input_vstream_info, self.output_vstream_info = self._get_vstream_info()
         self.configured_infer_model = self.infer_model.configure()
+        # Creating bindings is expensive, so finished ones are kept and reused.
+        self._free_bindings = []
+        self._bindings_lock = threading.Lock()
+        self.max_free_bindings = max_free_bindings or 4 * (batch_size or 1)
+        self.bindings_created = 0
 
     def __enter__(self):
         """Used for allowing use with context manager."""
@@ -77,42 +84,6 @@ class Hailo:
             output.set_format_type(output_format_type)
         self.num_outputs = len(self.infer_model.outputs)
 
-    def callback(self, completion_info, bindings, future, last):
-        """
-        Callback function for handling inference results.
-
-        Args:
-            completion_info: Information about the completion of the inference task.
-            bindings: Bindings object containing input and output buffers.
-        """
-        if future._has_had_error:
-            # Don't really know if this can happen.
-            return
-        elif completion_info.exception:
-            future._has_had_error = True
-            future.set_exception(completion_info.exception)
-        else:
-            if self.num_outputs <= 1:
-                # Only one output. Return the output directly.
-                if self.batch_size is None:
-                    # No batching. Return this single output on its own.
-                    future._intermediate_result = bindings.output().get_buffer()
-                else:
-                    # Return a list containing an output for each item in the batch.
-                    future._intermediate_result.append(bindings.output().get_buffer())
-            else:
-                # Multiple outputs. Return a dictionary of outputs keyed on the layer name.
-                if self.batch_size is None:
-                    # No batching. Use a single output as the value for each key.
-                    for name in bindings._output_names:
-                        future._intermediate_result[name] = bindings.output(name).get_buffer()
-                else:
-                    # Each key contains a list of outputs, one per item in the batch.
-                    for name in bindings._output_names:
-                        future._intermediate_result[name].append(bindings.output(name).get_buffer())
-            if last:
-                future.set_result(future._intermediate_result)
-
     def _get_vstream_info(self):
         """
         Get information about input and output stream layers.
@@ -156,26 +127,79 @@ class Hailo:
         Returns:
             future: Future to wait on for the inference results.
         """
-        if self.batch_size is None:
-            input_data = np.expand_dims(input_data, axis=0)
-
+        frames = [input_data] if self.batch_size is None else list(input_data)
         future = Future()
-        future._has_had_error = False
-        if self.num_outputs <= 1:
-            future._intermediate_result = []
+        self._submit(frames, partial(self._finish, future), keep_outputs=True)
+        return future
+
+    def _finish(self, future, exception, outputs):
+        """Complete a run_async future with the outputs of all the frames."""
+        if exception is not None:
+            future.set_exception(exception)
+        elif self.batch_size is None:
+            # No batching. Return this single output (or dictionary of outputs) on its own.
+            future.set_result(outputs[0])
+        elif self.num_outputs <= 1:
+            # Return a list containing an output for each item in the batch.
+            future.set_result(outputs)
         else:
-            future._intermediate_result = {output.name: [] for output in self.infer_model.outputs}
+            # Each key contains a list of outputs, one per item in the batch.
+            future.set_result({name: [output[name] for output in outputs] for name in self.infer_model.output_names})
+
+    def _submit(self, frames, on_done, keep_outputs):
+        """
+        Start inference on a list of frames, all in a single request to the device.
 
-        for i, frame in enumerate(input_data):
-            last = i == len(input_data) - 1
-            bindings = self._create_bindings()
+        Args:
+            frames (list): Input arrays, which must stay unchanged until on_done is called.
+            on_done: Called as on_done(exception, outputs) from the HailoRT callback thread,
+                where outputs has one entry for each frame.
+            keep_outputs (bool): Whether the caller keeps the output arrays. If not, they are
+                reused for later frames as soon as on_done returns.
+        """
+        bindings_list = []
+        for frame in frames:
+            bindings = self._take_bindings()
             bindings.input().set_buffer(frame)
-            self.configured_infer_model.wait_for_async_ready(timeout_ms=10000)
-            self.configured_infer_model.run_async(
-                [bindings], partial(self.callback, bindings=bindings, future=future, last=last)
-            )
+            bindings_list.append(bindings)
+        self.configured_infer_model.wait_for_async_ready(timeout_ms=10000, frames_count=len(bindings_list))
+        self.configured_infer_model.run_async(
+            bindings_list, partial(self._completed, bindings_list=bindings_list, on_done=on_done, keep_outputs=keep_outputs)
+        )
+
+    def _completed(self, completion_info, bindings_list, on_done, keep_outputs):
+        """HailoRT callback for a request made by _submit."""
+        try:
+            if completion_info.exception:
+                on_done(completion_info.exception, None)
+            else:
+                on_done(None, [self._outputs(bindings) for bindings in bindings_list])
+        finally:
+            for bindings in bindings_list:
+                self._give_bindings(bindings, keep_outputs)
 
-        return future
+    def _outputs(self, bindings):
+        """Return the single output array, or a dictionary of them keyed on the layer name."""
+        if self.num_outputs <= 1:
+            return bindings.output().get_buffer()
+        return {name: bindings.output(name).get_buffer() for name in self.infer_model.output_names}
+
+    def _take_bindings(self):
+        """Return a free set of bindings, creating a new one only if there are none."""
+        with self._bindings_lock:
+            if self._free_bindings:
+                return self._free_bindings.pop()
+            self.bindings_created += 1
+        return self._create_bindings()
+
+    def _give_bindings(self, bindings, keep_outputs):
+        """Return bindings to the free list, giving them new output arrays if the old ones were handed out."""
+        if keep_outputs:
+            for name in self.infer_model.output_names:
+                bindings.output(name).set_buffer(self._output_buffer(name))
+        with self._bindings_lock:
+            if len(self._free_bindings) < self.max_free_bindings:
+                self._free_bindings.append(bindings)
 
     def run(self, input_data):
         """
@@ -197,13 +221,15 @@ class Hailo:
         Returns:
             bindings: Bindings object with input and output buffers.
         """
-        output_buffers = {
-            name: np.empty(self.infer_model.output(name).shape, dtype=np.float32) for name in self.infer_model.output_names
-        }
+        output_buffers = {name: self._output_buffer(name) for name in self.infer_model.output_names}
         return self.configured_infer_model.create_bindings(output_buffers=output_buffers)
 
+    def _output_buffer(self, name):
+        return np.empty(self.infer_model.output(name).shape, dtype=np.float32)
+
     def close(self):
         """Release the Hailo device."""
+        self._free_bindings.clear()
         del self.configured_infer_model
         Hailo.TARGET_REF_COUNT -= 1
         if Hailo.TARGET_REF_COUNT == 0:
@@ -0,0 +1,327 @@
+"""Streaming, batched inference on a Hailo device, fed directly from the camera."""
+
+import collections
+import logging
+import queue
+import threading
+import time
+from functools import partial
+
+import numpy as np
+
+from picamera2.request import MappedArray
+
+_log = logging.getLogger(__name__)
+
+
+class Letterbox:
+    """Scale images into a fixed size array, keeping their aspect ratio and centring them.
+
+    The source pixels to use for every row and column of the output are worked out once, when
+    the source size changes, so scaling a frame is two np.take calls with no temporary arrays.
+    With letterbox=False the image is stretched to fill the whole output instead.
+    """
+
+    def __init__(self, shape, letterbox=True, fill=0):
+        """Create a Letterbox.
+
+        :param shape: Output shape, as (height, width, channels)
+        :param letterbox: Whether to keep the aspect ratio, defaults to True
+        :param fill: Value for the borders, defaults to 0
+        """
+        self.shape = tuple(shape)
+        self.letterbox = letterbox
+        self.fill = fill
+        self._source_size = None
+        # The part of the output the image occupies, as (x, y, width, height).
+        self.region = (0, 0, self.shape[1], self.shape[0])
+
+    def _prepare(self, source_size):
+        sh, sw = source_size
+        h, w = self.shape[:2]
+        if self.letterbox:
+            scale = min(w / sw, h / sh)
+            nw, nh = max(1, round(sw * scale)), max(1, round(sh * scale))
+        else:
+            nw, nh = w, h
+        x, y = (w - nw) // 2, (h - nh) // 2
+        self.region = (x, y, nw, nh)
+        self._rows = (np.arange(nh) * sh // nh).astype(np.intp)
+        self._cols = (np.arange(nw) * sw // nw).astype(np.intp)
+        self._scaled_rows = np.empty((nh, sw, self.shape[2]), dtype=np.uint8)
+        self._source_size = source_size
+
+    def fill_borders(self, out):
+        """Fill the parts of an output array that the image never covers."""
+        x, y, nw, nh = self.region
+        out[:y] = self.fill
+        out[y + nh :] = self.fill
+        out[:, :x] = self.fill
+        out[:, x + nw :] = self.fill
+
+    def __call__(self, image, out):
+        """Scale image (height, width, channels) into out. Extra source channels, such as X in XRGB8888, are ignored."""
+        if self._source_size != image.shape[:2]:
+            self._prepare(image.shape[:2])
+        self.fill_borders(out)
+        image = image[:, :, : self.shape[2]]
+        x, y, nw, nh = self.region
+        target = out[y : y + nh, x : x + nw]
+        if image.shape[:2] == (nh, nw):
+            np.copyto(target, image)
+        else:
+            np.take(image, self._rows, axis=0, out=self._scaled_rows, mode="clip")
+            np.take(self._scaled_rows, self._cols, axis=1, out=target, mode="clip")
+
+
+class _Batch:
+    """A block of input arrays for one request to the device, and what is known about its frames."""
+
+    __slots__ = ("frames", "count", "metadata", "times")
+
+    def __init__(self, shape, size):
+        self.frames = np.empty((size, *shape), dtype=np.uint8)
+        self.count = 0
+        self.metadata = []
+        self.times = []
+
+    def reset(self):
+        self.count = 0
+        self.metadata = []
+        self.times = []
+
+
+class HailoStream:
+    """Run a Hailo model on every frame of a camera stream, in batches, without blocking the camera.
+
+    The camera thread only takes a reference to each request and queues it. A worker thread
+    scales the image into a preallocated input array (see Letterbox) and, once it has a whole
+    batch (the model's batch_size, or 1), starts inference on it and carries on with the next
+    frames while the device is busy. The input arrays and the Hailo bindings are all reused, so
+    nothing is allocated per frame.
+
+    Results are passed to on_result(outputs, metadata) on the HailoRT callback thread, one call
+    per frame and in order. The output arrays are reused once on_result returns, so copy anything
+    that needs to be kept. Frames that arrive while max_pending are already waiting are dropped,
+    so that camera buffers are never held up.
+
+    Example::
+
+        with HailoStream(hailo, picam2, "lores", on_result=show) as stream:
+            ...
+        print(stream.fps, stream.dropped)
+
+    The stream must be in one of the 8-bit RGB formats in FORMATS.
+    """
+
+    FORMATS = ("RGB888", "BGR888", "XRGB8888", "XBGR8888")
+
+    def __init__(
+        self, hailo, picam2, stream="lores", on_result=None, letterbox=True, fill=0, max_pending=2, max_batches_in_flight=2
+    ):
+        """Create a HailoStream.
+
+        :param hailo: The Hailo object to run the model on
+        :param picam2: The Picamera2 object supplying the frames
+        :param stream: The stream to use, defaults to "lores"
+        :param on_result: Function called as on_result(outputs, metadata) for each frame, defaults to None
+        :param letterbox: Keep the image's aspect ratio when scaling it to the model's input, defaults to True
+        :param fill: Value for the letterbox borders, defaults to 0
+        :param max_pending: Frames that may wait for the worker before new ones are dropped, defaults to 2
+        :param max_batches_in_flight: Batches that may be on the device at once, defaults to 2
+        """
+        if max_pending < 1 or max_batches_in_flight < 1:
+            raise RuntimeError("HailoStream needs max_pending and max_batches_in_flight of at least 1")
+        self._hailo = hailo
+        self._picam2 = picam2
+        self._stream = stream
+        self.on_result = on_result
+        shape = tuple(hailo.get_input_shape())
+        self.batch_size = hailo.batch_size or 1
+        self.letterbox = Letterbox(shape, letterbox, fill)
+        self._pending = queue.Queue(maxsize=max_pending)
+        # One more batch than can be in flight, so that the worker can fill one while the others run.
+        self._free = [_Batch(shape, self.batch_size) for _ in range(max_batches_in_flight + 1)]
+        self._condition = threading.Condition()
+        self._in_flight = 0
+        self._thread = None
+        self._running = False
+        self._completion_times = collections.deque(maxlen=64)
+        self.received = 0
+        self.dropped = 0
+        self.completed = 0
+        self.batches = 0
+        self.errors = 0
+        self.latency = None  # seconds from a frame being queued to its results, smoothed
+
+    @property
+    def queue_depth(self):
+        """Frames taken from the camera whose results have not yet been delivered."""
+        with self._condition:
+            return self.received - self.dropped - self.completed
+
+    @property
+    def fps(self):
+        """Frames with results per second, over the most recent batches."""
+        with self._condition:
+            times = self._completion_times
+            if len(times) < 2 or times[-1][0] == times[0][0]:
+                return 0.0
+            frames = sum(count for _, count in times) - times[0][1]
+            return frames / (times[-1][0] - times[0][0])
+
+    def stats(self):
+        """Return the throughput and queue counters as a dictionary."""
+        return {
+            "received": self.received,
+            "dropped": self.dropped,
+            "completed": self.completed,
+            "batches": self.batches,
+            "errors": self.errors,
+            "queue_depth": self.queue_depth,
+            "fps": self.fps,
+            "latency": self.latency,
+        }
+
+    def start(self) -> None:
+        """Start running the model on the camera's frames."""
+        config = (self._picam2.camera_config or {}).get(self._stream)
+        if config is not None and config["format"] not in self.FORMATS:
+            raise RuntimeError(f"HailoStream needs the {self._stream} stream in one of the formats {self.FORMATS}")
+        with self._condition:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._worker, name="picamera2-hailo", daemon=True)
+        self._thread.start()
+        self._picam2.add_request_consumer(self._consume)
+
+    def stop(self, timeout=None) -> None:
+        """Stop taking frames, and wait for the ones already taken to finish, including a partial batch."""
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+        self._picam2.remove_request_consumer(self._consume)
+        # Never wait for room in the queue unless the worker is still there to make it.
+        while self._thread.is_alive():
+            try:
+                self._pending.put(None, timeout=0.1)
+                break
+            except queue.Full:
+                pass
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self._drop_pending()
+        with self._condition:
+            self._condition.wait_for(lambda: self._in_flight == 0, timeout)
+
+    def __enter__(self) -> "HailoStream":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self.stop()
+
+    def _consume(self, request) -> None:
+        # Runs in the camera thread, so must never wait.
+        if request.stream_map.get(self._stream) is None:
+            return
+        request.acquire()
+        with self._condition:
+            self.received += 1
+        try:
+            self._pending.put_nowait((request, time.monotonic()))
+        except queue.Full:
+            request.release()
+            with self._condition:
+                self.dropped += 1
+
+    def _worker(self) -> None:
+        batch = None
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            if batch is None:
+                batch = self._take_batch()
+            request, queued = item
+            try:
+                with MappedArray(request, self._stream, write=False) as m:
+                    self.letterbox(m.array, batch.frames[batch.count])
+                batch.metadata.append(request.get_metadata())
+            except Exception as e:
+                # Lose just this frame, rather than the worker and every frame after it.
+                _log.error(f"HailoStream failed to prepare a frame: {e}")
+                with self._condition:
+                    self.errors += 1
+                    self.dropped += 1
+                continue
+            finally:
+                request.release()
+            batch.times.append(queued)
+            batch.count += 1
+            if batch.count == self.batch_size:
+                self._submit(batch)
+                batch = None
+        if batch is not None:
+            if batch.count:
+                self._submit(batch)
+            else:
+                # Every frame since the last batch failed, so there is nothing to run.
+                with self._condition:
+                    self._free.append(batch)
+                    self._condition.notify_all()
+
+    def _drop_pending(self):
+        # Release any frames left in the queue when there is no worker to take them.
+        while True:
+            try:
+                item = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None:
+                item[0].release()
+                with self._condition:
+                    self.dropped += 1
+
+    def _take_batch(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self._free)
+            return self._free.pop()
+
+    def _submit(self, batch):
+        with self._condition:
+            self._in_flight += 1
+        frames = [batch.frames[i] for i in range(batch.count)]
+        try:
+            self._hailo._submit(frames, partial(self._completed, batch), keep_outputs=False)
+        except Exception as e:
+            self._completed(batch, e, None)
+
+    def _completed(self, batch, exception, outputs):
+        # Runs on the HailoRT callback thread.
+        try:
+            if exception is None and self.on_result is not None:
+                for output, metadata in zip(outputs, batch.metadata):
+                    self.on_result(output, metadata)
+        finally:
+            self._recycle(batch, exception)
+
+    def _recycle(self, batch, exception):
+        now = time.monotonic()
+        with self._condition:
+            self.batches += 1
+            if exception is None:
+                self.completed += batch.count
+            else:
+                self.errors += 1
+                self.dropped += batch.count
+            self._completion_times.append((now, batch.count))
+            if batch.times:
+                latency = now - batch.times[0]
+                self.latency = latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+            batch.reset()
+            self._free.append(batch)
+            self._in_flight -= 1
+            self._condition.notify_all()
@@ -1,23 +1,24 @@
-import fcntl
-
-import videodev2
-
+from picamera2.lazy import lazy_attributes
 from picamera2.platform import Platform, get_platform
 
-from .encoder import Encoder, Quality
-from .jpeg_encoder import JpegEncoder
-from .libav_h264_encoder import LibavH264Encoder
-from .libav_mjpeg_encoder import LibavMjpegEncoder
-from .multi_encoder import MultiEncoder
-
 _hw_encoder_available = get_platform() == Platform.VC4
 
-if _hw_encoder_available:
-    from .h264_encoder import H264Encoder
-else:
-    from .libav_h264_encoder import LibavH264Encoder as H264Encoder
+# Encoders are imported when first used, as between them they need simplejpeg, av and the V4L2 codecs.
+_ATTRIBUTES = {
+    "Encoder": ".encoder",
+    "Quality": ".encoder",
+    "JpegEncoder": ".jpeg_encoder",
+    "LibavH264Encoder": ".libav_h264_encoder",
+    "LibavMjpegEncoder": ".libav_mjpeg_encoder",
+    "MultiEncoder": ".multi_encoder",
+}
 
 if _hw_encoder_available:
-    from .mjpeg_encoder import MJPEGEncoder
+    _ATTRIBUTES["H264Encoder"] = ".h264_encoder"
+    _ATTRIBUTES["MJPEGEncoder"] = ".mjpeg_encoder"
 else:
-    from .libav_mjpeg_encoder import LibavMjpegEncoder as MJPEGEncoder
+    _ATTRIBUTES["H264Encoder"] = (".libav_h264_encoder", "LibavH264Encoder")
+    _ATTRIBUTES["MJPEGEncoder"] = (".libav_mjpeg_encoder", "LibavMjpegEncoder")
+
+__all__ = list(_ATTRIBUTES)
+__getattr__, __dir__ = lazy_attributes(__name__, _ATTRIBUTES)
@@ -8,7 +8,7 @@ from libcamera import controls
 
 import picamera2.formats as formats
 
-from ..outputs import Output
+from ..outputs import EncodedPacket, Output
 from ..request import _MappedBuffer
 
 
@@ -72,6 +72,8 @@ class Encoder:
         self.audio_sync = -100000  # in us, so by default, delay audio by 100ms
         self._audio_start = threading.Event()
         self.frames_encoded = 0
+        # Set by Picamera2 when it has a Tracer recording frame latencies.
+        self.tracer = None
         # For camera sync.
         self.sync_enable = False
         self.sync = threading.Event()
@@ -268,6 +270,8 @@ class Encoder:
                 if not self._running:
                     return
                 self._encode(stream, request)
+                if self.tracer is not None:
+                    self.tracer.stamp(request.trace, f"encoder_submit:{self._trace_name}")
         self._skip_count = (self._skip_count + 1) % self.frame_skip_count
         self.frames_encoded += 1
 
@@ -350,13 +354,44 @@ class Encoder:
         """Writes a frame
 
         :param frame: Frame
-        :type frame: bytes
+        :type frame: bytes or memoryview
         :param keyframe: Whether frame is a keyframe or not, defaults to True
         :type keyframe: bool, optional
         """
+        if packet is None and not audio:
+            encoded_packet = EncodedPacket(frame, keyframe, timestamp)
+            self.outputpacket(encoded_packet)
+            encoded_packet.release()
+            return
+        self._send_to_outputs(lambda out: out.outputframe(frame, keyframe, timestamp, packet, audio), timestamp, audio)
+
+    def outputpacket(self, packet):
+        """Writes an EncodedPacket to all the outputs, which share it rather than having copies
+
+        :param packet: Encoded packet
+        :type packet: EncodedPacket
+        """
+        self._send_to_outputs(lambda out: out.outputpacket(packet), packet.timestamp, False)
+
+    def _send_to_outputs(self, send, timestamp, audio):
+        tracer = self.tracer
+        if tracer is None or audio or timestamp is None or self.firsttimestamp is None:
+            with self._output_lock:
+                for out in self._output:
+                    send(out)
+            return
+
+        # Frame timestamps are relative to the first one, so this recovers the SensorTimestamp (in us).
+        sensor_timestamp = self.firsttimestamp + timestamp
+        tracer.stamp_timestamp(sensor_timestamp, f"encoder_output:{self._trace_name}")
         with self._output_lock:
             for out in self._output:
-                out.outputframe(frame, keyframe, timestamp, packet, audio)
+                send(out)
+                tracer.stamp_timestamp(sensor_timestamp, f"output:{self._trace_name}:{type(out).__name__}")
+
+    @property
+    def _trace_name(self):
+        return f"{type(self).__name__}({self._name})"
 
     def _setup(self, quality):
         pass
@@ -1,19 +1,47 @@
 """Provide V4L2 encoding functionality"""
 
-import ctypes
+import errno
 import fcntl
+import logging
 import mmap
+import os
 import queue
 import select
 import threading
+from functools import partial
 
 from videodev2 import *
 
 from picamera2.encoders.encoder import Encoder
+from picamera2.outputs import EncodedPacket
+
+_log = logging.getLogger(__name__)
+
+
+def _make_buffer(buf_type, memory):
+    """Make a v4l2_buffer with a single plane, for use over and over again."""
+    buf = v4l2_buffer()
+    planes = (v4l2_plane * VIDEO_MAX_PLANES)()
+    buf.type = buf_type
+    buf.memory = memory
+    buf.length = 1
+    buf.m.planes = planes
+    # The buffer only holds a pointer to the planes, so they must be kept alive with it.
+    return buf, planes
 
 
 class V4L2Encoder(Encoder):
-    """V4L2 Encoding"""
+    """V4L2 Encoding
+
+    Encoded frames are passed to outputs as EncodedPackets holding memoryviews of the codec's
+    own buffers, rather than copies, and each buffer goes back to the codec once the outputs
+    have released the packet. Outputs that need bytes share a single copy.
+    The number of buffers used on each side of the codec can be changed, before the encoder
+    starts, with the num_output_buffers and num_capture_buffers attributes.
+    """
+
+    NUM_OUTPUT_BUFFERS = 16
+    NUM_CAPTURE_BUFFERS = 16
 
     def __init__(self, bitrate, pixformat):
         """Initialise V4L2 encoder
@@ -34,6 +62,10 @@ class V4L2Encoder(Encoder):
         self._enable_framerate = False
         self._key_frames_requested = 0
         self._key_frames_generated = 0
+        # Buffers for the frames going into the codec, and for the encoded frames coming out.
+        self.num_output_buffers = self.NUM_OUTPUT_BUFFERS
+        self.num_capture_buffers = self.NUM_CAPTURE_BUFFERS
+        self._views = {}
 
     @property
     def _v4l2_format(self):
@@ -51,10 +83,26 @@ class V4L2Encoder(Encoder):
 
     def _start(self):
         self.vd = open('/dev/video11', 'rb+', buffering=0)
+        # Non-blocking, so that the poll thread can dequeue buffers until there are none left.
+        flags = fcntl.fcntl(self.vd, fcntl.F_GETFL)
+        fcntl.fcntl(self.vd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
 
         self.buf_available = queue.Queue()
         self.buf_frame = queue.Queue()
 
+        # All the v4l2 structures that are needed while encoding are made just once, here. Each
+        # is only ever used by one thread, _encode being serialised by the encoder's lock, and
+        # each capture buffer having its own for requeueing (which happens whenever outputs
+        # release the buffer's packet).
+        self._requeue_bufs = {}
+        self._qbuf_output, self._qbuf_output_planes = _make_buffer(V4L2_BUF_TYPE_VIDEO_OUTPUT_MPLANE, V4L2_MEMORY_DMABUF)
+        self._qbuf_output.field = V4L2_FIELD_NONE
+        self._dqbuf_output, self._dqbuf_output_planes = _make_buffer(V4L2_BUF_TYPE_VIDEO_OUTPUT_MPLANE, V4L2_MEMORY_DMABUF)
+        self._dqbuf_capture, self._dqbuf_capture_planes = _make_buffer(V4L2_BUF_TYPE_VIDEO_CAPTURE_MPLANE, V4L2_MEMORY_MMAP)
+        self._key_frame_ctrl = v4l2_control()
+        self._key_frame_ctrl.id = V4L2_CID_MPEG_VIDEO_FORCE_KEY_FRAME
+        self._key_frame_ctrl.value = 1
+
         self.thread = threading.Thread(target=self.thread_poll, args=(self.buf_available,))
         self.thread.setDaemon(True)
         self.thread.start()
@@ -114,11 +162,8 @@ class V4L2Encoder(Encoder):
             ext.ctrl_class = V4L2_CTRL_CLASS_MPEG
             fcntl.ioctl(self.vd, VIDIOC_S_EXT_CTRLS, ext)
 
-        NUM_OUTPUT_BUFFERS = 16
-        NUM_CAPTURE_BUFFERS = 16
-
         reqbufs = v4l2_requestbuffers()
-        reqbufs.count = NUM_OUTPUT_BUFFERS
+        reqbufs.count = self.num_output_buffers
         reqbufs.type = V4L2_BUF_TYPE_VIDEO_OUTPUT_MPLANE
         reqbufs.memory = V4L2_MEMORY_DMABUF
         fcntl.ioctl(self.vd, VIDIOC_REQBUFS, reqbufs)
@@ -127,22 +172,16 @@ class V4L2Encoder(Encoder):
             self.buf_available.put(i)
 
         reqbufs = v4l2_requestbuffers()
-        reqbufs.count = NUM_CAPTURE_BUFFERS
+        reqbufs.count = self.num_capture_buffers
         reqbufs.type = V4L2_BUF_TYPE_VIDEO_CAPTURE_MPLANE
         reqbufs.memory = V4L2_MEMORY_MMAP
         fcntl.ioctl(self.vd, VIDIOC_REQBUFS, reqbufs)
 
         for i in range(reqbufs.count):
-            planes = v4l2_plane * VIDEO_MAX_PLANES
-            planes = planes()
-            buffer = v4l2_buffer()
-            ctypes.memset(ctypes.byref(buffer), 0, ctypes.sizeof(buffer))
-            buffer.type = V4L2_BUF_TYPE_VIDEO_CAPTURE_MPLANE
-            buffer.memory = V4L2_MEMORY_MMAP
+            buffer, planes = _make_buffer(V4L2_BUF_TYPE_VIDEO_CAPTURE_MPLANE, V4L2_MEMORY_MMAP)
             buffer.index = i
-            buffer.length = 1
-            buffer.m.planes = planes
             fcntl.ioctl(self.vd, VIDIOC_QUERYBUF, buffer)
+            self._requeue_bufs[i] = (buffer, planes)
             self.bufs[i] = (
                 mmap.mmap(
                     self.vd.fileno(),
@@ -153,6 +192,7 @@ class V4L2Encoder(Encoder):
                 ),
                 buffer.m.planes[0].length,
             )
+            self._views[i] = memoryview(self.bufs[i][0])
             fcntl.ioctl(self.vd, VIDIOC_QBUF, buffer)
 
         typev = v4l2_buf_type(V4L2_BUF_TYPE_VIDEO_OUTPUT_MPLANE)
@@ -173,8 +213,17 @@ class V4L2Encoder(Encoder):
         reqbufs.memory = V4L2_MEMORY_DMABUF
         fcntl.ioctl(self.vd, VIDIOC_REQBUFS, reqbufs)
 
+        # The views must go before the mmaps can be closed.
+        for view in self._views.values():
+            view.release()
+        self._views = {}
+        self._requeue_bufs = {}
         for i in range(len(self.bufs)):
-            self.bufs[i][0].close()
+            try:
+                self.bufs[i][0].close()
+            except BufferError:
+                # An output is holding on to a packet, so leave the mapping for the garbage collector.
+                _log.warning("Encoded buffer still in use when the encoder stopped")
         self.bufs = {}
 
         reqbufs = v4l2_requestbuffers()
@@ -191,6 +240,7 @@ class V4L2Encoder(Encoder):
         # can't be very large, so assume anything larger than this must be OK:
         if len(buf) > 64:
             return True
+        buf = bytes(buf)  # it's tiny, and memoryviews can't be searched
 
         # Search the start codes to see if there's a picture here. Start codes are
         # always the four bytes 0 0 0 1, and the low nibble of the subsequent byte tells
@@ -228,56 +278,53 @@ class V4L2Encoder(Encoder):
                 if fd_event != self.vd.fileno():
                     continue
 
+                # Each wakeup deals with every buffer that's ready, not just one of them.
                 if event & select.POLLOUT:
-                    buf = v4l2_buffer()
-                    planes = v4l2_plane * VIDEO_MAX_PLANES
-                    planes = planes()
-                    buf.type = V4L2_BUF_TYPE_VIDEO_OUTPUT_MPLANE
-                    buf.memory = V4L2_MEMORY_DMABUF
-                    buf.length = 1
-                    buf.m.planes = planes
-                    ret = fcntl.ioctl(self.vd, VIDIOC_DQBUF, buf)
-
-                    if ret == 0:
-                        buf_available.put(buf.index)
-
-                    # Release frame from camera
-                    queue_item = self.buf_frame.get()
-                    queue_item.release()
+                    while self._dequeue(self._dqbuf_output):
+                        buf_available.put(self._dqbuf_output.index)
+                        # Release frame from camera
+                        queue_item = self.buf_frame.get()
+                        queue_item.release()
 
                 if event & select.POLLIN:
-                    buf = v4l2_buffer()
-                    buf.type = V4L2_BUF_TYPE_VIDEO_CAPTURE_MPLANE
-                    buf.memory = V4L2_MEMORY_MMAP
-                    buf.length = 1
-                    planes = v4l2_plane * VIDEO_MAX_PLANES
-                    planes = planes()
-                    buf.m.planes = planes
-                    ret = fcntl.ioctl(self.vd, VIDIOC_DQBUF, buf)
-                    keyframe = (buf.flags & V4L2_BUF_FLAG_KEYFRAME) != 0
-
-                    if ret == 0:
-                        bufindex = buf.index
-                        buflen = buf.m.planes[0].length
-
-                        # Write output to file
-                        b = self.bufs[buf.index][0].read(buf.m.planes[0].bytesused)
-                        self.bufs[buf.index][0].seek(0)
-                        if self._check_for_picture(b):
-                            self.outputframe(b, keyframe, (buf.timestamp.tv_sec * 1000000) + buf.timestamp.tv_usec)
-
-                        # Requeue encoded buffer
-                        buf = v4l2_buffer()
-                        planes = v4l2_plane * VIDEO_MAX_PLANES
-                        planes = planes()
-                        buf.type = V4L2_BUF_TYPE_VIDEO_CAPTURE_MPLANE
-                        buf.memory = V4L2_MEMORY_MMAP
-                        buf.index = bufindex
-                        buf.length = 1
-                        buf.m.planes = planes
-                        buf.m.planes[0].bytesused = 0
-                        buf.m.planes[0].length = buflen
-                        ret = fcntl.ioctl(self.vd, VIDIOC_QBUF, buf)
+                    while self._dequeue(self._dqbuf_capture):
+                        self._output_capture_buffer(self._dqbuf_capture)
+
+    def _dequeue(self, buf):
+        """Dequeue a buffer into buf, returning False if there are none ready."""
+        try:
+            fcntl.ioctl(self.vd, VIDIOC_DQBUF, buf)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return False
+            raise
+        return True
+
+    def _output_capture_buffer(self, buf):
+        """Send an encoded buffer to the outputs, to be given back to the codec when they're done with it."""
+        index = buf.index
+        keyframe = (buf.flags & V4L2_BUF_FLAG_KEYFRAME) != 0
+        timestamp = (buf.timestamp.tv_sec * 1000000) + buf.timestamp.tv_usec
+        frame = self._views[index][: buf.m.planes[0].bytesused]
+        packet = EncodedPacket(frame, keyframe, timestamp, release=partial(self._requeue, index, frame))
+        try:
+            if self._check_for_picture(frame):
+                self.outputpacket(packet)
+        finally:
+            packet.release()
+
+    def _requeue(self, index, frame):
+        try:
+            frame.release()
+        except BufferError:
+            _log.warning("An output is still using an encoded frame that is being reused")
+        if self.vd is None or self.vd.closed or index not in self._requeue_bufs:
+            return  # the encoder has been stopped
+        # Requeue encoded buffer
+        buf = self._requeue_bufs[index][0]
+        buf.m.planes[0].bytesused = 0
+        buf.m.planes[0].length = self.bufs[index][1]
+        fcntl.ioctl(self.vd, VIDIOC_QBUF, buf)
 
     def _encode(self, stream, request):
         """Encodes a frame
@@ -302,27 +349,17 @@ class V4L2Encoder(Encoder):
         # method when it supports this feature.
         if self._key_frames_requested > self._key_frames_generated:
             self._key_frames_generated += 1
-            ctrl = v4l2_control()
-            ctrl.id = V4L2_CID_MPEG_VIDEO_FORCE_KEY_FRAME
-            ctrl.value = 1
-            fcntl.ioctl(self.vd, VIDIOC_S_CTRL, ctrl)
+            fcntl.ioctl(self.vd, VIDIOC_S_CTRL, self._key_frame_ctrl)
 
         request.acquire()
 
-        buf = v4l2_buffer()
+        buf = self._qbuf_output
         timestamp_us = self._timestamp(request)
 
         # Pass frame to video 4 linux, to encode
-        planes = v4l2_plane * VIDEO_MAX_PLANES
-        planes = planes()
-        buf.type = V4L2_BUF_TYPE_VIDEO_OUTPUT_MPLANE
         buf.index = self.buf_available.get()
-        buf.field = V4L2_FIELD_NONE
-        buf.memory = V4L2_MEMORY_DMABUF
-        buf.length = 1
         buf.timestamp.tv_sec = timestamp_us // 1000000
         buf.timestamp.tv_usec = timestamp_us % 1000000
-        buf.m.planes = planes
         buf.m.planes[0].m.fd = fd
         buf.m.planes[0].bytesused = cfg.frame_size
         buf.m.planes[0].length = cfg.frame_size
@@ -0,0 +1,296 @@
+"""Zero-copy fan-out of camera frames to multiple consumers."""
+
+import threading
+from collections import deque
+from typing import Any, Optional
+
+import numpy as np
+
+from .request import _MappedBuffer
+
+POLICIES = ("drop_oldest", "drop_newest", "block")
+
+
+class _SharedFrame:
+    """A completed request that stays mapped while any subscriber is still looking at it.
+
+    The request is acquired once and the buffer mapped once, however many subscribers
+    there are. The numpy view and the metadata are also built just once and shared.
+    """
+
+    def __init__(self, request, stream):
+        request.acquire()
+        self._request = request
+        self._lock = threading.Lock()
+        self._ref_count = 1
+        self._buffer = None
+        try:
+            buffer = _MappedBuffer(request, stream, write=False)
+            b = buffer.__enter__()
+            self._buffer = buffer
+            config = request.config[stream] if isinstance(stream, str) else stream.configuration
+            array = request.picam2.helpers._make_array_shared(np.array(b, copy=False, dtype=np.uint8), config)
+            # Everyone sees the same memory, so nobody gets to write to it.
+            array.flags.writeable = False
+        except Exception:
+            # Don't hold on to the camera buffer if we can't make an array from it.
+            if self._buffer is not None:
+                self._buffer.__exit__(None, None, None)
+            request.release()
+            raise
+        self.array = array
+        self._metadata = None
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            self._metadata = self._request.get_metadata()
+        return self._metadata
+
+    def acquire(self):
+        with self._lock:
+            if self._ref_count == 0:
+                raise RuntimeError("Frame has already been released")
+            self._ref_count += 1
+
+    def release(self):
+        with self._lock:
+            self._ref_count -= 1
+            if self._ref_count < 0:
+                raise RuntimeError("Frame now has negative ref_count")
+            if self._ref_count:
+                return
+        del self.array
+        self._buffer.__exit__(None, None, None)
+        self._request.release()
+        self._request = None
+
+
+class Frame:
+    """A read-only view of a camera frame handed out to a subscriber.
+
+    The frame's memory belongs to the camera system, so it must be released (or used
+    as a context manager) once the subscriber has finished with it. Copy the array if
+    you need it for longer.
+    """
+
+    def __init__(self, shared: _SharedFrame) -> None:
+        self._shared: Optional[_SharedFrame] = None
+        shared.acquire()
+        self._shared = shared
+
+    @property
+    def array(self) -> np.ndarray:
+        """The frame's image data, shared with every other subscriber and not writeable."""
+        if self._shared is None:
+            raise RuntimeError("Frame has been released")
+        return self._shared.array
+
+    def get_metadata(self) -> dict[str, Any]:
+        """Return the metadata that came with this frame."""
+        if self._shared is None:
+            raise RuntimeError("Frame has been released")
+        return dict(self._shared.metadata)
+
+    def release(self) -> None:
+        """Hand the frame back. Releasing a frame more than once does nothing."""
+        shared, self._shared = self._shared, None
+        if shared is not None:
+            shared.release()
+
+    def __enter__(self) -> "Frame":
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self.release()
+
+    def __del__(self):
+        self.release()
+
+
+class FrameQueue:
+    """A bounded queue of items that own camera buffers.
+
+    Items must have a release method, which is called for anything the queue discards.
+    When the queue is full the policy decides what happens to a new item:
+
+    drop_oldest - the oldest item in the queue is released to make room.
+    drop_newest - the new item is released. "skip" is accepted as another name for this.
+    block - the producer waits up to block_timeout seconds for room, then drops the new item.
+    """
+
+    def __init__(self, maxlen=2, policy="drop_oldest", block_timeout=1.0):
+        if policy == "skip":
+            policy = "drop_newest"
+        if policy not in POLICIES:
+            raise RuntimeError(f"Unknown queue policy {policy!r}")
+        if maxlen < 1:
+            raise RuntimeError("Queue length must be at least 1")
+        self.maxlen = maxlen
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self._items = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self.delivered = 0
+        self.dropped = 0
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def put(self, item) -> bool:
+        """Add an item to the queue, returning False if it was dropped instead."""
+        discard = None
+        with self._condition:
+            if not self._closed and len(self._items) >= self.maxlen:
+                if self.policy == "drop_oldest":
+                    discard = self._items.popleft()
+                elif self.policy == "block":
+                    self._condition.wait_for(lambda: len(self._items) < self.maxlen or self._closed, self.block_timeout)
+            if self._closed or len(self._items) >= self.maxlen:
+                discard, item = item, None
+            else:
+                self._items.append(item)
+                self._condition.notify_all()
+            if discard is not None:
+                self.dropped += 1
+        if discard is not None:
+            discard.release()
+        return item is not None
+
+    def get(self, timeout=None):
+        """Return the next item, or None once the queue has been closed and emptied.
+
+        :raises TimeoutError: No item arrived within the timeout
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._items or self._closed, timeout):
+                raise TimeoutError("No frame received")
+            if not self._items:
+                return None
+            self.delivered += 1
+            item = self._items.popleft()
+            self._condition.notify_all()
+            return item
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        item = self.get()
+        if item is None:
+            raise StopIteration
+        return item
+
+    def close(self) -> None:
+        """Close the queue, releasing anything still in it and waking any waiting threads."""
+        with self._condition:
+            self._closed = True
+            items = list(self._items)
+            self._items.clear()
+            self._condition.notify_all()
+        for item in items:
+            item.release()
+
+
+class Subscription(FrameQueue):
+    """One consumer's view of a FrameFanout. Iterating over it yields Frames."""
+
+    def __init__(self, fanout, maxlen=2, policy="drop_oldest", block_timeout=1.0):
+        super().__init__(maxlen, policy, block_timeout)
+        self._fanout = fanout
+
+    def close(self) -> None:
+        """Stop receiving frames and release any that have not been collected."""
+        self._fanout.unsubscribe(self)
+        super().close()
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self.close()
+
+
+class FrameFanout:
+    """Deliver every frame from one stream to any number of subscribers without copying it.
+
+    Each camera frame is acquired and mapped once, and all the subscribers receive
+    read-only views of that same memory. The underlying request goes back to the camera
+    as soon as the last subscriber releases its Frame, so slow subscribers should use a
+    short queue (or a dropping policy) to avoid starving the camera of buffers.
+
+    Example::
+
+        fanout = FrameFanout(picam2, "lores")
+        sub = fanout.subscribe(maxlen=2, policy="drop_oldest")
+        fanout.start()
+        for frame in sub:
+            with frame:
+                process(frame.array)
+    """
+
+    def __init__(self, picam2, stream="main"):
+        self._picam2 = picam2
+        self._stream = stream
+        self._lock = threading.Lock()
+        self._subscriptions = []
+        self._running = False
+        self.count = 0
+
+    def subscribe(self, maxlen=2, policy="drop_oldest", block_timeout=1.0) -> Subscription:
+        """Create a new subscription that will receive every subsequent frame.
+
+        :param maxlen: Number of frames that may wait in this subscription's queue
+        :param policy: What to do when the queue is full, one of "drop_oldest", "drop_newest" or "block"
+        :param block_timeout: Longest time (in seconds) the "block" policy will hold up the camera
+        """
+        subscription = Subscription(self, maxlen, policy, block_timeout)
+        with self._lock:
+            self._subscriptions = self._subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription) -> None:
+        with self._lock:
+            self._subscriptions = [s for s in self._subscriptions if s is not subscription]
+
+    def start(self) -> None:
+        """Start delivering frames to the subscribers. The camera must be started separately."""
+        if not self._running:
+            self._running = True
+            self._picam2.add_request_consumer(self._consume)
+
+    def stop(self) -> None:
+        """Stop delivering frames, and close all the subscriptions."""
+        if self._running:
+            self._running = False
+            self._picam2.remove_request_consumer(self._consume)
+        with self._lock:
+            subscriptions = self._subscriptions
+            self._subscriptions = []
+        for subscription in subscriptions:
+            FrameQueue.close(subscription)
+
+    def __enter__(self) -> "FrameFanout":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self.stop()
+
+    def _consume(self, request) -> None:
+        # Runs in the camera event loop, so must not hang around.
+        subscriptions = self._subscriptions
+        if not subscriptions or request.stream_map.get(self._stream) is None:
+            return
+        self.count += 1
+        shared = _SharedFrame(request, self._stream)
+        try:
+            for subscription in subscriptions:
+                subscription.put(Frame(shared))
+        finally:
+            shared.release()
@@ -0,0 +1,103 @@
+"""Continuous streams of completed requests, for both threads and asyncio."""
+
+from .frame_fanout import FrameQueue
+
+
+class FrameStream(FrameQueue):
+    """A bounded queue of completed requests, fed directly by the camera event loop.
+
+    This is the cheap way to process every frame (or as many as you can keep up with),
+    as no Job has to be created and dispatched for each one. When the queue is full the
+    policy is either "drop_oldest" or "drop_newest", and the delivered and dropped
+    counters show how well the application is keeping up.
+
+    Iterating over the stream, with either for or async for, yields each request in turn
+    and releases it when the next one is fetched, so acquire a request to keep it for
+    longer. Requests returned by get() must be released by the caller. Streams are
+    normally created by Picamera2.frame_stream and should be closed when no longer needed.
+    """
+
+    def __init__(self, picam2, stream="main", maxsize=2, policy="drop_oldest"):
+        super().__init__(maxsize, policy)
+        if self.policy == "block":
+            raise RuntimeError("Frame streams must drop frames, not block the camera")
+        self._picam2 = picam2
+        self._stream = stream
+        self._last = None
+        self._waiters = []
+        self.received = 0
+        picam2.add_request_consumer(self._consume)
+
+    def _consume(self, request) -> None:
+        # Runs in the camera event loop.
+        if self._closed or request.stream_map.get(self._stream) is None:
+            return
+        self.received += 1
+        request.acquire()
+        self.put(request)
+
+    def put(self, item) -> bool:
+        result = super().put(item)
+        with self._condition:
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+        return result
+
+    def _release_last(self):
+        last, self._last = self._last, None
+        if last is not None:
+            last.release()
+
+    def __next__(self):
+        self._release_last()
+        self._last = super().__next__()
+        return self._last
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        import asyncio
+
+        self._release_last()
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self._items or self._closed:
+                    break
+                future = loop.create_future()
+                self._waiters.append((loop, future))
+            await future
+        request = self.get(timeout=0)
+        if request is None:
+            raise StopAsyncIteration
+        self._last = request
+        return request
+
+    def close(self) -> None:
+        """Stop receiving requests, releasing any that are still queued."""
+        self._picam2.remove_request_consumer(self._consume)
+        super().close()
+        self._release_last()
+        with self._condition:
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_wake, future)
+
+    def __enter__(self) -> "FrameStream":
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self.close()
+
+    async def __aenter__(self) -> "FrameStream":
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self.close()
+
+
+def _wake(future) -> None:
+    if not future.done():
+        future.set_result(None)
@@ -83,6 +83,16 @@ class Job(Generic[T]):
         """
         return self._future.result(timeout=timeout)
 
+    def __await__(self):
+        """Allow the job to be awaited from asyncio code.
+
+        The result is handed over to the awaiting event loop (using call_soon_threadsafe)
+        when the job finishes, so no thread is left blocked waiting for it.
+        """
+        import asyncio
+
+        return asyncio.wrap_future(self._future).__await__()
+
     def cancel(self) -> None:
         """
         Mark this job as cancelled, so that requesting the result raises a CancelledError.
@@ -0,0 +1,31 @@
+"""Support for modules whose attributes are only imported when they are first used."""
+
+import importlib
+import sys
+
+
+def lazy_attributes(module_name, attributes):
+    """Return __getattr__ and __dir__ functions that import a module's attributes on demand.
+
+    Assign them to __getattr__ and __dir__ in the module. Each attribute is imported from its
+    submodule the first time it is looked up, and is then an ordinary module attribute.
+
+    :param module_name: The module's __name__
+    :param attributes: Dictionary mapping each attribute name to the submodule (relative to
+        module_name) it comes from, or to a (submodule, name in that submodule) tuple
+    """
+    module = sys.modules[module_name]
+
+    def __getattr__(name):
+        source = attributes.get(name)
+        if source is None:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        submodule, attr = source if isinstance(source, tuple) else (source, name)
+        value = getattr(importlib.import_module(submodule, module_name), attr)
+        setattr(module, name, value)
+        return value
+
+    def __dir__():
+        return sorted(set(vars(module)) | set(attributes))
+
+    return __getattr__, __dir__
@@ -0,0 +1,266 @@
+"""Motion detection on a camera stream, normally the low resolution one."""
+
+import threading
+
+import numpy as np
+
+from .request import MappedArray
+
+# The background is kept in fixed point, with this many fractional bits.
+FRACTION_BITS = 4
+
+
+def luma_view(array, config):
+    """Return the luminance (or, failing that, green) pixels of a flat image buffer, without copying them.
+
+    :param array: The stream's buffer as a 1d uint8 array
+    :param config: The stream's configuration
+    """
+    fmt = config["format"]
+    w, h = config["size"]
+    stride = config["stride"]
+    rows = array[: h * stride].reshape((h, stride))
+    if fmt in ("YUV420", "YVU420", "NV12", "NV21"):
+        return rows[:, :w]
+    if fmt in ("YUYV", "YVYU"):
+        return rows[:, : w * 2 : 2]
+    if fmt in ("UYVY", "VYUY"):
+        return rows[:, 1 : w * 2 : 2]
+    if fmt in ("BGR888", "RGB888"):
+        return rows[:, 1 : w * 3 : 3]
+    if fmt in ("XBGR8888", "XRGB8888"):
+        return rows[:, 1 : w * 4 : 4]
+    raise RuntimeError("Motion detection does not support format " + fmt)
+
+
+class MotionDetector:
+    """Detect motion in a stream by comparing every frame against a running model of the background.
+
+    The detector runs as a request consumer, so it sees every frame without anything being copied
+    out of the camera's buffers. Each frame's luminance is (optionally) downsampled, compared with
+    the background, and divided into blocks, and a block is "moving" when enough of its pixels
+    differ from the background by more than pixel_threshold. All the arithmetic is in integers, on
+    arrays allocated just once, so a 320x240 frame takes a small fraction of a millisecond.
+
+    Motion starts once the fraction of moving blocks has been at least start_level for start_frames
+    frames in a row, and stops once it has been below stop_level for stop_frames frames in a row.
+    The on_start and on_stop functions are then called (with the detector as the argument) from the
+    camera thread, for example to start and stop an encoder, or to open and close a CircularOutput2
+    output. See EncoderTrigger and CircularOutputTrigger.
+
+    Example::
+
+        detector = MotionDetector(picam2, "lores", on_start=start, on_stop=stop)
+        detector.start()
+    """
+
+    def __init__(
+        self,
+        picam2,
+        stream="lores",
+        pixel_threshold=15,
+        downsample=2,
+        block_size=8,
+        block_fraction=0.25,
+        start_level=0.02,
+        stop_level=0.01,
+        start_frames=2,
+        stop_frames=30,
+        background_shift=3,
+        on_start=None,
+        on_stop=None,
+    ):
+        """Create a motion detector.
+
+        :param picam2: The Picamera2 object whose frames to look at
+        :param stream: The stream to use, defaults to "lores"
+        :param pixel_threshold: Difference from the background that makes a pixel count as changed, defaults to 15
+        :param downsample: Use only every downsample'th pixel across and down the image, defaults to 2
+        :param block_size: Size of the (square) blocks, in downsampled pixels, defaults to 8
+        :param block_fraction: Fraction of a block's pixels that must change for it to be moving, defaults to 0.25
+        :param start_level: Fraction of moving blocks that starts motion, defaults to 0.02
+        :param stop_level: Fraction of moving blocks below which motion stops, defaults to 0.01
+        :param start_frames: Frames in a row at start_level before motion starts, defaults to 2
+        :param stop_frames: Frames in a row below stop_level before motion stops, defaults to 30
+        :param background_shift: The background moves 1/2**background_shift of the way towards each frame,
+            defaults to 3
+        :param on_start: Function called when motion starts, defaults to None
+        :param on_stop: Function called when motion stops, defaults to None
+        """
+        if stop_level > start_level:
+            raise RuntimeError("stop_level may not be greater than start_level")
+        self._picam2 = picam2
+        self._stream = stream
+        self.pixel_threshold = pixel_threshold
+        self.downsample = downsample
+        self.block_size = block_size
+        self.block_fraction = block_fraction
+        self.start_level = start_level
+        self.stop_level = stop_level
+        self.start_frames = start_frames
+        self.stop_frames = stop_frames
+        self.background_shift = background_shift
+        self.on_start = on_start
+        self.on_stop = on_stop
+        self._lock = threading.Lock()
+        self._running = False
+        self._shape = None
+        self.moving_blocks = None
+        self.motion = False
+        self.level = 0.0
+        self.frames = 0
+        self.events = 0
+        self._count = 0
+
+    def reset(self):
+        """Forget the background, which is learnt again from the next frame."""
+        with self._lock:
+            self._shape = None
+            self._count = 0
+
+    def _allocate(self, shape):
+        h, w = shape
+        bs = self.block_size
+        bh, bw = h // bs, w // bs
+        if bh == 0 or bw == 0:
+            raise RuntimeError("Image is too small for the motion detection block size")
+        self._shape = shape
+        self._crop = (bh * bs, bw * bs)
+        self._background = np.empty(self._crop, dtype=np.int16)
+        self._current = np.empty(self._crop, dtype=np.int16)
+        self._difference = np.empty(self._crop, dtype=np.int16)
+        self._changed = np.empty(self._crop, dtype=bool)
+        self._block_counts = np.empty((bh, bw), dtype=np.int32)
+        self.moving_blocks = np.zeros((bh, bw), dtype=bool)
+
+    def detect(self, luma):
+        """Update the detector with a frame's luminance, returning the fraction of blocks that are moving.
+
+        :param luma: 2d uint8 array, which is not modified
+        """
+        with self._lock:
+            d = self.downsample
+            if d > 1:
+                luma = luma[::d, ::d]
+            first = self._shape != luma.shape
+            if first:
+                self._allocate(luma.shape)
+            h, w = self._crop
+            current = self._current
+            np.left_shift(luma[:h, :w], FRACTION_BITS, out=current, dtype=np.int16)
+            self.frames += 1
+            if first:
+                self._background[...] = current
+                self.level = 0.0
+                return self.level
+
+            difference = self._difference
+            np.subtract(current, self._background, out=difference)
+            # The current frame isn't needed any more, so its array holds the absolute differences.
+            np.abs(difference, out=current)
+            np.greater(current, self.pixel_threshold << FRACTION_BITS, out=self._changed)
+            bs = self.block_size
+            bh, bw = self._block_counts.shape
+            np.sum(self._changed.reshape(bh, bs, bw, bs), axis=(1, 3), out=self._block_counts)
+            np.greater(self._block_counts, int(self.block_fraction * bs * bs), out=self.moving_blocks)
+            self.level = np.count_nonzero(self.moving_blocks) / self.moving_blocks.size
+
+            # Move the background part of the way towards this frame.
+            np.right_shift(difference, self.background_shift, out=difference)
+            np.add(self._background, difference, out=self._background)
+
+            started, stopped = self._update_state()
+        if started and self.on_start:
+            self.on_start(self)
+        if stopped and self.on_stop:
+            self.on_stop(self)
+        return self.level
+
+    def _update_state(self):
+        # Apply the hysteresis, returning whether motion has just started or stopped.
+        if self.motion:
+            self._count = self._count + 1 if self.level < self.stop_level else 0
+            if self._count >= self.stop_frames:
+                self.motion = False
+                self._count = 0
+                return False, True
+        else:
+            self._count = self._count + 1 if self.level >= self.start_level else 0
+            if self._count >= self.start_frames:
+                self.motion = True
+                self.events += 1
+                self._count = 0
+                return True, False
+        return False, False
+
+    def start(self) -> None:
+        """Start looking at the camera's frames."""
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+        self._picam2.add_request_consumer(self._consume)
+
+    def stop(self) -> None:
+        """Stop looking at the camera's frames. Motion that is in progress is not stopped."""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+        self._picam2.remove_request_consumer(self._consume)
+
+    def __enter__(self) -> "MotionDetector":
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback) -> None:
+        self.stop()
+
+    def _consume(self, request) -> None:
+        config = request.config[self._stream]
+        with MappedArray(request, self._stream, reshape=False, write=False) as m:
+            self.detect(luma_view(m.array, config))
+
+
+class EncoderTrigger:
+    """Start an encoder when motion starts, and stop it when motion stops.
+
+    Pass its start and stop methods as a MotionDetector's on_start and on_stop. Each recording
+    gets a new output from make_output, which is given the detector.
+    """
+
+    def __init__(self, picam2, encoder, make_output):
+        self._picam2 = picam2
+        self._encoder = encoder
+        self._make_output = make_output
+
+    def start(self, detector):
+        self._encoder.output = self._make_output(detector)
+        self._picam2.start_encoder(self._encoder)
+
+    def stop(self, detector):
+        self._picam2.stop_encoder(self._encoder)
+
+
+class CircularOutputTrigger:
+    """Open a CircularOutput2 output when motion starts, and close it when motion stops.
+
+    Pass its start and stop methods as a MotionDetector's on_start and on_stop. Each recording
+    gets a new output from make_output, which is given the detector, and begins preroll_ms before
+    the motion started.
+    """
+
+    def __init__(self, circular, make_output, preroll_ms=2000):
+        self._circular = circular
+        self._make_output = make_output
+        self._preroll_ms = preroll_ms
+        self._output = None
+
+    def start(self, detector):
+        self._output = self._make_output(detector)
+        self._circular.open_output(self._output, preroll_ms=self._preroll_ms)
+
+    def stop(self, detector):
+        if self._output is not None:
+            self._circular.close_output(self._output)
+            self._output = None
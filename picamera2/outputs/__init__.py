@@ -1,7 +1,17 @@
-from .circularoutput import CircularOutput
-from .circularoutput2 import CircularOutput2
-from .ffmpegoutput import FfmpegOutput
-from .fileoutput import FileOutput
-from .output import Output
-from .pyavoutput import PyavOutput
-from .splittableoutput import SplittableOutput
+from picamera2.lazy import lazy_attributes
+
+# Outputs are imported when first used, as some need prctl or multiprocessing.
+_ATTRIBUTES = {
+    "CircularOutput": ".circularoutput",
+    "CircularOutput2": ".circularoutput2",
+    "EncodedPacket": ".encoded_packet",
+    "FfmpegOutput": ".ffmpegoutput",
+    "FileOutput": ".fileoutput",
+    "Output": ".output",
+    "PyavOutput": ".pyavoutput",
+    "SpillRing": ".spill_ring",
+    "SplittableOutput": ".splittableoutput",
+}
+
+__all__ = list(_ATTRIBUTES)
+__getattr__, __dir__ = lazy_attributes(__name__, _ATTRIBUTES)
@@ -3,15 +3,20 @@
 import collections
 from multiprocessing import Lock
 
+from .encoded_packet import EncodedPacket
 from .fileoutput import FileOutput
+from .keyframe_index import KeyframeIndex
 
 
 class CircularOutput(FileOutput):
     """Circular buffer implementation for file output"""
 
-    def __init__(self, file=None, pts=None, buffersize=30 * 5, outputtofile=True):
+    def __init__(self, file=None, pts=None, buffersize=30 * 5, outputtofile=True, max_bytes=None, preroll_ms=None):
         """Creates circular buffer for 5s worth of 30fps frames
 
+        The buffer may also be limited to a number of bytes, in which case the oldest frames are
+        discarded whenever the frames in the buffer add up to more than that.
+
         :param file: File to write frames to, defaults to None
         :type file: str or BufferedIOBase, optional
         :param pts: File to write timestamps to, defaults to None
@@ -20,9 +25,21 @@ class CircularOutput(FileOutput):
         :type buffersize: int, optional
         :param outputtofile: Boolean, whether to always write frames to file
         :type outputtofile: bool
+        :param max_bytes: Most encoded data to keep in the buffer, defaults to None (no limit)
+        :type max_bytes: int, optional
+        :param preroll_ms: How much of the buffer to write when recording starts, defaults to None (all of it)
+        :type preroll_ms: int, optional
         """
         super().__init__(file, pts=pts)
         self._lock = Lock()
+        self.max_bytes = max_bytes
+        self.buffered_bytes = 0
+        self.evicted_frames = 0
+        self.evicted_bytes = 0
+        self.preroll_ms = preroll_ms
+        # Every frame gets the next position, so that keyframes can be found without searching the buffer.
+        self._next_position = 0
+        self._keyframe_index = KeyframeIndex()
         self.buffersize = buffersize
         self.outputtofile = outputtofile
 
@@ -39,12 +56,19 @@ class CircularOutput(FileOutput):
         with self._lock:
             self._buffersize = value
             self._circular = collections.deque(maxlen=value)
+            self.buffered_bytes = 0
+            self._keyframe_index.clear()
+
+    @property
+    def needs_bytes(self):
+        """Frames that are kept in the buffer are copied"""
+        return False
 
     def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
         """Write frame to circular buffer
 
         :param frame: Frame
-        :type frame: bytes
+        :type frame: bytes or memoryview
         :param keyframe: Whether frame is a keyframe, defaults to True
         :type keyframe: bool, optional
         :param timestamp: Timestamp of frame
@@ -52,40 +76,100 @@ class CircularOutput(FileOutput):
         """
         if audio:
             raise RuntimeError("CircularOutput does not support audio")
+        packet = EncodedPacket(frame, keyframe, timestamp)
+        self.outputpacket(packet)
+        packet.release()
+
+    def outputpacket(self, packet):
+        """Write an EncodedPacket to the circular buffer, keeping a reference to it rather than a copy
+
+        :param packet: Encoded packet
+        :type packet: EncodedPacket
+        """
+        writing = self._fileoutput is not None and self.recording and self.outputtofile
         with self._lock:
             if self._buffersize == 0:
                 return
-            self._circular += [(frame, keyframe)]
+            if len(self._circular) == self._buffersize:
+                self._evict()
+            if packet.keyframe:
+                self._keyframe_index.add(self._next_position, packet.timestamp or 0)
+            self._circular.append(packet.retain())
+            self._next_position += 1
+            self.buffered_bytes += len(packet)
+            if not writing:
+                while self._over_budget():
+                    self._evict()
         """Output frame to file"""
-        if self._fileoutput is not None and self.recording and self.outputtofile:
+        if writing:
+            oldest = None
             if self._firstframe:
-                keyframe = False
+                # Jump straight to the keyframe to start from, discarding everything before it.
                 with self._lock:
-                    for _ in range(len(self._circular)):
-                        frame, keyframe = self._circular.popleft()
-                        if keyframe:
-                            break
-                if keyframe:
-                    self._write(frame, timestamp)
+                    if self.preroll_ms is None or packet.timestamp is None:
+                        position = self._keyframe_index.seek()
+                    else:
+                        position = self._keyframe_index.seek(packet.timestamp - self.preroll_ms * 1000)
+                    if position is None:
+                        skipped = [self._popleft() for _ in range(len(self._circular))]
+                    else:
+                        skipped = [self._popleft() for _ in range(position - self._oldest_position())]
+                        oldest = self._popleft()
+                for p in skipped:
+                    p.release()
+                if oldest is not None:
                     self._firstframe = False
             else:
                 with self._lock:
-                    frame, keyframe = self._circular.popleft()
-                self._write(frame, timestamp)
+                    oldest = self._popleft()
+            if oldest is not None:
+                # Frames that don't fit in the buffer are written out early rather than being lost.
+                packets = [oldest]
+                with self._lock:
+                    while self._over_budget():
+                        packets.append(self._popleft())
+                self._write_many([p.data for p in packets], [packet.timestamp] + [None] * (len(packets) - 1))
+                for p in packets:
+                    p.release()
+
+    def _over_budget(self):
+        return self.max_bytes is not None and self.buffered_bytes > self.max_bytes and len(self._circular) > 1
+
+    def _oldest_position(self):
+        return self._next_position - len(self._circular)
+
+    def _popleft(self):
+        oldest = self._circular.popleft()
+        self.buffered_bytes -= len(oldest)
+        self._keyframe_index.trim(self._oldest_position())
+        return oldest
+
+    def _evict(self):
+        # Discard the oldest frame in the buffer. Called with the lock held.
+        oldest = self._popleft()
+        self.evicted_frames += 1
+        self.evicted_bytes += len(oldest)
+        oldest.release()
 
     def stop(self):
         """Close file handle and prevent recording"""
         if not self.recording or self._fileoutput is None:
             return
         with self._lock:
-            while self._circular:
-                frame, keyframe = self._circular.popleft()
-                if self._firstframe:
-                    if keyframe:
-                        self._write(frame)
-                        self._firstframe = False
-                else:
-                    self._write(frame)
+            packets = list(self._circular)
+            self._circular.clear()
+            self.buffered_bytes = 0
+            self._keyframe_index.clear()
+        if self._firstframe:
+            packets_from_keyframe = packets[next((i for i, p in enumerate(packets) if p.keyframe), len(packets)) :]
+        else:
+            packets_from_keyframe = packets
+        if packets_from_keyframe:
+            self._firstframe = False
+            # Everything still in the buffer goes out together.
+            self._write_many([p.data for p in packets_from_keyframe], [None] * len(packets_from_keyframe))
+        for p in packets:
+            p.release()
         self.recording = False
         self._firstframe = False
         self.close()
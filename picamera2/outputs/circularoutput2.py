@@ -1,11 +1,29 @@
 """Circular buffer"""
 
 import collections
+import itertools
 from threading import Lock
 
+from .encoded_packet import EncodedPacket
+from .keyframe_index import KeyframeIndex
 from .output import Output
 
 
+class _Extraction:
+    """An output that is being sent frames from the circular buffer"""
+
+    __slots__ = ("output", "live", "position", "first_frame", "time_offset", "resync")
+
+    def __init__(self, output, live):
+        self.output = output
+        # Live outputs are sent each frame as it arrives, others when it leaves the buffer.
+        self.live = live
+        self.position = None
+        self.first_frame = True
+        self.time_offset = 0
+        self.resync = False
+
+
 class CircularOutput2(Output):
     """
     Circular buffer implementation, much like CircularOutput, but for general outputs.
@@ -16,15 +34,31 @@ class CircularOutput2(Output):
     Once the CircularOutput2 has been started, use the open_output method to start start recording
     a new output, and use close_output when finished. If the output has not been closed when the
     circular buffer is stopped, then the remainder of the buffer will be flush into the output.
+    Several outputs may be open at once, and an output can instead be given a pre-roll, in which
+    case it starts from the keyframe before that point and is then kept up to date with the camera.
+
+    The buffer can also be limited to max_bytes of encoded data. When it grows beyond that, whole
+    GOPs (a keyframe and the frames that follow it) are removed from the front of the buffer, so
+    that what remains still starts with a keyframe. If a SpillRing is given, these GOPs are moved
+    into it rather than being discarded, and are flushed out ahead of the frames still in memory.
     """
 
-    def __init__(self, pts=None, buffer_duration_ms=5000):
-        """Create a CircularOutput2."""
+    # Most frames copied for an output catching up with the buffer each time the lock is taken.
+    COPY_BATCH = 32
+
+    def __init__(self, pts=None, buffer_duration_ms=5000, max_bytes=None, spill=None):
+        """Create a CircularOutput2.
+
+        :param pts: File to write timestamps to, defaults to None
+        :param buffer_duration_ms: Duration of the buffer in ms, defaults to 5000
+        :param max_bytes: Most encoded data to keep in memory, defaults to None (no limit)
+        :param spill: SpillRing to move older GOPs into when max_bytes is exceeded, defaults to None
+        """
         super().__init__(pts=pts)
         # A note on locking. The lock is principally to protect outputframe, which is called by
         # the background encoder thread. Applications are going to call things like open_output,
         # close_output, start and stop. These only grab that lock for a short period of time to
-        # manipulate _output, which controls whether outputframe will do anything.
+        # manipulate _extractions, which controls whether outputframe will send frames anywhere.
         # THe application API does not have it's own lock, because there doesn't seem to be a
         # need to drive it from different threads (though we could add one if necessary).
         self._lock = Lock()
@@ -32,10 +66,22 @@ class CircularOutput2(Output):
             raise RuntimeError("buffer_duration_ms may not be negative")
         self._buffer_duration_ms = buffer_duration_ms
         self._circular = collections.deque()
-        self._output = None
+        self.max_bytes = max_bytes
+        self._spill = spill
+        # Spilled frames are all older than those in _circular, as (offset, length, keyframe, timestamp).
+        self._spilled = collections.deque()
+        # Every frame gets the next position, and the buffer always holds an unbroken run of them.
+        self._next_position = 0
+        self._keyframe_index = KeyframeIndex()
+        self._last_timestamp = None
+        self.buffered_bytes = 0
+        self.spilled_bytes = 0
+        self._keyframes = 0
+        self._spilled_keyframes = 0
+        self.evicted_gops = 0
+        self.evicted_bytes = 0
+        self._extractions = []
         self._streams = []
-        self._first_frame = True
-        self._time_offset = 0
 
     @property
     def buffer_duration_ms(self):
@@ -48,64 +94,290 @@ class CircularOutput2(Output):
         with self._lock:
             self._buffer_duration_ms = value
 
-    def open_output(self, output):
-        """Open a new output object and start writing to it."""
-        if self._output:
-            raise RuntimeError("Underlying output must be closed first")
+    @property
+    def gops(self):
+        """Returns the number of GOPs in the buffer, including any that have been spilled"""
+        return self._keyframes + self._spilled_keyframes
+
+    @property
+    def needs_bytes(self):
+        """Frames that are kept in the buffer are copied"""
+        return False
+
+    def open_output(self, output, preroll_ms=None):
+        """Open a new output object and start writing to it.
+
+        With no preroll_ms, the output is sent frames as they leave the buffer, so it starts with
+        the oldest frames and stays buffer_duration_ms behind the camera. Otherwise it starts from
+        the last keyframe at least preroll_ms before the newest frame, and is then sent each new
+        frame as it arrives. Other outputs may be open at the same time.
+
+        :param output: The output to write to
+        :param preroll_ms: How much of the buffer to start with, defaults to None (all of it)
+        """
+        if any(extraction.output is output for extraction in self._extractions):
+            raise RuntimeError("Output is already open")
 
         output.start()
         # Some outputs (PyavOutput) may need to know about the encoder's streams.
         for encoder_stream, codec, kwargs in self._streams:
             output._add_stream(encoder_stream, codec, **kwargs)
 
-        # Now it's OK for the background thread to output frames.
+        extraction = _Extraction(output, preroll_ms is not None)
+        # Now it's OK for the background thread to output frames. Live outputs only get them once
+        # they've caught up with the camera, which happens here, mostly without holding the lock.
         with self._lock:
-            self._output = output
-            self._first_frame = True
+            if extraction.live:
+                timestamp = None if self._last_timestamp is None else self._last_timestamp - preroll_ms * 1000
+                extraction.position = self._keyframe_index.seek(timestamp)
+                if extraction.position is None:
+                    extraction.position = self._next_position
+            self._extractions = self._extractions + [extraction]
+        while extraction.live:
+            with self._lock:
+                entries = self._copy_from(extraction)
+                if not entries:
+                    extraction.position = None
+                    break
+            self._deliver(extraction, entries)
+            self._release(entries)
 
-    def close_output(self):
-        """Close an output object."""
-        if not self._output:
+    def close_output(self, output=None):
+        """Close an output object, or all of them if none is given."""
+        closing = [e for e in self._extractions if output is None or e.output is output]
+        if not closing:
             raise RuntimeError("No underlying output has been opened")
 
         # After this, we guarantee that the background thread will never use the output.
-        output = self._output
         with self._lock:
-            self._output = None
+            self._extractions = [e for e in self._extractions if e not in closing]
+
+        for extraction in closing:
+            extraction.output.stop()
+
+    @staticmethod
+    def _size(frame, packet):
+        if frame is not None:
+            return len(frame)
+        return getattr(packet, "size", 0)
+
+    def _append(self, entry):
+        frame, keyframe, timestamp, packet, audio = entry
+        self._circular.append(entry)
+        self.buffered_bytes += self._size(frame, packet)
+        if not audio:
+            if keyframe:
+                self._keyframes += 1
+                self._keyframe_index.add(self._next_position, timestamp)
+            self._last_timestamp = timestamp
+        self._next_position += 1
+
+    def _oldest_position(self):
+        return self._next_position - len(self._spilled) - len(self._circular)
+
+    def _copy_from(self, extraction):
+        # Return new references to at most COPY_BATCH frames from an extraction's position onwards,
+        # advancing it, so that catching up with a long buffer never holds the lock for long. Only
+        # the frames being returned are visited, and spilled ones are copied out of the ring.
+        oldest = self._oldest_position()
+        if extraction.position < oldest:
+            # It fell so far behind that frames were lost, so wait for another keyframe.
+            extraction.position = oldest
+            extraction.resync = True
+        start = extraction.position - oldest
+        count = min(self.COPY_BATCH, self._next_position - extraction.position)
+        extraction.position += count
+        entries = []
+        spilled = len(self._spilled)
+        if start < spilled:
+            for offset, length, keyframe, timestamp in itertools.islice(self._spilled, start, min(start + count, spilled)):
+                with self._spill.view(offset, length) as view:
+                    entries.append((EncodedPacket(bytes(view), keyframe, timestamp), keyframe, timestamp, None, False))
+            count -= len(entries)
+            start = spilled
+        for entry in self._slice_circular(start - spilled, count):
+            if isinstance(entry[0], EncodedPacket):
+                entry[0].acquire()
+            entries.append(entry)
+        return entries
 
-        output.stop()
+    def _slice_circular(self, start, count):
+        # Walk the deque from whichever end is nearer, as indexing into the middle of one is slow.
+        after = len(self._circular) - start - count
+        if start <= after:
+            return list(itertools.islice(self._circular, start, start + count))
+        return list(itertools.islice(reversed(self._circular), after, after + count))[::-1]
 
-    def _flush(self, timestamp_now, output):
-        # Flush out anything that is time-expired compared to timestamp_now.
-        # If timestamp_now is None, flush everything.
-        while self._circular and (front := self._circular[0]):
-            frame, keyframe, timestamp, packet, audio = front
+    @staticmethod
+    def _release(entries):
+        for entry in entries:
+            if isinstance(entry[0], EncodedPacket):
+                entry[0].release()
+
+    def _front(self):
+        # The oldest entry in the buffer, spilled or not.
+        if self._spilled:
+            _, _, keyframe, timestamp = self._spilled[0]
+            return None, keyframe, timestamp, None, False
+        return self._circular[0] if self._circular else None
+
+    def _popleft(self):
+        # Remove the oldest entry. Spilled frames come back as packets that view the spill ring,
+        # and which must be released before anything more is written to it.
+        if self._spilled:
+            offset, length, keyframe, timestamp = self._spilled.popleft()
+            self.spilled_bytes -= length
+            self._spilled_keyframes -= keyframe
+            view = self._spill.view(offset, length)
+            self._spill.free(offset, length)
+            return EncodedPacket(view, keyframe, timestamp, release=view.release), keyframe, timestamp, None, False
+        return self._popleft_memory()
+
+    def _popleft_memory(self):
+        entry = self._circular.popleft()
+        frame, keyframe, _, packet, audio = entry
+        self.buffered_bytes -= self._size(frame, packet)
+        if keyframe and not audio:
+            self._keyframes -= 1
+        return entry
+
+    def _flush(self, timestamp_now, extractions):
+        # Flush out anything that is time-expired compared to timestamp_now, sending it to the outputs
+        # that aren't live. If timestamp_now is None, flush everything.
+        expired = []
+        while (front := self._front()) is not None:
+            _, keyframe, timestamp, _, audio = front
 
             if timestamp_now and timestamp_now - timestamp < self.buffer_duration_ms * 1000:
                 break
 
             # We need to drop this entry, writing it out if we can.
-            self._circular.popleft()
+            expired.append(self._popleft())
+
+        if expired:
+            for extraction in extractions:
+                if not extraction.live:
+                    self._deliver(extraction, expired)
+            self._release(expired)
+            self._keyframe_index.trim(self._oldest_position())
 
+    @staticmethod
+    def _deliver(extraction, entries):
+        # Runs of video frames are sent to the output together, so that files can write them in one go.
+        output = extraction.output
+        pending = []
+        for frame, keyframe, timestamp, packet, audio in entries:
             if keyframe and not audio:
-                if self._first_frame:
-                    self._time_offset = timestamp
-                self._first_frame = False
+                if extraction.first_frame:
+                    extraction.time_offset = timestamp
+                extraction.first_frame = False
+                extraction.resync = False
 
-            if not self._first_frame and output:
-                new_timestamp = timestamp - self._time_offset
+            if not extraction.first_frame and not extraction.resync:
+                new_timestamp = timestamp - extraction.time_offset
                 if new_timestamp >= 0:
-                    output.outputframe(frame, keyframe, new_timestamp, packet, audio)
+                    if isinstance(frame, EncodedPacket):
+                        pending.append(EncodedPacket(frame.data, keyframe, new_timestamp))
+                    else:
+                        CircularOutput2._send(pending, output)
+                        output.outputframe(frame, keyframe, new_timestamp, packet, audio)
+        CircularOutput2._send(pending, output)
+
+    @staticmethod
+    def _send(pending, output):
+        if pending:
+            output.outputpackets(pending)
+            pending.clear()
+
+    def _evict(self):
+        # Bring the buffer back within max_bytes by removing whole GOPs from the front of it. The
+        # GOP that is still being recorded is never removed, so that what follows stays decodable.
+        removed = False
+        while self.max_bytes is not None and self.buffered_bytes > self.max_bytes:
+            front_is_keyframe = self._circular[0][1] and not self._circular[0][4]
+            if self._keyframes - front_is_keyframe < 1:
+                break
+            gop = [self._popleft_memory()]
+            while not (self._circular[0][1] and not self._circular[0][4]):
+                gop.append(self._popleft_memory())
+            spillable = self._spill is not None and all(isinstance(entry[0], EncodedPacket) for entry in gop)
+            if not (spillable and self._spill_gop(gop)):
+                # Anything already spilled would no longer run on into what's in memory, so it goes too.
+                while self._spilled:
+                    self._drop_spilled_gop(len(self._spilled))
+                self.evicted_gops += 1
+                self.evicted_bytes += sum(self._size(entry[0], entry[3]) for entry in gop)
+            self._release(gop)
+            removed = True
+        if removed:
+            self._keyframe_index.trim(self._oldest_position())
+
+    def _spill_gop(self, gop):
+        # Copy a GOP into the spill ring, making room by evicting the oldest spilled GOPs.
+        if sum(len(entry[0]) for entry in gop) > self._spill.size:
+            return False
+        older = len(self._spilled)
+        for frame, keyframe, timestamp, _, _ in gop:
+            while (offset := self._spill.write(frame.data)) is None:
+                if older == 0:
+                    # Only (part of) this GOP is in the ring, and the rest still doesn't fit.
+                    self._drop_spilled(len(self._spilled))
+                    return False
+                older -= self._drop_spilled_gop(older)
+            self._spilled.append((offset, len(frame), keyframe, timestamp))
+            self.spilled_bytes += len(frame)
+            self._spilled_keyframes += keyframe
+        return True
+
+    def _drop_spilled_gop(self, limit):
+        # Evict the oldest spilled GOP, but nothing beyond the first limit spilled frames.
+        count = 1
+        while count < limit and not self._spilled[count][2]:
+            count += 1
+        self.evicted_gops += 1
+        self.evicted_bytes += self._drop_spilled(count)
+        return count
+
+    def _drop_spilled(self, count):
+        dropped = 0
+        for _ in range(count):
+            offset, length, keyframe, _ = self._spilled.popleft()
+            self._spill.free(offset, length)
+            self.spilled_bytes -= length
+            self._spilled_keyframes -= keyframe
+            dropped += length
+        return dropped
 
     def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
         """Write frame to circular buffer"""
+        if packet is None and not audio:
+            encoded_packet = EncodedPacket(frame, keyframe, timestamp)
+            self.outputpacket(encoded_packet)
+            encoded_packet.release()
+            return
+        with self._lock:
+            if self._buffer_duration_ms == 0 or not self.recording:
+                return
+
+            # Add this new frame to the buffer, send it to any live outputs and flush anything that is now expired.
+            self._add((frame, keyframe, timestamp, packet, audio))
+
+    def outputpacket(self, packet):
+        """Write an EncodedPacket to the circular buffer, keeping a reference to it rather than a copy"""
         with self._lock:
             if self._buffer_duration_ms == 0 or not self.recording:
                 return
 
-            # Add this new frame to the buffer and flush anything that is now expired.
-            self._circular.append((frame, keyframe, timestamp, packet, audio))
-            self._flush(timestamp, self._output)
+            self._add((packet.retain(), packet.keyframe, packet.timestamp, None, False))
+
+    def _add(self, entry):
+        # Called with the lock held.
+        self._append(entry)
+        for extraction in self._extractions:
+            if extraction.live and extraction.position is None:
+                self._deliver(extraction, (entry,))
+        self._flush(entry[2], self._extractions)
+        self._evict()
 
     def start(self):
         """Start recording in the circular buffer."""
@@ -116,18 +388,19 @@ class CircularOutput2(Output):
 
     def stop(self):
         """Close file handle and stop recording"""
-        output = self._output
+        extractions = self._extractions
         with self._lock:
             if not self.recording:
                 raise RuntimeError("Circular output was not started")
             self.recording = False
-            self._output = None
+            self._extractions = []
 
-        # At this point the background thread can't be using the circular buffer or the output,
+        # At this point the background thread can't be using the circular buffer or the outputs,
         # so we can flush everything out.
-        if output:
-            self._flush(None, output)
-            output.stop()
+        if extractions:
+            self._flush(None, extractions)
+            for extraction in extractions:
+                extraction.output.stop()
 
     def _add_stream(self, encoder_stream, codec_name, **kwargs):
         # Notice the PyavOutput of a stream that will be sending it packets to write out. It will need
@@ -0,0 +1,85 @@
+"""Encoded frames that can be shared between outputs without copying"""
+
+import threading
+
+
+class EncodedPacket:
+    """An encoded frame, with its keyframe flag and timestamp, that outputs can share by reference.
+
+    The data is either bytes, which the packet owns, or a memoryview (or other buffer) that is
+    borrowed, normally from the encoder. A borrowed buffer is returned to the encoder (by calling
+    the release function) once every reference to the packet has been released, so outputs may
+    acquire a packet to use it briefly beyond the end of outputpacket, but anything kept for
+    longer must use retain(), which never holds on to an encoder's buffer.
+    """
+
+    __slots__ = ("data", "keyframe", "timestamp", "_release", "_ref_count", "_lock", "_bytes", "_retained")
+
+    def __init__(self, data, keyframe=True, timestamp=None, release=None):
+        """Make a packet
+
+        :param data: The encoded frame, as bytes or a memoryview
+        :param keyframe: Whether the frame is a keyframe, defaults to True
+        :param timestamp: Timestamp of the frame in microseconds
+        :param release: Function to call when the last reference is released
+        """
+        self.data = data
+        self.keyframe = keyframe
+        self.timestamp = timestamp
+        self._release = release
+        self._ref_count = 1
+        self._lock = threading.Lock()
+        self._bytes = data if isinstance(data, bytes) else None
+        self._retained = None
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def borrowed(self):
+        """Whether the data is borrowed, and so can't be kept once the packet is released"""
+        return not isinstance(self.data, bytes)
+
+    def acquire(self):
+        """Take another reference to the packet, which must be released later"""
+        with self._lock:
+            if self._ref_count == 0:
+                raise RuntimeError("EncodedPacket: acquiring packet with ref_count 0")
+            self._ref_count += 1
+        return self
+
+    def release(self):
+        """Release a reference to the packet, returning a borrowed buffer once there are none left"""
+        with self._lock:
+            self._ref_count -= 1
+            if self._ref_count < 0:
+                raise RuntimeError("EncodedPacket: packet now has negative ref_count")
+            if self._ref_count > 0:
+                return
+            release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    def tobytes(self):
+        """Return the data as bytes, copying it (just once, however many times this is called) if need be"""
+        if self._bytes is None:
+            with self._lock:
+                if self._bytes is None:
+                    self._bytes = bytes(self.data)
+        return self._bytes
+
+    def retain(self):
+        """Return a reference to a packet with the same contents that is safe to keep indefinitely
+
+        A packet that owns its data is simply acquired. A borrowed one is copied, but only the
+        first time, so several outputs retaining the same packet all share one copy.
+        """
+        if not self.borrowed:
+            return self.acquire()
+        with self._lock:
+            if self._retained is None:
+                if self._bytes is None:
+                    self._bytes = bytes(self.data)
+                # This packet's own reference to the copy is never released, which is harmless as it owns its data.
+                self._retained = EncodedPacket(self._bytes, self.keyframe, self.timestamp)
+        return self._retained.acquire()
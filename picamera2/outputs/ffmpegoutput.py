@@ -118,6 +118,11 @@ class FfmpegOutput(Output):
             # This seems to be necessary to get the subprocess to clean up fully.
             gc.collect()
 
+    @property
+    def needs_bytes(self):
+        """Frames are written straight into FFmpeg's pipe"""
+        return False
+
     def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
         if audio:
             raise RuntimeError("FfmpegOutput does not support audio packets from Picamera2")
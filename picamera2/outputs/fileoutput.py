@@ -1,12 +1,33 @@
 """Writes frames to a file"""
 
 import io
+import os
 import socket
 import types
 from pathlib import Path
 
 from .output import Output
 
+_COPYING_FILES = (io.BufferedWriter, io.BufferedRandom, io.BytesIO)
+# Files (and sockets) of exactly these types can be written directly with os.writev.
+_WRITEV_FILES = (io.BufferedWriter, io.BufferedRandom)
+try:
+    _IOV_MAX = os.sysconf("SC_IOV_MAX")
+except (ValueError, OSError):
+    _IOV_MAX = 1024
+
+
+def _writev(fd, buffers):
+    """Write all the buffers to fd, in as few system calls as possible."""
+    buffers = list(buffers)
+    while buffers:
+        written = os.writev(fd, buffers[:_IOV_MAX])
+        # Drop whatever has been written completely, and the start of anything written partially.
+        while buffers and written >= len(buffers[0]):
+            written -= len(buffers.pop(0))
+        if written:
+            buffers[0] = memoryview(buffers[0])[written:]
+
 
 class FileOutput(Output):
     """File handling functionality for encoders"""
@@ -57,6 +78,15 @@ class FileOutput(Output):
             ):
                 self._split = True
 
+    @property
+    def needs_bytes(self):
+        """Whether frames must stay valid after outputframe returns
+
+        Ordinary files, sockets and BytesIO objects have finished with the data when write
+        returns, but other file-like objects might keep it.
+        """
+        return self._fileoutput is not None and not isinstance(self._fileoutput, _COPYING_FILES)
+
     @property
     def connectiondead(self):
         """Return callback"""
@@ -79,7 +109,7 @@ class FileOutput(Output):
         """Outputs frame from encoder
 
         :param frame: Frame
-        :type frame: bytes
+        :type frame: bytes or memoryview
         :param keyframe: Whether frame is a keyframe, defaults to True
         :type keyframe: bool, optional
         :param timestamp: Timestamp of frame
@@ -95,6 +125,21 @@ class FileOutput(Output):
                     self._firstframe = False
             self._write(frame, timestamp)
 
+    def outputpackets(self, packets):
+        """Outputs a list of EncodedPackets, writing them all at once where possible
+
+        :param packets: Encoded packets
+        :type packets: list
+        """
+        if self._fileoutput is None or not self.recording:
+            return
+        if self._firstframe:
+            packets = packets[next((i for i, packet in enumerate(packets) if packet.keyframe), len(packets)) :]
+            if not packets:
+                return
+            self._firstframe = False
+        self._write_many([packet.data for packet in packets], [packet.timestamp for packet in packets])
+
     def stop(self):
         """Close file handle and prevent recording"""
         super().stop()
@@ -130,3 +175,19 @@ class FileOutput(Output):
             self.dead = True
             if self._connectiondead is not None:
                 self._connectiondead(e)
+
+    def _write_many(self, frames, timestamps):
+        # Ordinary files and sockets get a single writev, rather than a write and flush per frame.
+        if self._split or type(self._fileoutput) not in _WRITEV_FILES:
+            for frame, timestamp in zip(frames, timestamps):
+                self._write(frame, timestamp)
+            return
+        try:
+            self._fileoutput.flush()
+            _writev(self._fileoutput.fileno(), frames)
+            for timestamp in timestamps:
+                self.outputtimestamp(timestamp)
+        except (ConnectionResetError, ConnectionRefusedError, BrokenPipeError, ValueError) as e:
+            self.dead = True
+            if self._connectiondead is not None:
+                self._connectiondead(e)
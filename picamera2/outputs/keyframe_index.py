@@ -0,0 +1,59 @@
+"""Index of the keyframes in a circular buffer"""
+
+import bisect
+
+
+class KeyframeIndex:
+    """Positions and timestamps of the keyframes in a circular buffer, oldest first
+
+    Frames in the buffer are identified by a position that increases by one for every frame
+    ever added, so positions stay valid as old frames are removed from the front. Finding the
+    keyframe to start a recording from is then a binary search, rather than a walk through the
+    buffer.
+    """
+
+    def __init__(self):
+        self._positions = []
+        self._timestamps = []
+        self._start = 0  # entries before this have been trimmed, but not yet deleted
+
+    def __len__(self):
+        return len(self._positions) - self._start
+
+    def add(self, position, timestamp):
+        """Record a keyframe, which must be newer than any already in the index"""
+        self._positions.append(position)
+        self._timestamps.append(timestamp)
+
+    def trim(self, position):
+        """Forget keyframes before the given position, once they have left the buffer"""
+        self._start = bisect.bisect_left(self._positions, position, self._start)
+        # Deleting from the front of a list is slow, so only do it once in a while.
+        if self._start > 64 and self._start * 2 > len(self._positions):
+            del self._positions[: self._start]
+            del self._timestamps[: self._start]
+            self._start = 0
+
+    def clear(self):
+        """Forget all the keyframes"""
+        self._positions.clear()
+        self._timestamps.clear()
+        self._start = 0
+
+    def seek(self, timestamp=None):
+        """Return the position of the last keyframe at or before timestamp
+
+        If every keyframe is later than that, or timestamp is None, the oldest keyframe is
+        returned instead. None is returned if there are no keyframes at all.
+        """
+        if len(self) == 0:
+            return None
+        if timestamp is None:
+            return self._positions[self._start]
+        index = bisect.bisect_right(self._timestamps, timestamp, self._start) - 1
+        return self._positions[max(index, self._start)]
+
+    def next(self, position):
+        """Return the position of the first keyframe at or after the given one, or None"""
+        index = bisect.bisect_left(self._positions, position, self._start)
+        return self._positions[index] if index < len(self._positions) else None
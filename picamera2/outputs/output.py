@@ -23,17 +23,49 @@ class Output:
         """Stop recording"""
         self.recording = False
 
+    @property
+    def needs_bytes(self):
+        """Whether frames passed to outputframe must stay valid after it returns
+
+        Encoders may pass a memoryview of their own buffer, rather than a copy, to outputs that
+        return False here, and the buffer is reused once outputframe returns. Outputs that keep
+        frames, or hand them to other threads, should leave this True (or copy what they keep).
+        """
+        return True
+
     def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
         """Outputs frame from encoder
 
         :param frame: Frame
-        :type frame: bytes
+        :type frame: bytes or memoryview
         :param keyframe: Whether frame is a keyframe, defaults to True
         :type keyframe: bool, optional
         :param timestamp: Timestamp of frame
         :type timestamp: int
         """
 
+    def outputpacket(self, packet):
+        """Outputs an EncodedPacket from an encoder
+
+        By default this passes the packet's data to outputframe, as bytes if needs_bytes is True
+        (sharing one copy between all the outputs that need it). Outputs that can keep packets
+        by reference should override this, using packet.retain() for anything they keep.
+
+        :param packet: Encoded packet
+        :type packet: EncodedPacket
+        """
+        frame = packet.tobytes() if self.needs_bytes else packet.data
+        self.outputframe(frame, packet.keyframe, packet.timestamp)
+
+    def outputpackets(self, packets):
+        """Outputs a list of EncodedPackets, which some outputs can write out together
+
+        :param packets: Encoded packets
+        :type packets: list
+        """
+        for packet in packets:
+            self.outputpacket(packet)
+
     def outputtimestamp(self, timestamp):
         """Output timestamp to file
 
@@ -60,6 +60,11 @@ class PyavOutput(Output):
             self._streams = {}
             self._seen_keyframe = {}
 
+    @property
+    def needs_bytes(self):
+        """Frames are copied into PyAv packets"""
+        return False
+
     def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
         """Output an encoded frame using PyAv."""
         if self.recording and self._container:
@@ -0,0 +1,75 @@
+"""A ring of encoded frames in a memory-mapped file"""
+
+import mmap
+import tempfile
+
+
+class SpillRing:
+    """A fixed-size ring buffer for encoded frames, in a memory-mapped file
+
+    Circular outputs can move their oldest frames here, out of memory, when they reach their
+    byte budget. Frames must be freed in the order in which they were written. The file is a
+    temporary one unless a path is given, and the kernel pages it out as necessary, so the
+    ring's size is limited by disk space rather than by RAM.
+    """
+
+    def __init__(self, size=64 << 20, path=None):
+        """Create the ring
+
+        :param size: Size of the ring in bytes, defaults to 64MB
+        :type size: int, optional
+        :param path: File to use, defaults to an anonymous temporary file
+        :type path: str, optional
+        """
+        if size <= 0:
+            raise RuntimeError("SpillRing size must be positive")
+        self._file = tempfile.TemporaryFile() if path is None else open(path, "w+b")
+        self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        self.size = size
+        self.used = 0
+        self._head = 0  # where the next frame goes
+        self._tail = 0  # where the oldest frame starts
+        self._end = size  # where the data stops, when it has wrapped round to the start
+        self._wrapped = False
+
+    def write(self, data):
+        """Copy data into the ring, returning its offset, or None if there isn't room"""
+        length = len(data)
+        if self.used == 0:
+            self._head = self._tail = 0
+            self._wrapped = False
+        if not self._wrapped and self.size - self._head >= length:
+            offset = self._head
+        elif not self._wrapped and self._tail >= length:
+            # Wrap round to the start, leaving the space at the end unused for now.
+            self._end = self._head
+            self._wrapped = True
+            offset = 0
+        elif self._wrapped and self._tail - self._head >= length:
+            offset = self._head
+        else:
+            return None
+        self._mmap[offset : offset + length] = data
+        self._head = offset + length
+        self.used += length
+        return offset
+
+    def view(self, offset, length):
+        """Return a memoryview of a frame in the ring, which must be released before the ring is closed"""
+        return memoryview(self._mmap)[offset : offset + length]
+
+    def free(self, offset, length):
+        """Free the oldest frame in the ring"""
+        if offset != self._tail:
+            raise RuntimeError("SpillRing frames must be freed in order")
+        self._tail = offset + length
+        self.used -= length
+        if self._wrapped and self._tail >= self._end:
+            self._tail = 0
+            self._wrapped = False
+
+    def close(self):
+        """Close the ring, and its file"""
+        self._mmap.close()
+        self._file.close()
@@ -44,16 +44,28 @@ class SplittableOutput(Output):
         if old_output:
             old_output.stop()
 
-    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+    @property
+    def needs_bytes(self):
+        return any(output.needs_bytes for output in (self._output, self._new_output) if output)
+
+    def _switch_output(self, keyframe, audio):
         # Audio frames probably always say they're keyframes, but we must wait for a video one.
         if self._new_output and (not self._wait_for_keyframe or (not audio and keyframe)):
             self._split_done.set()
             # split_output will close the old output.
             self._output = self._new_output
             self._new_output = None
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        self._switch_output(keyframe, audio)
         if self._output:
             self._output.outputframe(frame, keyframe, timestamp, packet, audio)
 
+    def outputpacket(self, packet):
+        self._switch_output(packet.keyframe, False)
+        if self._output:
+            self._output.outputpacket(packet)
+
     def start(self):
         super().start()
         if self._output:
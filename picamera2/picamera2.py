@@ -3,6 +3,7 @@
 
 import atexit
 import contextlib
+import hashlib
 import json
 import logging
 import os
@@ -11,30 +12,39 @@ import sys
 import tempfile
 import threading
 import time
+from collections import deque
 from collections.abc import Callable
 from enum import Enum
 from functools import partial
-from typing import Any, Generic, Literal, Optional, TypedDict, TypeVar, Union, cast, overload
+from typing import TYPE_CHECKING, Any, Generic, Literal, Optional, TypedDict, TypeVar, Union, cast, overload
 
 import libcamera
 import numpy as np
 from libcamera import controls
 from numpy.typing import NDArray
-from PIL import Image
 
 import picamera2.formats as formats
 import picamera2.platform as Platform
+import picamera2.previews as previews
 import picamera2.utils as utils
 from picamera2.allocators import DmaAllocator
-from picamera2.encoders import Encoder, H264Encoder, MJPEGEncoder, Quality
-from picamera2.outputs import FileOutput, PyavOutput
-from picamera2.previews import DrmPreview, NullPreview, QtGlPreview, QtPreview
+from picamera2.encoders import Encoder, Quality
 
+from .array_pool import ArrayPool
+from .burst import Burst
 from .configuration import CameraConfiguration
+from .configuration_cache import ConfigurationCache
 from .controls import Controls
+from .frame_stream import FrameStream
 from .job import Job
+from .pipeline import RequestPipeline
 from .request import CompletedRequest, Helpers
 from .sensor_format import SensorFormat
+from .sensor_modes import SensorModes, cache_directory, cache_key
+from .tracing import Tracer
+
+if TYPE_CHECKING:
+    from PIL import Image
 
 STILL = libcamera.StreamRole.StillCapture
 RAW = libcamera.StreamRole.Raw
@@ -48,10 +58,23 @@ _log = logging.getLogger(__name__)
 class Preview(Enum):
     """Enum that applications can pass to the start_preview method."""
 
-    NULL = NullPreview
-    DRM = DrmPreview
-    QT = QtPreview
-    QTGL = QtGlPreview
+    NULL = "NullPreview"
+    DRM = "DrmPreview"
+    QT = "QtPreview"
+    QTGL = "QtGlPreview"
+
+    @property
+    def value(self):
+        """The preview class, which is only imported (with pykms, Qt or OpenGL) when it is asked for."""
+        return getattr(previews, self._value_)
+
+    @classmethod
+    def _missing_(cls, value):
+        # Preview(QtGlPreview) still finds the member, as it did when the classes were the values.
+        for member in cls:
+            if getattr(value, "__name__", None) == member._value_ and value is member.value:
+                return member
+        return None
 
 
 class GlobalCameraInfo(TypedDict):
@@ -79,6 +102,7 @@ class CameraManager:
         self.cameras = {}
         self._lock = threading.Lock()
         self._cms = None
+        self._backend = None
 
     def setup(self) -> None:
         self.thread = threading.Thread(target=self.listen, daemon=True)
@@ -88,13 +112,29 @@ class CameraManager:
     @property
     def cms(self) -> libcamera.CameraManager:
         if self._cms is None:
-            self._cms = libcamera.CameraManager.singleton()
+            self._cms = self._backend if self._backend is not None else libcamera.CameraManager.singleton()
         return self._cms
 
     def reset(self) -> None:
         with self._lock:
             self._cms = None
-            self._cms = libcamera.CameraManager.singleton()
+            self._cms = self._backend if self._backend is not None else libcamera.CameraManager.singleton()
+
+    def set_backend(self, backend) -> None:
+        """Use something other than libcamera's camera manager, such as a VirtualCameraManager.
+
+        The backend must behave like libcamera.CameraManager. Pass None to go back to libcamera.
+        """
+        with self._lock:
+            if self.cameras:
+                raise RuntimeError("Cannot change the camera backend while cameras are open")
+            self._backend = backend
+            self._cms = None
+
+    def make_allocator(self):
+        """Make the default allocator for cameras from the current backend."""
+        make_allocator = getattr(self.cms, "make_allocator", None)
+        return make_allocator() if make_allocator is not None else DmaAllocator()
 
     def add(self, index, camera) -> None:
         with self._lock:
@@ -137,8 +177,14 @@ class CameraManager:
             for req in self.cms.get_ready_requests():
                 if req.status == libcamera.Request.Status.Complete and req.cookie != flushid:
                     cams.add(req.cookie)
-                    with self.cameras[req.cookie]._requestslock:
-                        self.cameras[req.cookie]._requests += [CompletedRequest(req, self.cameras[req.cookie])]
+                    camera = self.cameras[req.cookie]
+                    # Appending to a deque is atomic, so the camera's event loop can take requests
+                    # off the other end without any further locking.
+                    completed_request = CompletedRequest(req, camera)
+                    if camera.tracer is not None:
+                        completed_request.trace = camera.tracer.begin(req.metadata[controls.SensorTimestamp])
+                        camera.tracer.stamp(completed_request.trace, "handle_request")
+                    camera._requests.append(completed_request)
             for c in cams:
                 os.write(self.cameras[c].notifyme_w, b"\x00")
 
@@ -325,10 +371,16 @@ class Picamera2:
         if verbose_console is not None:
             _log.warning("verbose_console parameter is no longer used, use Picamera2.set_logging instead")
         tuning_file = None
+        # What the cached sensor modes depend on, besides the camera and libcamera itself.
+        self._tuning_key = None
         if tuning is not None:
             if isinstance(tuning, str):
                 os.environ["LIBCAMERA_RPI_TUNING_FILE"] = tuning
+                self._tuning_key = [tuning]
+                if os.path.isfile(tuning):
+                    self._tuning_key += [os.path.getmtime(tuning), os.path.getsize(tuning)]
             else:
+                self._tuning_key = hashlib.sha1(json.dumps(tuning, sort_keys=True).encode()).hexdigest()
                 tuning_file = tempfile.NamedTemporaryFile('w')
                 json.dump(tuning, tuning_file)
                 tuning_file.flush()  # but leave it open as closing it will delete it
@@ -345,8 +397,7 @@ class Picamera2:
         self._cm.add(camera_num, self)
         self.camera_idx = camera_num
         self.request_lock = threading.Lock()  # global lock used by requests
-        self._requestslock = threading.Lock()
-        self._requests = []
+        self._requests = deque()
         if verbose_console is None:
             verbose_console = int(os.environ.get('PICAMERA2_LOG_LEVEL', '0'))
         self.verbose_console = verbose_console
@@ -373,7 +424,7 @@ class Picamera2:
         # apparently being the principal culprit. Anyway, this seems to prevent the problem.
         atexit.register(self.close)
         # Set Allocator
-        self.allocator = DmaAllocator() if allocator is None else allocator
+        self.allocator = self._cm.make_allocator() if allocator is None else allocator
 
     @property
     def camera_manager(self) -> libcamera.CameraManager:
@@ -386,6 +437,7 @@ class Picamera2:
         self.libcamera_config = {}
         self.streams = []
         self.stream_map = {}
+        self._request_template = None  # what the CompletedRequests for this configuration share
         self.started = False
         self.stop_count = 0
         self.configure_count = 0
@@ -395,13 +447,18 @@ class Picamera2:
         self._encoders = set()
         self.pre_callback = None
         self.post_callback = None
+        self._request_consumers = []
         self.completed_requests = []
         self.lock = threading.Lock()  # protects the _job_list and completed_requests fields
+        self.request_pipeline = RequestPipeline()
+        self._tracer = None
         self._event_loop_running = False
         self._preview_stopped = threading.Event()
         self.camera_properties_ = {}
         self.controls = Controls(self)
-        self.sensor_modes_ = []
+        self.sensor_modes_ = None
+        self.array_pool = ArrayPool()
+        self.configuration_cache = ConfigurationCache(self)
         self._title_fields = []
         self._frame_drops = 0
 
@@ -577,43 +634,47 @@ class Picamera2:
         _log.info("Camera now open.")
 
     @property
-    def sensor_modes(self) -> list[dict[str, Any]]:
+    def sensor_modes(self) -> SensorModes:
         """The available sensor modes
 
-        When called for the first time this will reconfigure the camera
-        in order to read the modes.
+        Each mode is worked out when it is first looked at, which reconfigures the
+        camera in that mode, unless it was saved in the sensor mode cache earlier
+        (see SensorModes). Working out a mode leaves Picamera2 unconfigured, so the
+        camera must be stopped, and configured again afterwards. Use
+        list(picam2.sensor_modes) to work out all of them at once.
         """
-        if self.sensor_modes_:
+        if self.sensor_modes_ is not None:
             return self.sensor_modes_
 
         raw_config = self.camera.generate_configuration([libcamera.StreamRole.Raw])
         raw_formats = raw_config.at(0).formats
-        self.sensor_modes_ = []
-
+        pixel_formats = []
         for pix in raw_formats.pixel_formats:
             name = str(pix)
-            if not formats.is_raw(name):
-                # Not a raw sensor so we can't deduce much about it. Quote the name and carry on.
-                self.sensor_modes_.append({"format": name})
-                continue
-            fmt = SensorFormat(name)
-            all_format = {}
-            all_format["format"] = fmt
-            all_format["unpacked"] = fmt.unpacked
-            all_format["bit_depth"] = fmt.bit_depth
-            for size in raw_formats.sizes(pix):
-                cam_mode = all_format.copy()
-                cam_mode["size"] = (size.width, size.height)
-                temp_config = self.create_preview_configuration(raw={"format": str(pix), "size": cam_mode["size"]})
-                self.configure(temp_config)
-                frameDurationMin = self.camera_controls["FrameDurationLimits"][0]
-                cam_mode["fps"] = round(1e6 / frameDurationMin, 2)
-                _, scaler_crop_max, _ = self.camera_controls['ScalerCrop']
-                cam_mode["crop_limits"] = scaler_crop_max
-                cam_mode["exposure_limits"] = tuple(i for i in self.camera_controls["ExposureTime"] if i != 0)
-                self.sensor_modes_.append(cam_mode)
+            pixel_formats.append((name, [size.to_tuple() for size in raw_formats.sizes(pix)], formats.is_raw(name)))
+        key = cache_key(self.camera.id, self._tuning_key, getattr(self.camera_manager, "version", None))
+        self.sensor_modes_ = SensorModes(pixel_formats, self._probe_sensor_mode, key, cache_directory())
         return self.sensor_modes_
 
+    def _probe_sensor_mode(self, name, size):
+        # Find a raw mode's limits by configuring libcamera (but not the rest of Picamera2) in it,
+        # which leaves Picamera2 unconfigured.
+        if self.started:
+            raise RuntimeError("Camera must be stopped before configuring")
+        temp_config = self.create_preview_configuration(raw={"format": name, "size": size})
+        _, libcamera_config = self._make_validated_config(temp_config)
+        if self.camera.configure(libcamera_config):
+            raise RuntimeError(f"Configuration failed: {temp_config}")
+        limits = {
+            k.name: tuple(utils.convert_from_libcamera_type(value) for value in (v.min, v.max, v.default))
+            for k, v in self.camera.controls.items()
+        }
+        return {
+            "fps": round(1e6 / limits["FrameDurationLimits"][0], 2),
+            "crop_limits": limits["ScalerCrop"][1],
+            "exposure_limits": tuple(i for i in limits["ExposureTime"] if i != 0),
+        }
+
     def _get_raw_modes(self):
         raw_config = self.camera.generate_configuration([libcamera.StreamRole.Raw])
         raw_formats = raw_config.at(0).formats
@@ -713,12 +774,14 @@ class Picamera2:
             return
 
         self.stop()
+        self.request_pipeline.stop_threads()
         # camera.release() now throws an error if it fails.
         self.camera.release()
         self._cm.cleanup(self.camera_idx)
         self.is_open = False
         self.streams = []
         self.stream_map = {}
+        self._request_template = None
         self.camera = None
         self.camera_ctrl_info = {}
         self.camera_config = {}
@@ -730,7 +793,7 @@ class Picamera2:
         os.close(self.notifyme_w)
         # Clean up the allocator
         del self.allocator
-        self.allocator = DmaAllocator()
+        self.allocator = self._cm.make_allocator()
         _log.info('Camera closed successfully.')
 
     @staticmethod
@@ -1164,11 +1227,33 @@ class Picamera2:
         :raises RuntimeError: Failed to configure at runtime
         :raises TypeError: Invalid type for `camera_config` given
         """
+        self._configure(camera_config)
+
+    def _configure(self, camera_config, cache_name=None):
+        # Configure the camera, using the configuration cache if it knows this configuration,
+        # or adding it to the cache under cache_name if that is given.
         if self.started:
             raise RuntimeError("Camera must be stopped before configuring")
 
         initial_config = camera_config
+        requested = None
+        if cache_name is not None:
+            # Configuring fills in parts of the configuration, so remember how it started.
+            cached, requested = None, self.configuration_cache.fingerprint(camera_config)
+        else:
+            cached = self.configuration_cache.lookup(camera_config)
+        if cached is not None:
+            camera_config = cached.make_camera_config()
+            libcamera_config = cached.libcamera_config
+            self.main_index, self.lores_index, self.raw_index = 0, cached.lores_index, cached.raw_index
+            self.libcamera_config = {}
+            self.camera_config = {}
+        else:
+            camera_config, libcamera_config = self._make_validated_config(camera_config)
+        self._apply_config(initial_config, camera_config, libcamera_config, cached, cache_name, requested)
 
+    def _make_validated_config(self, camera_config):
+        # Check the configuration, and turn it into a libcamera configuration that libcamera has validated.
         if isinstance(camera_config, str):
             if camera_config == "preview":
                 camera_config = self.preview_configuration
@@ -1214,7 +1299,9 @@ class Picamera2:
             raise RuntimeError(f"Invalid camera configuration: {camera_config}")
         elif status == libcamera.CameraConfiguration.Status.Adjusted:
             _log.info("Camera configuration has been adjusted!")
+        return camera_config, libcamera_config
 
+    def _apply_config(self, initial_config, camera_config, libcamera_config, cached=None, cache_name=None, requested=None):
         # Configure libcamera.
         if self.camera.configure(libcamera_config):
             raise RuntimeError(f"Configuration failed: {camera_config}")
@@ -1222,12 +1309,16 @@ class Picamera2:
         _log.debug(f"Final configuration: {camera_config}")
 
         # Update the controls and properties list as some of the values may have changed.
-        self.camera_ctrl_info = {}
-        self.camera_properties_ = {}
-        for k, v in self.camera.controls.items():
-            self.camera_ctrl_info[k.name] = (k, v)
-        for k, v in self.camera.properties.items():
-            self.camera_properties_[k.name] = utils.convert_from_libcamera_type(v)
+        if cached is not None:
+            self.camera_ctrl_info = dict(cached.camera_ctrl_info)
+            self.camera_properties_ = dict(cached.camera_properties)
+        else:
+            self.camera_ctrl_info = {}
+            self.camera_properties_ = {}
+            for k, v in self.camera.controls.items():
+                self.camera_ctrl_info[k.name] = (k, v)
+            for k, v in self.camera.properties.items():
+                self.camera_properties_[k.name] = utils.convert_from_libcamera_type(v)
 
         # Record which libcamera stream goes with which of our names.
         self.stream_map = {"main": libcamera_config.at(0).stream}
@@ -1251,21 +1342,46 @@ class Picamera2:
         else:
             self._max_queue_len = 0
 
-        # Allocate all the frame buffers.
+        # Allocate all the frame buffers. Any pooled output arrays may no longer be the right shape.
         self.streams = [stream_config.stream for stream_config in libcamera_config]
-        self.allocator.allocate(libcamera_config, camera_config.get("use_case"))
+        self.array_pool.invalidate()
+        if cached is not None:
+            use_case = cached.use_case
+        elif cache_name is not None:
+            # Warmed configurations keep their buffers under a use case of their own.
+            use_case = self.configuration_cache.use_case()
+        else:
+            use_case = self.configuration_cache.uncached_use_case(camera_config)
+        self.allocator.allocate(libcamera_config, use_case)
 
         # Mark ourselves as configured.
         self.libcamera_config = libcamera_config
         self.camera_config = camera_config
-
-        # Fill in the embedded configuration structures if those were used.
-        if initial_config == "still":
-            self.still_configuration.update(camera_config)
-        elif initial_config == "video":
-            self.video_configuration.update(camera_config)
-        elif isinstance(initial_config, str):
-            self.preview_configuration.update(camera_config)
+        self._request_template = None
+
+        # Fill in the embedded configuration structures if those were used. (A name from the
+        # configuration cache refers to its own configuration, not to one of these.)
+        if cached is None:
+            if initial_config == "still":
+                self.still_configuration.update(camera_config)
+            elif initial_config == "video":
+                self.video_configuration.update(camera_config)
+            elif isinstance(initial_config, str):
+                self.preview_configuration.update(camera_config)
+
+        if cache_name is not None:
+            self.configuration_cache.add(
+                cache_name,
+                requested,
+                camera_config,
+                initial_config,
+                libcamera_config=libcamera_config,
+                lores_index=self.lores_index,
+                raw_index=self.raw_index,
+                camera_ctrl_info=self.camera_ctrl_info,
+                camera_properties=self.camera_properties_,
+                use_case=use_case,
+            )
 
         # Set the controls directly so as to overwrite whatever is there.
         self.controls = Controls(self, controls=self.camera_config['controls'])
@@ -1380,10 +1496,7 @@ class Picamera2:
             # up when the camera is started the next time.
             self._cm.handle_request(self.camera_idx)
             self.started = False
-            with self._requestslock:
-                unseen_requests = self._requests
-                self._requests = []
-            for r in unseen_requests:
+            for r in self._take_requests():
                 r.release()
             while len(self.completed_requests) > 0:
                 self.completed_requests.pop(0).release()
@@ -1408,12 +1521,60 @@ class Picamera2:
         """Set camera controls. These will be delivered with the next request that gets submitted."""
         self.controls.set_controls(controls)
 
+    @property
+    def tracer(self) -> Optional[Tracer]:
+        """The Tracer recording how long frames take to reach each stage, or None (the default) if not tracing."""
+        return self._tracer
+
+    @tracer.setter
+    def tracer(self, value: Optional[Tracer]) -> None:
+        self._tracer = value
+        for encoder in list(self._encoders):
+            encoder.tracer = value
+
+    def add_request_consumer(self, consumer) -> None:
+        """Add a function to be called with every completed request.
+
+        Consumers are called in the camera event loop once the post_callback and any
+        encoders have run (or on a thread of their own, if the request_pipeline has been
+        told to use threads). A consumer that wants to hang on to the request beyond the
+        call must acquire it (and later release it).
+        """
+        with self.lock:
+            self._request_consumers = self._request_consumers + [consumer]
+
+    def remove_request_consumer(self, consumer) -> None:
+        """Remove a function previously added with add_request_consumer."""
+        with self.lock:
+            self._request_consumers = [c for c in self._request_consumers if c != consumer]
+
+    def frame_stream(self, stream="main", maxsize=2, policy="drop_oldest") -> FrameStream:
+        """Return a stream of the completed requests that have an image in the named stream.
+
+        Requests are queued directly by the camera event loop, up to maxsize of them, after
+        which the policy ("drop_oldest" or "drop_newest") decides which ones are dropped.
+        The stream can be iterated over with for or async for, and should be closed (or
+        used as a context manager) when finished with. For example::
+
+            with picam2.frame_stream("lores") as frames:
+                for request in frames:
+                    process(request)  # released when the loop fetches the next request
+        """
+        return FrameStream(self, stream, maxsize, policy)
+
+    def _take_requests(self):
+        """Take all the requests that the camera manager has completed for us so far."""
+        requests = []
+        try:
+            while True:
+                requests.append(self._requests.popleft())
+        except IndexError:
+            pass
+        return requests
+
     def process_requests(self, display) -> None:
         # This is the function that the event loop, which runs externally to us, must call.
-        new_requests = []
-        with self._requestslock:
-            new_requests = self._requests
-            self._requests = []
+        new_requests = self._take_requests()
         # Discard "startup frames", or frames with errors etc.
         requests = []
         for req in new_requests:
@@ -1422,6 +1583,10 @@ class Picamera2:
             else:
                 req.release()
         self.frames += len(requests)
+        tracer = self._tracer
+        if tracer is not None:
+            for req in requests:
+                tracer.stamp(req.trace, "process_requests")
         # It works like this:
         # * We maintain a list of the requests that libcamera has completed (completed_requests).
         #   But we keep only a minimal number here so that we have one available to "return
@@ -1431,6 +1596,18 @@ class Picamera2:
         #   application can pop a request from it asynchronously), and the _job_list. If
         #   we don't have a request immediately available, the application will queue a
         #   "job" for us to execute here in order to accomplish what it wanted.
+        # * Nothing else needs the lock, so the callbacks, encoders and consumers run without it.
+        #   They may even run on threads of their own (see RequestPipeline).
+        pipeline = self.request_pipeline
+
+        if self.pre_callback:
+            pre_callback = (self.pre_callback,)
+            if tracer is not None:
+                pre_callback += (tracer.stamp_request("pre_callback"),)
+            for req in requests:
+                # Some applications may (for example) want us to draw something onto these images before
+                # encoding or copying them for an application. No one else can see them yet.
+                pipeline.run("pre_callback", pre_callback, req)
 
         with self.lock:
             # These new requests all have one "use" recorded, which is the one for being in
@@ -1446,38 +1623,41 @@ class Picamera2:
                 display_request.acquire()
                 display_request.display = True  # display requests by default
 
-            if self.pre_callback:
-                for req in requests:
-                    # Some applications may (for example) want us to draw something onto these images before
-                    # encoding or copying them for an application.
-                    self.pre_callback(req)
-
             # See if we have a job to do. When executed, if it returns True then it's done and
             # we can discard it. Otherwise it remains here to be tried again next time.
             finished_jobs = []
-            while self._job_list:
-                _log.debug(f"Execute job: {self._job_list[0]}")
-                if self._job_list[0].execute():
-                    finished_jobs.append(self._job_list.pop(0))
-                else:
-                    break
-
-            for req in requests:
-                # Some applications may want to do something to the image after they've had a change
-                # to copy it, but before it goes to the video encoder.
-                if self.post_callback:
-                    self.post_callback(req)
-
-                for encoder in self._encoders:
-                    if encoder.name in self.stream_map:
-                        encoder.encode(encoder.name, req)
-
-                req.release()
+            if self._job_list:
+                start_time = time.monotonic()
+                while self._job_list:
+                    _log.debug(f"Execute job: {self._job_list[0]}")
+                    if self._job_list[0].execute():
+                        finished_jobs.append(self._job_list.pop(0))
+                    else:
+                        break
+                pipeline.stats["jobs"].add((time.monotonic() - start_time) * 1000)
 
             # We hang on to the last completed request if we have been asked to.
             while len(self.completed_requests) > self._max_queue_len:
                 self.completed_requests.pop(0).release()
 
+            # Take copies of everything the remaining stages need while we hold the lock.
+            post_callback = (self.post_callback,) if self.post_callback else ()
+            if post_callback and tracer is not None:
+                post_callback += (tracer.stamp_request("post_callback"),)
+            encoders = tuple(partial(e.encode, e.name) for e in self._encoders if e.name in self.stream_map)
+            consumers = self._request_consumers
+
+        for req in requests:
+            # Some applications may want to do something to the image after they've had a change
+            # to copy it, but before it goes to the video encoder.
+            if post_callback:
+                pipeline.run("post_callback", post_callback, req)
+            if encoders:
+                pipeline.run("encoders", encoders, req)
+            if consumers:
+                pipeline.run("consumers", consumers, req)
+            req.release()
+
         # If one of the functions we ran reconfigured the camera since this request came out,
         # then we don't want it going back to the application as the memory is not valid.
         if display_request is not None:
@@ -1648,9 +1828,11 @@ class Picamera2:
         return self.dispatch_functions(functions, wait, signal_function)
 
     def switch_mode_(self, camera_config):
+        start = time.monotonic()
         self.stop_()
         self.configure_(camera_config)
         self.start_()
+        self.configuration_cache.record_switch(time.monotonic() - start)
         return (True, self.camera_config)
 
     @overload
@@ -1864,6 +2046,38 @@ class Picamera2:
         functions = [partial(self.wait_for_timestamp_, flush), self.capture_request_]
         return self.dispatch_functions(functions, wait, signal_function)
 
+    def capture_burst(
+        self, n, name="main", sink="burst{:03d}.jpg", format=None, num_workers=None, wait=None, signal_function=None
+    ) -> Union[dict[str, Any], Burst]:
+        """Capture the next n consecutive frames of the named stream and save them.
+
+        The requests are taken directly in the camera event loop and encoded on a pool of
+        num_workers threads, each buffer going back to the camera as soon as it has been
+        encoded. The sink is a filename pattern like "burst{:03d}.jpg" (the format being
+        taken from the extension unless given explicitly), or a function which is called
+        as sink(index, data, metadata) with the bytes of each encoded file. DNG files can
+        be saved from the "raw" stream.
+
+        The result is a dictionary of the frames' "metadata", the number of frames
+        "dropped" (found from gaps in the SensorTimestamps) and the "elapsed" time. The
+        wait and signal_function parameters work as for the other capture methods, except
+        that a Burst object is returned in place of a Job.
+        """
+        if wait is None:
+            wait = signal_function is None
+        timeout = None if wait is True else wait
+        if self.stream_map.get(name) is None:
+            raise RuntimeError(f'Stream {name!r} is not defined')
+        burst = Burst(self, n, name, sink, format, num_workers, signal_function)
+        burst.start()
+        if not wait:
+            return burst
+        try:
+            return burst.get_result(timeout=timeout)
+        except TimeoutError:
+            burst.cancel()
+            raise
+
     @overload
     def switch_mode_capture_request_and_stop(
         self, camera_config, wait: None = ..., signal_function: None = ...
@@ -2160,69 +2374,79 @@ class Picamera2:
         ]
         return self.dispatch_functions(functions, wait, signal_function, immediate=True)
 
-    def capture_array_(self, name):
+    def capture_array_(self, name, out=None):
         if not self.completed_requests:
             return (False, None)
         request = self.completed_requests.pop(0)
-        result = request.make_array(name)
+        result = request.make_array(name, out=out)
         request.release()
         return (True, result)
 
     @overload
-    def capture_array(self, name="main", wait: None = ..., signal_function: None = ...) -> NDArray[np.uint8]: ...
+    def capture_array(self, name="main", wait: None = ..., signal_function: None = ..., out=None) -> NDArray[np.uint8]: ...
 
     @overload
     def capture_array(
-        self, name="main", wait: None = ..., signal_function: Callable[[Job], None] = ...
+        self, name="main", wait: None = ..., signal_function: Callable[[Job], None] = ..., out=None
     ) -> Job[NDArray[np.uint8]]: ...
 
     @overload
     def capture_array(
-        self, name="main", wait: Literal[True] = ..., signal_function: Optional[Callable[[Job], None]] = ...
+        self, name="main", wait: Literal[True] = ..., signal_function: Optional[Callable[[Job], None]] = ..., out=None
     ) -> NDArray[np.uint8]: ...
 
     @overload
     def capture_array(
-        self, name="main", wait: Literal[False] = ..., signal_function: Optional[Callable[[Job], None]] = ...
+        self, name="main", wait: Literal[False] = ..., signal_function: Optional[Callable[[Job], None]] = ..., out=None
     ) -> Job[NDArray[np.uint8]]: ...
 
-    def capture_array(self, name="main", wait=None, signal_function=None) -> Union[NDArray[np.uint8], Job[NDArray[np.uint8]]]:
-        """Make a 2d image from the next frame in the named stream."""
-        return self.dispatch_functions([partial(self.capture_array_, name)], wait, signal_function)
+    def capture_array(
+        self, name="main", wait=None, signal_function=None, out=None
+    ) -> Union[NDArray[np.uint8], Job[NDArray[np.uint8]]]:
+        """Make a 2d image from the next frame in the named stream.
+
+        The image is copied into out if it is given (it must have the right shape and dtype).
+        """
+        return self.dispatch_functions([partial(self.capture_array_, name, out)], wait, signal_function)
 
-    def capture_arrays_and_metadata_(self, names):
+    def capture_arrays_and_metadata_(self, names, out=None):
         if not self.completed_requests:
             return (False, None)
         request = self.completed_requests.pop(0)
-        result = ([request.make_array(name) for name in names], request.get_metadata())
+        if out is None:
+            out = [None] * len(names)
+        result = ([request.make_array(name, out=o) for name, o in zip(names, out)], request.get_metadata())
         request.release()
         return (True, result)
 
     @overload
     def capture_arrays(
-        self, names=["main"], wait: None = ..., signal_function: None = ...
+        self, names=["main"], wait: None = ..., signal_function: None = ..., out=None
     ) -> tuple[list[NDArray[np.uint8]], dict[str, Any]]: ...
 
     @overload
     def capture_arrays(
-        self, names=["main"], wait: None = ..., signal_function: Callable[[Job], None] = ...
+        self, names=["main"], wait: None = ..., signal_function: Callable[[Job], None] = ..., out=None
     ) -> Job[tuple[list[NDArray[np.uint8]], dict[str, Any]]]: ...
 
     @overload
     def capture_arrays(
-        self, names=["main"], wait: Literal[True] = ..., signal_function: Optional[Callable[[Job], None]] = ...
+        self, names=["main"], wait: Literal[True] = ..., signal_function: Optional[Callable[[Job], None]] = ..., out=None
     ) -> tuple[list[NDArray[np.uint8]], dict[str, Any]]: ...
 
     @overload
     def capture_arrays(
-        self, names=["main"], wait: Literal[False] = ..., signal_function: Optional[Callable[[Job], None]] = ...
+        self, names=["main"], wait: Literal[False] = ..., signal_function: Optional[Callable[[Job], None]] = ..., out=None
     ) -> Job[tuple[list[NDArray[np.uint8]], dict[str, Any]]]: ...
 
     def capture_arrays(
-        self, names=["main"], wait=None, signal_function=None
+        self, names=["main"], wait=None, signal_function=None, out=None
     ) -> Union[tuple[list[NDArray[np.uint8]], dict[str, Any]], Job[tuple[list[NDArray[np.uint8]], dict[str, Any]]]]:
-        """Make 2d image arrays from the next frames in the named streams."""
-        return self.dispatch_functions([partial(self.capture_arrays_and_metadata_, names)], wait, signal_function)
+        """Make 2d image arrays from the next frames in the named streams.
+
+        If out is given, it should be a list of arrays (or Nones) to copy each stream's image into.
+        """
+        return self.dispatch_functions([partial(self.capture_arrays_and_metadata_, names, out)], wait, signal_function)
 
     @overload
     def switch_mode_and_capture_array(
@@ -2346,24 +2570,24 @@ class Picamera2:
         return (True, result)
 
     @overload
-    def capture_image(self, name="main", wait: None = ..., signal_function: None = ...) -> Image.Image: ...
+    def capture_image(self, name="main", wait: None = ..., signal_function: None = ...) -> "Image.Image": ...
 
     @overload
     def capture_image(
         self, name="main", wait: None = ..., signal_function: Callable[[Job], None] = ...
-    ) -> Job[Image.Image]: ...
+    ) -> Job["Image.Image"]: ...
 
     @overload
     def capture_image(
         self, name="main", wait: Literal[True] = ..., signal_function: Optional[Callable[[Job], None]] = ...
-    ) -> Image.Image: ...
+    ) -> "Image.Image": ...
 
     @overload
     def capture_image(
         self, name="main", wait: Literal[False] = ..., signal_function: Optional[Callable[[Job], None]] = ...
-    ) -> Job[Image.Image]: ...
+    ) -> Job["Image.Image"]: ...
 
-    def capture_image(self, name="main", wait=None, signal_function=None) -> Union[Image.Image, Job[Image.Image]]:
+    def capture_image(self, name="main", wait=None, signal_function=None) -> Union["Image.Image", Job["Image.Image"]]:
         """Make a PIL image from the next frame in the named stream.
 
         :param name: Stream name, defaults to "main"
@@ -2380,12 +2604,12 @@ class Picamera2:
     @overload
     def switch_mode_and_capture_image(
         self, camera_config, name="main", wait: None = ..., signal_function: None = ..., delay=0
-    ) -> Image.Image: ...
+    ) -> "Image.Image": ...
 
     @overload
     def switch_mode_and_capture_image(
         self, camera_config, name="main", wait: None = ..., signal_function: Callable[[Job], None] = ..., delay=0
-    ) -> Job[Image.Image]: ...
+    ) -> Job["Image.Image"]: ...
 
     @overload
     def switch_mode_and_capture_image(
@@ -2395,7 +2619,7 @@ class Picamera2:
         wait: Literal[True] = ...,
         signal_function: Optional[Callable[[Job], None]] = ...,
         delay=0,
-    ) -> Image.Image: ...
+    ) -> "Image.Image": ...
 
     @overload
     def switch_mode_and_capture_image(
@@ -2405,11 +2629,11 @@ class Picamera2:
         wait: Literal[False] = ...,
         signal_function: Optional[Callable[[Job], None]] = ...,
         delay=0,
-    ) -> Job[Image.Image]: ...
+    ) -> Job["Image.Image"]: ...
 
     def switch_mode_and_capture_image(
         self, camera_config, name="main", wait=None, signal_function=None, delay=0
-    ) -> Union[Image.Image, Job[Image.Image]]:
+    ) -> Union["Image.Image", Job["Image.Image"]]:
         """Switch the camera into a new (capture) mode, capture the image.
 
         Then return back to the initial camera mode.
@@ -2450,6 +2674,8 @@ class Picamera2:
             raise RuntimeError("No encoder specified")
         if output is not None:
             if isinstance(output, str):
+                from picamera2.outputs import FileOutput
+
                 output = FileOutput(output, pts=pts)
             _encoder.output = output
         streams = self.camera_configuration()
@@ -2472,6 +2698,7 @@ class Picamera2:
                 _encoder.framerate = 1000000 / min_frame_duration
         except AttributeError:
             pass
+        _encoder.tracer = self._tracer
         _encoder.start(quality=quality)
         with self.lock:
             self._encoders.add(_encoder)
@@ -2706,6 +2933,9 @@ class Picamera2:
         if config is not None:
             self.configure(config)
 
+        from picamera2.encoders import H264Encoder, MJPEGEncoder
+        from picamera2.outputs import FileOutput, PyavOutput
+
         if isinstance(output, str):
             extension = output.split('.')[-1].lower()
             if extension in ("mjpg", "mjpeg"):
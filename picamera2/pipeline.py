@@ -0,0 +1,125 @@
+"""The stages that each completed request passes through in the camera event loop."""
+
+import logging
+import threading
+import time
+from collections import deque
+
+from .stats import RollingStats
+
+_log = logging.getLogger(__name__)
+
+STAGES = ("pre_callback", "jobs", "post_callback", "encoders", "consumers")
+THREADED_STAGES = ("post_callback", "encoders", "consumers")
+
+
+class _Stage:
+    """A worker thread that runs one stage of the pipeline, fed by its own bounded queue."""
+
+    def __init__(self, name, stats, maxlen):
+        self.name = name
+        self.stats = stats
+        self.maxlen = maxlen
+        self.dropped = 0
+        self._items = deque()
+        self._condition = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"picamera2-{name}", daemon=True)
+        self._thread.start()
+
+    def put(self, request, functions, start_time) -> None:
+        # The queued request counts as a "use", so it can't go back to the camera too soon.
+        request.acquire()
+        with self._condition:
+            if self._running and len(self._items) < self.maxlen:
+                self._items.append((request, functions, start_time))
+                self._condition.notify()
+                return
+            self.dropped += 1
+        request.release()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._items or not self._running)
+                if not self._items:
+                    return
+                request, functions, start_time = self._items.popleft()
+            try:
+                for function in functions:
+                    function(request)
+            except Exception:
+                _log.exception(f"Error in {self.name} stage")
+            finally:
+                request.release()
+                self.stats.add((time.monotonic() - start_time) * 1000)
+
+    def close(self) -> None:
+        """Finish off anything already queued, and stop the thread."""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join()
+
+
+class RequestPipeline:
+    """Run the stages of processing for completed requests, and time each of them.
+
+    Every completed request goes through the pre_callback, any waiting jobs, the
+    post_callback, the encoders and finally any request consumers. Normally all of these
+    run in turn in the camera event loop, but start_threads() moves the post_callback,
+    encoders and consumers onto a thread each, with their own queues. Then a slow
+    post_callback no longer holds up the encoders (or the event loop), though note that:
+
+    - The post_callback runs alongside the encoders, so anything it draws on an image
+      may or may not reach the encoded video, and it can no longer prevent the request
+      from being displayed.
+    - If a stage falls more than maxlen requests behind, it drops new ones, which are
+      counted in its dropped figure.
+
+    The stats dictionary holds a RollingStats for each stage, recording in milliseconds
+    how long each request took to get through it, including any time spent queueing.
+    """
+
+    def __init__(self):
+        self.stats = {name: RollingStats() for name in STAGES}
+        self._stages = {}
+
+    @property
+    def threaded(self) -> bool:
+        return bool(self._stages)
+
+    def start_threads(self, maxlen=4) -> None:
+        """Run the post_callback, encoders and request consumers on threads of their own."""
+        if not self._stages:
+            self._stages = {name: _Stage(name, self.stats[name], maxlen) for name in THREADED_STAGES}
+
+    def stop_threads(self) -> None:
+        """Go back to running every stage in the camera event loop, once the queues have emptied."""
+        stages, self._stages = self._stages, {}
+        for stage in stages.values():
+            stage.close()
+
+    @property
+    def dropped(self) -> dict:
+        """The number of requests each threaded stage has dropped because it was too far behind."""
+        return {name: stage.dropped for name, stage in self._stages.items()}
+
+    def run(self, name, functions, request) -> None:
+        """Call each of the functions with the request, as the named stage."""
+        start_time = time.monotonic()
+        stage = self._stages.get(name)
+        if stage is not None:
+            stage.put(request, functions, start_time)
+            return
+        for function in functions:
+            function(request)
+        self.stats[name].add((time.monotonic() - start_time) * 1000)
+
+    def histograms(self, edges=(1, 2, 5, 10, 20, 50, 100)) -> dict:
+        """Return a histogram of the recent latencies of each stage, with bins separated by edges (in ms)."""
+        return {name: stats.histogram(edges) for name, stats in self.stats.items()}
+
+    def reset_stats(self) -> None:
+        for stats in self.stats.values():
+            stats.reset()
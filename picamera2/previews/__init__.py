@@ -1,3 +1,12 @@
-from .drm_preview import DrmPreview
-from .null_preview import NullPreview
-from .qt_previews import QtGlPreview, QtPreview
+from picamera2.lazy import lazy_attributes
+
+# Previews are imported when first used, as they need pykms, Qt or OpenGL.
+_ATTRIBUTES = {
+    "DrmPreview": ".drm_preview",
+    "NullPreview": ".null_preview",
+    "QtGlPreview": ".qt_previews",
+    "QtPreview": ".qt_previews",
+}
+
+__all__ = list(_ATTRIBUTES)
+__getattr__, __dir__ = lazy_attributes(__name__, _ATTRIBUTES)
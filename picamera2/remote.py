@@ -1,19 +1,107 @@
+import heapq
+import itertools
+import marshal
 import mmap
 import multiprocessing as mp
 import os
+import pickle
 import queue
+import struct
 from collections import deque
 from concurrent.futures import Future
 from ctypes import CDLL, c_int, c_long, get_errno
-from threading import Thread
+from functools import partial
+from threading import Condition, Lock, RLock, Semaphore, Thread
 from typing import Any, Callable
 
 import numpy as np
 from libcamera import ColorSpace, Transform
-from PIL import Image
 
 import picamera2
 
+# Descriptor kinds.
+_REQUEST = 0
+_CLOSE = 1
+
+# How the metadata in a descriptor is encoded.
+_MARSHAL = 0
+_PICKLE = 1
+_QUEUED = 2  # too big for the slot, so sent through the queue instead
+
+
+def _serialize_config(config):
+    """Return a copy of a camera configuration that can be sent to another process."""
+    config = config.copy()
+    t = config["transform"]
+    config["transform"] = (t.hflip, t.vflip, t.transpose)
+    c = config["colour_space"]
+    config["colour_space"] = (c.primaries, c.transferFunction, c.ycbcrEncoding, c.range)
+    return config
+
+
+def _deserialize_config(config):
+    """Turn a configuration made by _serialize_config back into the real thing."""
+    config["transform"] = Transform(*config["transform"])
+    config["colour_space"] = ColorSpace(*config["colour_space"])
+    return config
+
+
+def _encode_metadata(metadata):
+    """Encode metadata compactly, returning the encoding and the bytes."""
+    try:
+        return _MARSHAL, marshal.dumps(metadata)
+    except ValueError:
+        # Something in there that marshal doesn't understand.
+        return _PICKLE, pickle.dumps(metadata, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _decode_metadata(encoding, data):
+    return marshal.loads(data) if encoding == _MARSHAL else pickle.loads(data)
+
+
+class _DescriptorRing:
+    """
+    A ring of fixed size slots in shared memory, each describing one request.
+
+    A descriptor holds the request's buffer file descriptors and its metadata, with a configuration
+    "generation" number so that the configuration itself (and anything else that doesn't fit) need
+    only be sent through a queue when it changes. The parent writes slots in order and posts the
+    semaphore, and the child reads them in the same order, so nothing is pickled per request.
+    """
+
+    HEADER = struct.Struct("<iIIBBBx")  # kind, generation, metadata length, encoding, has kwargs, stream count
+    STREAM = struct.Struct("<iI")  # fd (-1 for no buffer), length
+
+    def __init__(self, slots, slot_size):
+        self.slots = slots
+        self.slot_size = slot_size
+        self._memory = mp.RawArray("B", slots * slot_size)
+        self.ready = mp.Semaphore(0)
+
+    def write(self, slot, kind, generation, streams=(), metadata=b"", encoding=_MARSHAL, has_kwargs=False):
+        """Write a descriptor, returning False if the metadata doesn't fit (in which case none is written)."""
+        buffer = memoryview(self._memory).cast("B")
+        offset = slot * self.slot_size
+        start = offset + self.HEADER.size + len(streams) * self.STREAM.size
+        fits = start + len(metadata) <= offset + self.slot_size
+        if not fits:
+            metadata, encoding = b"", _QUEUED
+        self.HEADER.pack_into(buffer, offset, kind, generation, len(metadata), encoding, has_kwargs, len(streams))
+        for i, (fd, length) in enumerate(streams):
+            self.STREAM.pack_into(buffer, offset + self.HEADER.size + i * self.STREAM.size, fd, length)
+        buffer[start : start + len(metadata)] = metadata
+        return fits
+
+    def read(self, slot):
+        """Read a descriptor, returning (kind, generation, streams, metadata, encoding, has_kwargs)."""
+        buffer = memoryview(self._memory).cast("B")
+        offset = slot * self.slot_size
+        kind, generation, length, encoding, has_kwargs, count = self.HEADER.unpack_from(buffer, offset)
+        position = offset + self.HEADER.size
+        streams = [self.STREAM.unpack_from(buffer, position + i * self.STREAM.size) for i in range(count)]
+        position += count * self.STREAM.size
+        return kind, generation, streams, bytes(buffer[position : position + length]), encoding, bool(has_kwargs)
+
 
 class Process:
     """
@@ -24,11 +112,17 @@ class Process:
 
     This will timeout if no results are received for the timeout period, even if no requests are sent.
 
+    Requests are described to the child through a ring of descriptors in shared memory, so only
+    their buffers' file descriptors and metadata are copied. The child maps each buffer once per
+    camera configuration, and the configuration itself is only sent when it changes.
+
     Args:
         run: The function to run in the child process for each request
         picam2: The Picamera2 object
         init: The function to run in the child process to initialize the process
         timeout: The timeout for the return queue. It has a 1 second resolution.
+        slots: The most requests that can be waiting for this process at once
+        slot_size: Bytes in each slot, which must hold the request's metadata
     """
 
     def __init__(
@@ -37,21 +131,31 @@ class Process:
         picam2: picamera2.Picamera2,
         init: Callable[[], None] | None = None,
         timeout: float | None = 30,
+        slots: int = 16,
+        slot_size: int = 65536,
     ):
         """
         Initializes the Process.
 
         Some configuration is copied from the Picamera2 object
         """
+        # The queue now carries only configurations, keyword arguments and oversized metadata.
         self._send_queue = mp.Queue()
         self._return_queue = mp.Queue()
+        self._ring = _DescriptorRing(slots, slot_size)
+        self._free_slots = Semaphore(slots)
+        self._next_slot = 0
+        self._generation = None
+        # Taking a slot, writing it and queueing the request must happen together, so that the
+        # child reads the slots, and the return thread finds the requests, in the order sent.
+        self._send_lock = Lock()
 
         self._requests_sent = deque()
         self._timeout = timeout
         self._thread = Thread(target=self._return_thread, args=(), daemon=True)
         self._thread.start()
 
-        self._process = _RemoteProcess(self._send_queue, self._return_queue, picam2, run, init)
+        self._process = _RemoteProcess(self._send_queue, self._return_queue, picam2, run, init, self._ring)
 
     def _return_thread(self):
         """Thread that passes the return values to the Future objects."""
@@ -66,6 +170,7 @@ class Process:
                 timeout_counter += 1
                 if timeout_counter >= self._timeout:
                     _, future = self._requests_sent.popleft()
+                    self._free_slots.release()
                     future.set_exception(TimeoutError("No result received for timeout period"))
                 continue
 
@@ -74,26 +179,54 @@ class Process:
             if not bool(self._requests_sent):
                 break
             request, future = self._requests_sent.popleft()
+            self._free_slots.release()
             future.set_result(result)
             request.release()
 
+    def _take_slot(self):
+        if not self._free_slots.acquire(timeout=self._timeout):
+            raise TimeoutError("No free slot to send request")
+        slot = self._next_slot
+        self._next_slot = (slot + 1) % self._ring.slots
+        return slot
+
     def send(self, request: picamera2.request.CompletedRequest, **kwargs):
         """
         Sends a request to the child process.
 
-        The request is converted to a RemoteRequest object and sent to the child process.
-        Returns a Future object that can be used to wait for the result.
+        The request is described in the next free slot of the descriptor ring, and the child is
+        woken up. Returns a Future object that can be used to wait for the result.
         """
         future = Future()
-        request.acquire()
-        remote = RemoteRequest(request, **kwargs)
-        self._send_queue.put(remote)
-        self._requests_sent.append((request, future))
+        with self._send_lock:
+            slot = self._take_slot()
+            request.acquire()
+            picam2 = request.picam2
+            if request.configure_count != self._generation:
+                # Send the configuration just once. The child will drop its old mappings when it sees it.
+                self._generation = request.configure_count
+                self._send_queue.put(("CONFIG", self._generation, _serialize_config(request.config), list(picam2.stream_map)))
+            streams = []
+            for stream in picam2.stream_map.values():
+                if stream is None:
+                    streams.append((-1, 0))
+                else:
+                    plane = request.request.buffers[stream].planes[0]
+                    streams.append((plane.fd, plane.length))
+            encoding, metadata = _encode_metadata(request.get_metadata())
+            if kwargs:
+                self._send_queue.put(("KWARGS", kwargs))
+            if not self._ring.write(slot, _REQUEST, self._generation, streams, metadata, encoding, bool(kwargs)):
+                self._send_queue.put(("METADATA", encoding, metadata))
+            self._requests_sent.append((request, future))
+            self._ring.ready.release()
         return future
 
     def close(self):
         """Closes the Process."""
-        self._send_queue.put("CLOSE")
+        with self._send_lock:
+            self._ring.write(self._take_slot(), _CLOSE, 0)
+            self._ring.ready.release()
         self._thread.join()
         self._process.join()
 
@@ -113,16 +246,23 @@ class _RemoteProcess(mp.Process):
         picam2: picamera2.Picamera2,
         run: Callable[["RemoteRequest"], Any],
         init: Callable[[], None],
+        ring: _DescriptorRing,
         *args,
         **kwargs,
     ):
         super().__init__(*args, **kwargs)
         self._send_queue = send_queue
         self._return_queue = return_queue
+        self._ring = ring
+        self._slot = 0
         self._return_result = False  # Whether the parent is expecting a result
 
         self._pid_fd = None
         self._picam2_pid = os.getpid()
+        # Buffers stay mapped until the camera configuration changes.
+        self._generation = None
+        self._config = None
+        self._stream_names = []
         self._array_cache = {}
         self._buffer_cache = {}
         self._request = None
@@ -156,20 +296,41 @@ class _RemoteProcess(mp.Process):
             raise OSError(errno, os.strerror(errno))
         return fd
 
+    def _receive(self, kind):
+        """Fetch the next message from the queue, which the parent sent with the descriptor being read."""
+        msg = self._send_queue.get()
+        if msg[0] != kind:
+            raise RuntimeError(f"Expected {kind} message but received {msg[0]}")
+        return msg[1:]
+
     def _capture_request(self):
         """Captures a request from the parent process."""
         if self._return_result:
             self._return_queue.put(None)
         self._return_result = True
 
-        msg = self._send_queue.get()
-        if msg == "CLOSE":
+        self._ring.ready.acquire()
+        kind, generation, streams, metadata, encoding, has_kwargs = self._ring.read(self._slot)
+        self._slot = (self._slot + 1) % self._ring.slots
+        if kind == _CLOSE:
             self._return_queue.put(None)
             return None
 
-        msg._deserialize(self)
-        self._request = msg
-        return msg
+        if generation != self._generation:
+            generation, config, self._stream_names = self._receive("CONFIG")
+            self._generation = generation
+            self._config = _deserialize_config(config)
+            self._array_cache = {}
+            self._buffer_cache = {}
+        kwargs = self._receive("KWARGS")[0] if has_kwargs else {}
+        if encoding == _QUEUED:
+            encoding, metadata = self._receive("METADATA")
+
+        buffers_fd = {name: None if fd == -1 else (fd, length) for name, (fd, length) in zip(self._stream_names, streams)}
+        request = RemoteRequest(self._config.copy(), _decode_metadata(encoding, metadata), buffers_fd, kwargs)
+        request._map_buffers(self)
+        self._request = request
+        return request
 
     def _return_request(self, return_value: Any):
         """Returns a request to the parent process."""
@@ -220,67 +381,46 @@ class RemoteRequest:
     """
     A request that is sent to the child process.
 
+    It is made in the child process from the descriptor written by the parent into the ring.
+
     Args:
-        request: The CompletedRequest object
+        config: The camera configuration
+        metadata: The request's metadata
+        buffers_fd: Dictionary of (fd, length) for each stream, or None for unused streams
+        kwargs: The keyword arguments passed to send
     """
 
-    def __init__(self, request: picamera2.request.CompletedRequest, **kwargs):
-        """Initializes and serializes the request."""
-        self.request = request
-        self._metadata = request.get_metadata()
-        self.config = request.config.copy()
-        t = self.config["transform"]
-        self.config["transform"] = (t.hflip, t.vflip, t.transpose)
-        c = self.config["colour_space"]
-        self.config["colour_space"] = (c.primaries, c.transferFunction, c.ycbcrEncoding, c.range)
+    def __init__(self, config, metadata, buffers_fd, kwargs):
+        """Initializes the request from what was read out of a descriptor."""
+        self._metadata = metadata
+        self.config = config
         self._array_ref_count = 0
-
-        self._buffers_fd = {}
-        for name in self.request.picam2.stream_map:
-            if self.request.picam2.stream_map[name] is None:
-                self._buffers_fd[name] = None
-            else:
-                self._buffers_fd[name] = self._serialize_stream(name)
-
+        self._buffers_fd = buffers_fd
         self._kwargs = kwargs
 
-        del self.request
-
-    def _serialize_stream(self, stream_name: str):
-        """Serializes a stream to a file descriptor and length."""
-        plane = self.request.request.buffers[self.request.picam2.stream_map[stream_name]].planes[0]
-        fd = plane.fd
-        length = plane.length
-        return fd, length
-
-    def _deserialize(self, process: _RemoteProcess):
-        """Deserializes the request."""
+    def _map_buffers(self, process: _RemoteProcess):
+        """Maps the request's buffers, reusing the process's mappings where possible."""
         self._arrays = {}
         self._buffers = {}
         self._process = process
         for name in self._buffers_fd:
             if self._buffers_fd[name] is not None:
                 pid_fd, length = self._buffers_fd[name]
-                if pid_fd in process._array_cache:
-                    self._arrays[name] = process._array_cache[pid_fd]
-                    self._buffers[name] = process._buffer_cache[pid_fd]
+                key = (name, pid_fd)
+                if key in process._array_cache:
+                    self._arrays[name] = process._array_cache[key]
+                    self._buffers[name] = process._buffer_cache[key]
                 else:
                     fd = process._map_fd(pid_fd)
-                    buffer = self._deserialize_buffer(fd, length)
+                    try:
+                        buffer = self._deserialize_buffer(fd, length)
+                    finally:
+                        # The mapping keeps its own reference to the buffer.
+                        os.close(fd)
                     self._arrays[name] = self._create_array(buffer, name)
                     self._buffers[name] = buffer
-                    process._array_cache[pid_fd] = self._arrays[name]
-                    process._buffer_cache[pid_fd] = self._buffers[name]
-
-        self.config["transform"] = Transform(
-            self.config["transform"][0], self.config["transform"][1], self.config["transform"][2]
-        )
-        self.config["colour_space"] = ColorSpace(
-            self.config["colour_space"][0],
-            self.config["colour_space"][1],
-            self.config["colour_space"][2],
-            self.config["colour_space"][3],
-        )
+                    process._array_cache[key] = self._arrays[name]
+                    process._buffer_cache[key] = self._buffers[name]
 
     def _deserialize_buffer(self, fd: int, length: int):
         """Deserializes a buffer."""
@@ -325,6 +465,8 @@ class RemoteRequest:
 
     def make_image(self, stream_name: str):
         """Create an Image from a stream."""
+        from PIL import Image
+
         config = self.config.get(stream_name, None)
         if config is None:
             raise RuntimeError(f"Stream {stream_name!r} is not defined")
@@ -389,13 +531,27 @@ class Pool:
 
     This can be used as a context manager to automatically close the pool.
 
+    Each request goes to the process with the fewest requests in flight. The number in flight can
+    be capped, for each process and for the pool as a whole, so that the camera is never starved of
+    buffers; once the caps are reached, send either waits for a result to come back ("block") or
+    drops the new request, returning a cancelled Future ("drop_newest"). With ordered set, each
+    Future only completes once those for all earlier frames (by SensorTimestamp) have.
+
     Args:
         run: The function to run in each child process for each request
         count: The number of processes to create
         picam2: The Picamera2 object
         init: The function to run in each child process to initialize the process
+        timeout: The timeout for results, and for a blocked send
+        max_in_flight: The most requests in flight across the whole pool, or None for no limit
+        max_in_flight_per_process: The most requests in flight to any one process, or None to use
+            the capacity of the process's descriptor ring
+        policy: What to do when the caps are reached, either "block" or "drop_newest"
+        ordered: Whether to complete the Futures in frame order
     """
 
+    POLICIES = ("block", "drop_newest")
+
     def __init__(
         self,
         run: Callable[["RemoteRequest"], Any],
@@ -403,11 +559,32 @@ class Pool:
         picam2: picamera2.Picamera2,
         init: Callable[[], None] | None = None,
         timeout: float | None = 30,
+        max_in_flight: int | None = None,
+        max_in_flight_per_process: int | None = None,
+        policy: str = "block",
+        ordered: bool = False,
     ):
         """Initializes the Pool."""
+        if policy not in self.POLICIES:
+            raise RuntimeError(f"Pool policy must be one of {self.POLICIES}")
         self._processes = [Process(run, picam2, init, timeout) for _ in range(count)]
         self._process_count = count
         self._process_index = 0  # The preferred process for the next request
+        self._timeout = timeout
+        self._max_in_flight = max_in_flight
+        slots = self._processes[0]._ring.slots
+        self._max_per_process = slots if max_in_flight_per_process is None else min(max_in_flight_per_process, slots)
+        self._policy = policy
+        self._ordered = ordered
+        self._condition = Condition()
+        self._loads = [0] * count
+        self._in_flight = 0
+        self.dropped = 0
+        # Ordered results wait here, as [timestamp, sequence number, process future, our future].
+        self._reorder = []
+        self._sequence = itertools.count()
+        # Held while ordered results are popped and passed on, so that they complete in order.
+        self._delivery_lock = RLock()
 
     def __enter__(self):
         return self
@@ -415,15 +592,79 @@ class Pool:
     def __exit__(self, exc_type, exc_value, exc_traceback):
         self.close()
 
+    @property
+    def in_flight(self):
+        """The number of requests that have been sent but not yet returned."""
+        return self._in_flight
+
+    def _choose(self):
+        # Return the index of the least loaded process that can take another request, or None.
+        if self._max_in_flight is not None and self._in_flight >= self._max_in_flight:
+            return None
+        index = min(
+            range(self._process_count), key=lambda i: (self._loads[i], (i + self._process_index) % self._process_count)
+        )
+        return index if self._loads[index] < self._max_per_process else None
+
     def send(self, request: picamera2.request.CompletedRequest, **kwargs):
-        """Sends a request to the child process."""
-        process = min(
-            enumerate(self._processes),
-            key=lambda p: (len(p[1]._requests_sent), (p[0] + self._process_index) % self._process_count),
-        )[1]
-        self._process_index = (self._process_index + 1) % self._process_count
-
-        return process.send(request, **kwargs)
+        """Sends a request to the least loaded child process, returning a Future for the result."""
+        entry = None
+        if self._ordered:
+            timestamp = request.get_metadata().get("SensorTimestamp", 0)
+        with self._condition:
+            while (index := self._choose()) is None:
+                if self._policy == "drop_newest":
+                    self.dropped += 1
+                    future = Future()
+                    future.cancel()
+                    return future
+                if not self._condition.wait(self._timeout):
+                    raise TimeoutError("No result received for timeout period")
+            self._process_index = (self._process_index + 1) % self._process_count
+            self._loads[index] += 1
+            self._in_flight += 1
+            if self._ordered:
+                # Take our place in the order now, so that nothing sent later can be delivered
+                # first. The process's future is filled in once the request has been sent.
+                entry = [timestamp, next(self._sequence), None, Future()]
+                heapq.heappush(self._reorder, entry)
+
+        try:
+            future = self._processes[index].send(request, **kwargs)
+        except Exception:
+            if entry is not None:
+                with self._condition:
+                    self._reorder.remove(entry)
+                    heapq.heapify(self._reorder)
+            self._finished(index, None)
+            raise
+        if entry is not None:
+            with self._condition:
+                entry[2] = future
+            future.add_done_callback(partial(self._finished, index))
+            return entry[3]
+        future.add_done_callback(partial(self._finished, index))
+        return future
+
+    def _finished(self, index, future):
+        # Called as each result arrives, to update the loads and pass on any ordered results that are ready.
+        with self._condition:
+            self._loads[index] -= 1
+            self._in_flight -= 1
+            self._condition.notify()
+        if not self._ordered:
+            return
+        with self._delivery_lock:
+            with self._condition:
+                ready = []
+                # An entry whose request is still being sent holds back everything after it.
+                while self._reorder and self._reorder[0][2] is not None and self._reorder[0][2].done():
+                    ready.append(heapq.heappop(self._reorder))
+            for _, _, future, ordered_future in ready:
+                if future.exception() is not None:
+                    ordered_future.set_exception(future.exception())
+                else:
+                    ordered_future.set_result(future.result())
 
     def close(self):
         """Closes the Pool."""
@@ -5,23 +5,22 @@ import logging
 import time
 from datetime import datetime
 from pathlib import Path
+from types import MappingProxyType
 from typing import TYPE_CHECKING, Any, Dict, Optional, Union
 
 import libcamera
 import numpy as np
-import piexif
-import simplejpeg
-from pidng.camdefs import Picamera2Camera
-from pidng.core import PICAM2DNG
-from PIL import Image
 
 import picamera2.formats as formats
 
 from .controls import Controls
+from .decompress import decompress as pisp_decompress
 from .sensor_format import SensorFormat
 from .utils import convert_from_libcamera_type
 
 if TYPE_CHECKING:
+    from PIL import Image
+
     from picamera2.picamera2 import Picamera2
 
 _log = logging.getLogger(__name__)
@@ -84,9 +83,61 @@ class MappedArray:
         return self.__array
 
 
+class _RequestTemplate:
+    """What every CompletedRequest from one configuration of the camera shares.
+
+    The configuration and stream map are read-only snapshots, shared by reference rather than
+    copied for every request, and the buffer syncs are made once per buffer and reused. A new
+    template is made whenever the camera is reconfigured or its allocator changes.
+    """
+
+    __slots__ = ("configure_count", "allocator", "config", "stream_map", "syncs")
+
+    def __init__(self, picam2: "Picamera2") -> None:
+        self.configure_count = picam2.configure_count
+        self.allocator = picam2.allocator
+        self.config = MappingProxyType(picam2.camera_config.copy())
+        self.stream_map = MappingProxyType(picam2.stream_map.copy())
+        self.syncs: Dict[Any, Any] = {}
+
+    @staticmethod
+    def current(picam2: "Picamera2") -> "_RequestTemplate":
+        """Return the template for the camera's current configuration, making it if necessary."""
+        template = getattr(picam2, "_request_template", None)
+        if template is None or (template.configure_count, template.allocator) != (picam2.configure_count, picam2.allocator):
+            template = picam2._request_template = _RequestTemplate(picam2)
+        return template
+
+    def syncs_for(self, buffers) -> list:
+        """Return the (read) syncs for a request's buffers, making any that don't exist yet."""
+        syncs = []
+        for buffer in buffers.values():
+            sync = self.syncs.get(buffer)
+            if sync is None:
+                sync = self.syncs[buffer] = self.allocator.sync(self.allocator, buffer, False)
+            syncs.append(sync)
+        return syncs
+
+
 class CompletedRequest:
     FASTER_JPEG = True  # set to False to use the older JPEG encode method
 
+    # Thousands of these are made every minute, so avoid giving each one a __dict__.
+    __slots__ = (
+        "request",
+        "ref_count",
+        "lock",
+        "picam2",
+        "stop_count",
+        "configure_count",
+        "config",
+        "stream_map",
+        "trace",
+        "syncs",
+        "display",
+        "__weakref__",
+    )
+
     def __init__(self, request: Any, picam2: "Picamera2") -> None:
         self.request = request
         self.ref_count: int = 1
@@ -94,12 +145,12 @@ class CompletedRequest:
         self.picam2 = picam2
         self.stop_count: int = picam2.stop_count
         self.configure_count: int = picam2.configure_count
-        self.config = self.picam2.camera_config.copy()
-        self.stream_map = self.picam2.stream_map.copy()
+        template = _RequestTemplate.current(picam2)
+        self.config = template.config
+        self.stream_map = template.stream_map
+        self.trace = None  # a FrameTrace, when the Picamera2 object has a tracer
         with self.lock:
-            self.syncs = [
-                picam2.allocator.sync(self.picam2.allocator, buffer, False) for buffer in self.request.buffers.values()
-            ]
+            self.syncs = template.syncs_for(self.request.buffers)
             self.picam2.allocator.acquire(self.request.buffers)
             [sync.__enter__() for sync in self.syncs]
 
@@ -122,27 +173,29 @@ class CompletedRequest:
                 if self.picam2.camera and self.stop_count == self.picam2.stop_count and self.picam2.started:
                     assert self.request is not None
                     self.request.reuse()
-                    controls = self.picam2.controls.get_libcamera_controls()
-                    for id, value in controls.items():
-                        # libcamera now has "ExposureTimeMode" and "AnalogueGainMode" which must be set to
-                        # manual for the fixed exposure time or gain to have any effect, and cleared to return
-                        # to "auto " mode. We're going to hide that by supplying them automatically as needed.
-                        if id == libcamera.controls.ExposureTime:
-                            if value:
-                                self.request.set_control(libcamera.controls.ExposureTimeMode, 1)  # manual
-                            else:
-                                self.request.set_control(libcamera.controls.ExposureTimeMode, 0)  # auto
-                                continue  # no need to set the zero value!
-                        elif id == libcamera.controls.AnalogueGain:
-                            if value:
-                                self.request.set_control(libcamera.controls.AnalogueGainMode, 1)  # manual
-                            else:
-                                self.request.set_control(libcamera.controls.AnalogueGainMode, 0)  # auto
-                                continue  # no need to set the zero value!
-
-                        self.request.set_control(id, value)
-
-                    self.picam2.controls = Controls(self.picam2)
+                    # Only convert and apply the controls if any have been set since the last request.
+                    if self.picam2.controls.dirty:
+                        controls = self.picam2.controls.get_libcamera_controls()
+                        for id, value in controls.items():
+                            # libcamera now has "ExposureTimeMode" and "AnalogueGainMode" which must be set to
+                            # manual for the fixed exposure time or gain to have any effect, and cleared to return
+                            # to "auto " mode. We're going to hide that by supplying them automatically as needed.
+                            if id == libcamera.controls.ExposureTime:
+                                if value:
+                                    self.request.set_control(libcamera.controls.ExposureTimeMode, 1)  # manual
+                                else:
+                                    self.request.set_control(libcamera.controls.ExposureTimeMode, 0)  # auto
+                                    continue  # no need to set the zero value!
+                            elif id == libcamera.controls.AnalogueGain:
+                                if value:
+                                    self.request.set_control(libcamera.controls.AnalogueGainMode, 1)  # manual
+                                else:
+                                    self.request.set_control(libcamera.controls.AnalogueGainMode, 0)  # auto
+                                    continue  # no need to set the zero value!
+
+                            self.request.set_control(id, value)
+
+                        self.picam2.controls = Controls(self.picam2)
                     self.picam2.camera.queue_request(self.request)
                 [sync.__exit__() for sync in self.syncs]
                 assert self.request is not None
@@ -166,24 +219,31 @@ class CompletedRequest:
             metadata[k.name] = convert_from_libcamera_type(v)
         return metadata
 
-    def make_array(self, name: str) -> np.ndarray:
-        """Make a 2d numpy array from the named stream's buffer."""
+    def make_array(self, name: str, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """Make a 2d numpy array from the named stream's buffer.
+
+        If out is given, the image is copied into it and it is returned. It must have the
+        correct shape and dtype for the stream. Otherwise, if the Picamera2 object's
+        array_pool is enabled, the array comes from there.
+        """
         config = self.config.get(name, None)
         if config is None:
             raise RuntimeError(f'Stream {name!r} is not defined')
         elif config['format'] == 'MJPEG':
-            return np.array(Image.open(io.BytesIO(self.make_buffer(name))))
+            from PIL import Image
+
+            array = np.array(Image.open(io.BytesIO(self.make_buffer(name))))
+            return array if out is None else self.picam2.helpers._copy_array(array, config, out)
 
         # We don't want to send out an exported handle to the camera buffer, so we're going to have
         # to do a copy. If the buffer is not contiguous, we can use the copy to make it so.
         with MappedArray(self, name) as m:
-            if m.array.data.c_contiguous:
-                return np.copy(m.array)
-            else:
-                return np.ascontiguousarray(m.array)
+            return self.picam2.helpers._copy_array(m.array, config, out)
 
     def make_image(self, name: str, width: Optional[int] = None, height: Optional[int] = None) -> Image.Image:
         """Make a PIL image from the named stream's buffer."""
+        from PIL import Image
+
         config = self.config.get(name, None)
         if config is None:
             raise RuntimeError(f'Stream {name!r} is not defined')
@@ -230,41 +290,11 @@ class CompletedRequest:
         config = self.config.get(name, None)
         if config is None:
             raise RuntimeError(f'Stream {name!r} is not defined')
-        if (
-            config['format'] == 'YUV420' or (self.FASTER_JPEG and config['format'] != "MJPEG")
-        ) and self.picam2.helpers._get_format_str(file_output, format) in ('jpg', 'jpeg'):
-            quality = self.picam2.options.get("quality", 90)
+        if self.picam2.helpers._use_fast_jpeg(config, file_output, format, self.FASTER_JPEG):
             with MappedArray(self, name) as m:
-                format = self.config[name]["format"]
-                if format == 'YUV420':
-                    width, height = self.config[name]['size']
-                    Y = m.array[:height, :width]
-                    reshaped = m.array.reshape((m.array.shape[0] * 2, m.array.strides[0] // 2))
-                    U = reshaped[2 * height : 2 * height + height // 2, : width // 2]
-                    V = reshaped[2 * height + height // 2 :, : width // 2]
-                    output_bytes = simplejpeg.encode_jpeg_yuv_planes(Y, U, V, quality)
-                    Y = reshaped = U = V = None
-                else:
-                    FORMAT_TABLE = {"XBGR8888": "RGBX", "XRGB8888": "BGRX", "BGR888": "RGB", "RGB888": "BGR"}
-                    output_bytes = simplejpeg.encode_jpeg(m.array, quality, FORMAT_TABLE[format], '420')
-
+                output_bytes = self.picam2.helpers._encode_jpeg(m.array, config)
             exif = self.picam2.helpers._prepare_exif(self.get_metadata(), exif_data)
-
-            if isinstance(file_output, io.BytesIO):
-                f = file_output
-            else:
-                f = open(file_output, 'wb')
-            try:
-                if exif:
-                    # Splice in the exif data as we write it out.
-                    f.write(output_bytes[:2] + bytes.fromhex('ffe1') + (len(exif) + 2).to_bytes(2, 'big'))
-                    f.write(exif)
-                    f.write(output_bytes[2:])
-                else:
-                    f.write(output_bytes)
-            except Exception:
-                if f is not file_output:
-                    f.close()
+            self.picam2.helpers._write_jpeg(output_bytes, exif, file_output)
         else:
             return self.picam2.helpers.save(self.make_image(name), self.get_metadata(), file_output, format, exif_data)
 
@@ -327,6 +357,8 @@ class Helpers:
             # cv2.cvtColor(image, cv2.COLOR_YUV2BGR_YUYV) will convert directly to RGB.
             image = array.reshape(h, stride // 2, 2)
         elif fmt == "MJPEG":
+            from PIL import Image
+
             image = np.array(Image.open(io.BytesIO(array)))  # type: ignore
         elif formats.is_raw(fmt):
             image = array.reshape((h, stride))
@@ -334,17 +366,29 @@ class Helpers:
             raise RuntimeError("Format " + fmt + " not supported")
         return image
 
-    def make_array(self, buffer, config):
+    def make_array(self, buffer, config, out=None):
         """Makes a 2d numpy array for the named stream's buffer.
 
         This method makes a copy of the underlying camera buffer, so that it can be
-        safely returned to the camera system.
+        safely returned to the camera system. The copy goes into out, if that is given.
         """
-        array = self._make_array_shared(buffer, config)
-        if array.data.c_contiguous:
-            return np.copy(array)
-        else:
-            return np.ascontiguousarray(array)
+        return self._copy_array(self._make_array_shared(buffer, config), config, out)
+
+    def _copy_array(self, array, config, out=None):
+        """Copy an image array into out, or a pooled or newly allocated contiguous array."""
+        if out is None:
+            pool = getattr(self.picam2, "array_pool", None)
+            if pool is not None:
+                out = pool.get(config, array.shape, array.dtype)
+        if out is None:
+            if array.data.c_contiguous:
+                return np.copy(array)
+            else:
+                return np.ascontiguousarray(array)
+        if out.shape != array.shape or out.dtype != array.dtype:
+            raise RuntimeError(f"Output array must have shape {array.shape} and dtype {array.dtype}")
+        np.copyto(out, array)
+        return out
 
     def _get_pil_mode(self, fmt):
         mode_lookup = {"RGB888": "BGR", "BGR888": "RGB", "XBGR8888": "RGBX", "XRGB8888": "BGRX"}
@@ -357,6 +401,8 @@ class Helpers:
         self, buffer: np.ndarray, config: Dict[str, Any], width: Optional[int] = None, height: Optional[int] = None
     ) -> Image.Image:
         """Make a PIL image from the named stream's buffer."""
+        from PIL import Image
+
         fmt = config["format"]
         if fmt == "MJPEG":
             return Image.open(io.BytesIO(buffer))  # type: ignore
@@ -381,6 +427,8 @@ class Helpers:
     def _prepare_exif(self, metadata, exif_data):
         exif = b''
         if "AnalogueGain" in metadata and "DigitalGain" in metadata:
+            import piexif
+
             datetime_now = datetime.now().strftime("%Y:%m:%d %H:%M:%S")
             zero_ifd = {
                 piexif.ImageIFD.Make: "Raspberry Pi",
@@ -447,8 +495,63 @@ class Helpers:
         _log.info(f"Saved {self} to file {file_output}.")
         _log.info(f"Time taken for encode: {(end_time - start_time) * 1000} ms.")
 
+    def _use_fast_jpeg(self, config, file_output, format, faster_jpeg=True):
+        """Whether an image from this stream can be saved using the optimised JPEG path."""
+        return (config['format'] == 'YUV420' or (faster_jpeg and config['format'] != "MJPEG")) and self._get_format_str(
+            file_output, format
+        ) in ('jpg', 'jpeg')
+
+    def _encode_jpeg(self, array: np.ndarray, config: Dict[str, Any]) -> bytes:
+        """Encode an image array (as returned by _make_array_shared) as a JPEG using simplejpeg."""
+        import simplejpeg
+
+        quality = self.picam2.options.get("quality", 90)
+        format = config["format"]
+        if format == 'YUV420':
+            width, height = config['size']
+            Y = array[:height, :width]
+            reshaped = array.reshape((array.shape[0] * 2, array.strides[0] // 2))
+            U = reshaped[2 * height : 2 * height + height // 2, : width // 2]
+            V = reshaped[2 * height + height // 2 :, : width // 2]
+            return simplejpeg.encode_jpeg_yuv_planes(Y, U, V, quality)
+        else:
+            FORMAT_TABLE = {"XBGR8888": "RGBX", "XRGB8888": "BGRX", "BGR888": "RGB", "RGB888": "BGR"}
+            return simplejpeg.encode_jpeg(array, quality, FORMAT_TABLE[format], '420')
+
+    def _write_jpeg(self, output_bytes: bytes, exif: bytes, file_output: Any) -> None:
+        """Write out JPEG data to a file or file-like object, splicing in any exif data."""
+        if isinstance(file_output, (str, Path)):
+            with open(file_output, 'wb') as f:
+                self._write_jpeg(output_bytes, exif, f)
+        elif exif:
+            # Splice in the exif data as we write it out.
+            file_output.write(output_bytes[:2] + bytes.fromhex('ffe1') + (len(exif) + 2).to_bytes(2, 'big'))
+            file_output.write(exif)
+            file_output.write(output_bytes[2:])
+        else:
+            file_output.write(output_bytes)
+
+    def save_jpeg(
+        self,
+        buffer: np.ndarray,
+        metadata: Dict[str, Any],
+        config: Dict[str, Any],
+        file_output: Any,
+        exif_data: Optional[Dict] = None,
+    ) -> None:
+        """Save a JPEG of a stream's buffer using simplejpeg, which is faster than going through PIL."""
+        start_time = time.monotonic()
+        output_bytes = self._encode_jpeg(self._make_array_shared(buffer, config), config)
+        self._write_jpeg(output_bytes, self._prepare_exif(metadata, exif_data), file_output)
+        end_time = time.monotonic()
+        _log.info(f"Saved {self} to file {file_output}.")
+        _log.info(f"Time taken for encode: {(end_time - start_time) * 1000} ms.")
+
     def save_dng(self, buffer: np.ndarray, metadata: Dict[str, Any], config: Dict[str, Any], file_output: Any) -> None:
         """Save a DNG RAW image of the raw stream's buffer."""
+        from pidng.camdefs import Picamera2Camera
+        from pidng.core import PICAM2DNG
+
         start_time = time.monotonic()
         raw = self._make_array_shared(buffer, config)
         config = config.copy()
@@ -478,39 +581,9 @@ class Helpers:
         _log.info(f"Saved {self} to file {file_output}.")
         _log.info(f"Time taken for encode: {(end_time - start_time) * 1000} ms.")
 
-    def decompress(self, array: np.ndarray):
-        """Decompress an image buffer that has been compressed with a PiSP compression format."""
-        # These are the standard configurations used in the drivers.
-        offset = 2048
-
-        words = array.view(np.int32)  # Assume all Pis are little-endian. Note signed arithmetic is used!
-        words = words.reshape((words.shape[0], words.shape[1] // 2, 2))  # pairs of words by component
-        qmode = words & 3
-        pix0 = (words >> 2) & 511
-        pix1 = ((words >> 11) & 127) - 64
-        pix2 = (words >> 18) & 127
-        pix3 = (words >> 25) & 127
-        q1 = np.copy(pix0)
-        q2 = pix1 + 448
-        np.maximum(pix0, pix0 - pix1, where=(qmode * pix0 < 768), out=q1)
-        np.maximum(pix0, pix0 + pix1, where=(qmode * pix0 < 768), out=q2)
-        q0 = np.minimum(1536 >> qmode, np.maximum(0, q1 - 64)) + pix2
-        q3 = np.minimum(1536 >> qmode, np.maximum(0, q2 - 64)) + pix3
-        np.maximum(np.maximum(16 * q0, 32 * (q0 - 160)), 64 * qmode * q0, out=pix0)
-        np.maximum(np.maximum(16 * q1, 32 * (q1 - 160)), 64 * qmode * q1, out=pix1)
-        np.maximum(np.maximum(16 * q2, 32 * (q2 - 160)), 64 * qmode * q2, out=pix2)
-        np.maximum(np.maximum(16 * q3, 32 * (q3 - 160)), 64 * qmode * q3, out=pix3)
-        q2 = (words >> 2) & 32767
-        q3 = (words >> 17) & 32767
-        q0 = (q2 & 15) + 16 * ((q2 >> 8) // 11)
-        q1 = (q2 >> 4) % 176
-        q2 = (q3 & 15) + 16 * ((q3 >> 8) // 11)
-        q3 = (q3 >> 4) % 176
-        np.maximum(256 * q0, 512 * (q0 - 47), out=pix0, where=(qmode == 3))
-        np.maximum(256 * q1, 512 * (q1 - 47), out=pix1, where=(qmode == 3))
-        np.maximum(256 * q2, 512 * (q2 - 47), out=pix2, where=(qmode == 3))
-        np.maximum(256 * q3, 512 * (q3 - 47), out=pix3, where=(qmode == 3))
-        res = np.stack((pix0, pix1, pix2, pix3), axis=2).reshape(array.shape)
-
-        res = np.clip(res + offset, 0, 65535).astype(np.uint16)
-        return res.view(np.uint8)
+    def decompress(self, array: np.ndarray, out: Optional[np.ndarray] = None):
+        """Decompress an image buffer that has been compressed with a PiSP compression format.
+
+        The result is returned as bytes (2 per pixel), in the uint16 array out if that is given.
+        """
+        return pisp_decompress(array, out=out).view(np.uint8)
@@ -0,0 +1,161 @@
+"""Saving captured images in the background."""
+
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .stats import RollingStats
+
+
+class SaveQueue:
+    """Encode and save images from completed requests on a pool of worker threads.
+
+    Submitting a request returns a Future straight away, so the camera and the
+    application can carry on while PIL, simplejpeg or pidng get on with the encoding.
+
+    By default the image is copied out of the camera buffer as it is submitted, so the
+    caller can release the request immediately. With copy=False the queue holds on to
+    the request instead (avoiding the copy) until the image has been saved, but then
+    the camera may run short of buffers if too many saves are waiting.
+
+    The queue will accept at most max_pending images, and at most max_bytes of image
+    data (though a single image is always accepted if the queue is empty). Beyond this,
+    submit waits for room, raising a TimeoutError if none appears within the timeout.
+
+    The depth, max_depth, bytes_pending, completed and failed counters, and the
+    wait_time and encode_time statistics (in milliseconds), show how the queue is coping.
+    """
+
+    def __init__(self, num_workers=2, max_pending=8, max_bytes=256 * 1024 * 1024, copy=True):
+        self.max_pending = max_pending
+        self.max_bytes = max_bytes
+        self.copy = copy
+        self._executor = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="picamera2-save")
+        self._condition = threading.Condition()
+        self.depth = 0
+        self.max_depth = 0
+        self.bytes_pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_time = RollingStats()
+        self.encode_time = RollingStats()
+
+    def submit(self, request, file_output, name="main", format=None, exif_data=None, timeout=None) -> Future:
+        """Save a JPEG or PNG image of the named stream, as CompletedRequest.save would.
+
+        The caller still owns its reference to the request, and should release it as usual.
+
+        :param timeout: Longest time to wait for room in the queue, None meaning wait as long as necessary
+        :raises TimeoutError: The queue stayed full for the whole timeout
+        :return: A Future whose result is None once the file has been written
+        """
+        config = request.config.get(name)
+        if config is None:
+            raise RuntimeError(f'Stream {name!r} is not defined')
+        helpers = request.picam2.helpers
+        if not self.copy:
+            return self._submit(request, config, timeout, request.save, name, file_output, format, exif_data)
+        if helpers._use_fast_jpeg(config, file_output, format, request.FASTER_JPEG):
+
+            def save(buffer, metadata, config):
+                helpers.save_jpeg(buffer, metadata, config, file_output, exif_data)
+
+        else:
+
+            def save(buffer, metadata, config):
+                helpers.save(helpers.make_image(buffer, config), metadata, file_output, format, exif_data)
+
+        return self._submit_copy(request, name, config, timeout, save)
+
+    def submit_dng(self, request, file_output, name="raw", timeout=None) -> Future:
+        """Save a DNG file of the raw stream, as CompletedRequest.save_dng would. See submit."""
+        config = request.config.get(name)
+        if config is None:
+            raise RuntimeError(f'Stream {name!r} is not defined')
+        if not self.copy:
+            return self._submit(request, config, timeout, request.save_dng, file_output, name)
+        helpers = request.picam2.helpers
+
+        def save(buffer, metadata, config):
+            helpers.save_dng(buffer, metadata, config, file_output)
+
+        return self._submit_copy(request, name, config, timeout, save)
+
+    def _submit_copy(self, request, name, config, timeout, save):
+        self._reserve(config, timeout)
+        try:
+            buffer = request.make_buffer(name)
+            metadata = request.get_metadata()
+        except Exception:
+            self._done(config)
+            raise
+        return self._start(config, None, save, buffer, metadata, config.copy())
+
+    def _submit(self, request, config, timeout, save, *args):
+        self._reserve(config, timeout)
+        request.acquire()
+        return self._start(config, request, save, *args)
+
+    def _start(self, config, request, save, *args):
+        try:
+            return self._executor.submit(self._run, config, time.monotonic(), request, save, *args)
+        except Exception:
+            # Most likely the queue has been closed.
+            if request is not None:
+                request.release()
+            self._done(config)
+            raise
+
+    @staticmethod
+    def _size(config):
+        return config.get("framesize") or config["stride"] * config["size"][1]
+
+    def _reserve(self, config, timeout):
+        size = self._size(config)
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self.depth == 0 or (self.depth < self.max_pending and self.bytes_pending + size <= self.max_bytes),
+                timeout,
+            ):
+                raise TimeoutError("Save queue is full")
+            self.depth += 1
+            self.bytes_pending += size
+            self.max_depth = max(self.max_depth, self.depth)
+
+    def _done(self, config, ok=None):
+        with self._condition:
+            self.depth -= 1
+            self.bytes_pending -= self._size(config)
+            if ok is True:
+                self.completed += 1
+            elif ok is False:
+                self.failed += 1
+            self._condition.notify_all()
+
+    def _run(self, config, submit_time, request, save, *args):
+        start_time = time.monotonic()
+        self.wait_time.add((start_time - submit_time) * 1000)
+        ok = False
+        try:
+            save(*args)
+            ok = True
+        finally:
+            if request is not None:
+                request.release()
+            self.encode_time.add((time.monotonic() - start_time) * 1000)
+            self._done(config, ok)
+
+    def join(self, timeout=None) -> bool:
+        """Wait until everything submitted so far has been saved, returning False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.depth == 0, timeout)
+
+    def close(self, wait=True) -> None:
+        """Stop accepting images. If wait is set, return only once everything has been saved."""
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
@@ -0,0 +1,160 @@
+"""The camera's sensor modes, worked out only when they are needed, and remembered on disk."""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections.abc import Sequence
+
+from .sensor_format import SensorFormat
+
+_log = logging.getLogger(__name__)
+
+# Change this whenever what is saved for each mode changes, so that old cache files are ignored.
+CACHE_VERSION = 1
+
+
+def cache_directory():
+    """Return the directory for the sensor mode cache, or None if the cache is turned off.
+
+    This is $PICAMERA2_SENSOR_MODE_CACHE if it is set (with "0" or "" turning the cache off),
+    and otherwise picamera2/sensor_modes in $XDG_CACHE_HOME (normally ~/.cache).
+    """
+    directory = os.environ.get("PICAMERA2_SENSOR_MODE_CACHE")
+    if directory is not None:
+        return directory if directory not in ("", "0") else None
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(cache_home, "picamera2", "sensor_modes")
+
+
+def cache_key(camera_id, tuning, libcamera_version):
+    """Return the name of the cache file for a camera, tuning and version of libcamera."""
+    key = json.dumps([CACHE_VERSION, camera_id, tuning, libcamera_version])
+    return hashlib.sha1(key.encode()).hexdigest() + ".json"
+
+
+def _mode_key(name, size):
+    return f"{name}/{size[0]}x{size[1]}"
+
+
+class SensorModes(Sequence):
+    """The list of sensor modes returned by Picamera2.sensor_modes.
+
+    Finding a raw mode's frame rate, crop and exposure limits means configuring the camera in
+    that mode, so each mode is only worked out when it is first looked at, and the results are
+    saved in a file (see cache_directory) named after the camera, its tuning and the libcamera
+    version. Another Picamera2 for the same camera, even in a later process, then reads them
+    straight back. Looking at modes that have to be worked out reconfigures the camera, which
+    must not be running, so configure it again afterwards.
+
+    The time taken to work out each mode is kept in probe_times, and the modes read from the
+    cache are counted in cached, so that stats() shows how long enumeration took cold or warm.
+    """
+
+    def __init__(self, pixel_formats, probe, key=None, directory=None):
+        """Create the list of sensor modes.
+
+        :param pixel_formats: List of (format name, list of sizes, is raw) for the sensor's raw stream
+        :param probe: Function called as probe(format name, size) to find the limits of a raw mode
+        :param key: Name of the cache file, defaults to None (no cache)
+        :param directory: Directory for the cache file, defaults to None (no cache)
+        """
+        self._probe = probe
+        self._lock = threading.Lock()
+        self._entries = []
+        for name, sizes, is_raw in pixel_formats:
+            if is_raw:
+                self._entries += [(name, (size[0], size[1])) for size in sizes]
+            else:
+                # Not a raw sensor so we can't deduce much about it. Quote the name and carry on.
+                self._entries.append((name, None))
+        self._modes = [None] * len(self._entries)
+        self._path = os.path.join(directory, key) if key is not None and directory is not None else None
+        self.probe_times = []  # seconds taken to work out each mode that was not cached
+        self.cached = 0
+        self.load_time = 0.0
+        start = time.perf_counter()
+        self._saved = self._load()
+        self.load_time = time.perf_counter() - start
+
+    def _load(self):
+        if self._path is None:
+            return {}
+        try:
+            with open(self._path) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            _log.debug(f"Ignoring sensor mode cache {self._path}: {e}")
+            return {}
+        if not isinstance(saved, dict) or saved.get("version") != CACHE_VERSION:
+            return {}
+        return saved.get("modes", {})
+
+    def _save(self):
+        # Write a new file and rename it, so that other processes never see half of one.
+        try:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self._path), suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump({"version": CACHE_VERSION, "modes": self._saved}, f)
+            os.replace(temp_path, self._path)
+        except OSError as e:
+            _log.debug(f"Could not save sensor mode cache {self._path}: {e}")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        mode = self._modes[index]
+        if mode is None:
+            with self._lock:
+                mode = self._modes[index]
+                if mode is None:
+                    mode = self._make_mode(*self._entries[index])
+                    self._modes[index] = mode
+        return mode
+
+    def _make_mode(self, name, size):
+        if size is None:
+            return {"format": name}
+        fmt = SensorFormat(name)
+        key = _mode_key(name, size)
+        limits = self._saved.get(key)
+        if limits is not None:
+            self.cached += 1
+        else:
+            start = time.perf_counter()
+            limits = self._probe(name, size)
+            self.probe_times.append(time.perf_counter() - start)
+            if self._path is not None:
+                self._saved[key] = limits
+                self._save()
+        return {
+            "format": fmt,
+            "unpacked": fmt.unpacked,
+            "bit_depth": fmt.bit_depth,
+            "size": size,
+            "fps": limits["fps"],
+            "crop_limits": tuple(limits["crop_limits"]),
+            "exposure_limits": tuple(limits["exposure_limits"]),
+        }
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def stats(self):
+        """Return how many modes were worked out and how many came from the cache, with times in ms."""
+        return {
+            "modes": len(self),
+            "probed": len(self.probe_times),
+            "cached": self.cached,
+            "probe_ms": sum(self.probe_times) * 1000,
+            "load_ms": self.load_time * 1000,
+        }
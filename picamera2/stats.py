@@ -0,0 +1,76 @@
+"""Simple rolling statistics for timing measurements."""
+
+import bisect
+import threading
+from collections import deque
+
+
+class RollingStats:
+    """Keep the most recent values of a measurement (such as a latency) and summarise them.
+
+    Only the last maxlen values are used for the mean and percentiles. The count and
+    maximum cover everything recorded since the statistics were last reset.
+    """
+
+    def __init__(self, maxlen=1000):
+        self._values = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.max = None
+
+    def add(self, value) -> None:
+        with self._lock:
+            self._values.append(value)
+            self.count += 1
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+            self.count = 0
+            self.max = None
+
+    @property
+    def last(self):
+        with self._lock:
+            return self._values[-1] if self._values else None
+
+    @property
+    def mean(self):
+        with self._lock:
+            return sum(self._values) / len(self._values) if self._values else None
+
+    def percentile(self, p):
+        """Return the p-th percentile (0 to 100) of the recent values, or None if there are none."""
+        with self._lock:
+            values = sorted(self._values)
+        if not values:
+            return None
+        return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+    def histogram(self, edges) -> list:
+        """Count the recent values falling between each pair of consecutive edges.
+
+        The first count is of values below the first edge, and the last is of values at
+        or above the last edge, so there is one more count than there are edges.
+        """
+        with self._lock:
+            values = list(self._values)
+        counts = [0] * (len(edges) + 1)
+        for value in values:
+            counts[bisect.bisect_right(edges, value)] += 1
+        return counts
+
+    def summary(self) -> dict:
+        """Return a dictionary of the count, mean, p50, p99 and max values."""
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+    def __repr__(self):
+        return f"<RollingStats {self.summary()}>"
@@ -0,0 +1,137 @@
+"""Tracing how long each frame takes to get through the camera system."""
+
+import json
+import threading
+import time
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Optional
+
+from .stats import RollingStats
+
+
+class FrameTrace:
+    """The times (from time.monotonic_ns) at which one frame reached each stage."""
+
+    __slots__ = ("sensor_timestamp", "stamps")
+
+    def __init__(self, sensor_timestamp: int) -> None:
+        self.sensor_timestamp = sensor_timestamp
+        self.stamps: list[tuple[str, int]] = []
+
+
+class Tracer:
+    """Record when each frame reaches each stage of the camera system.
+
+    Once a tracer is given to Picamera2 (by setting its tracer property), every completed
+    request carries a FrameTrace, which is stamped as the request is handled by the camera
+    manager, picked up by process_requests, passed to the pre_callback and post_callback,
+    and submitted to each encoder. Encoded frames are matched back to their trace using
+    their timestamps, so the encoder output, and each Output it goes to, are stamped too.
+
+    The stats dictionary holds a RollingStats for each stage (with the encoder and output
+    stages named after the objects concerned), recording the time in milliseconds from
+    the frame's SensorTimestamp to the stage being reached. Optionally, the most recent
+    max_events stamps are kept so that they can be saved with dump() in the Chrome trace
+    JSON format, for viewing in Perfetto or chrome://tracing.
+    """
+
+    def __init__(self, maxlen=1000, max_events=100000, max_frames=64):
+        """Create a tracer.
+
+        :param maxlen: Number of recent values used for each stage's statistics
+        :param max_events: Number of stamps to keep for dump(), or 0 to keep none
+        :param max_frames: Number of recent frames whose traces encoder outputs can be matched to
+        """
+        self.maxlen = maxlen
+        self.max_frames = max_frames
+        self.stats: dict[str, RollingStats] = {}
+        self._lock = threading.Lock()
+        self._frames: OrderedDict[int, FrameTrace] = OrderedDict()
+        self._events: Optional[deque] = deque(maxlen=max_events) if max_events else None
+
+    def begin(self, sensor_timestamp: int) -> FrameTrace:
+        """Start the trace for a new frame, with its SensorTimestamp in ns."""
+        trace = FrameTrace(sensor_timestamp)
+        with self._lock:
+            self._frames[sensor_timestamp // 1000] = trace
+            while len(self._frames) > self.max_frames:
+                self._frames.popitem(last=False)
+        return trace
+
+    def stamp(self, trace: Optional[FrameTrace], stage: str) -> None:
+        """Record that the frame with this trace has just reached the given stage."""
+        if trace is None:
+            return
+        now = time.monotonic_ns()
+        previous = trace.stamps[-1][1] if trace.stamps else trace.sensor_timestamp
+        trace.stamps.append((stage, now))
+        stats = self.stats.get(stage)
+        if stats is None:
+            with self._lock:
+                stats = self.stats.setdefault(stage, RollingStats(self.maxlen))
+        stats.add((now - trace.sensor_timestamp) / 1000000)
+        if self._events is not None:
+            self._events.append((stage, trace.sensor_timestamp, previous, now))
+
+    def stamp_request(self, stage: str):
+        """Return a function that stamps the trace of any request it is called with."""
+
+        def stamp(request):
+            self.stamp(request.trace, stage)
+
+        return stamp
+
+    def stamp_timestamp(self, timestamp_us: int, stage: str) -> None:
+        """Stamp the trace of the frame whose SensorTimestamp (in microseconds) is given."""
+        self.stamp(self._frames.get(timestamp_us), stage)
+
+    def summary(self) -> dict[str, dict[str, Any]]:
+        """Return the count, mean, p50, p99 and max latency (in ms) of each stage."""
+        return {stage: stats.summary() for stage, stats in list(self.stats.items())}
+
+    def histograms(self, edges=(5, 10, 20, 50, 100, 200, 500)) -> dict[str, list]:
+        """Return a histogram of the recent latencies of each stage, with bins separated by edges (in ms)."""
+        return {stage: stats.histogram(edges) for stage, stats in list(self.stats.items())}
+
+    def reset(self) -> None:
+        """Forget all the statistics and events recorded so far."""
+        with self._lock:
+            self.stats = {}
+            self._frames.clear()
+            if self._events is not None:
+                self._events.clear()
+
+    def chrome_trace(self) -> dict[str, Any]:
+        """Return the recorded events in the Chrome trace event format.
+
+        Each stage gets a track of its own, and each event spans the time from the frame
+        reaching its previous stage (or from its SensorTimestamp) to reaching this one.
+        """
+        events = list(self._events) if self._events is not None else []
+        tids: dict[str, int] = {}
+        trace_events: list[dict[str, Any]] = []
+        for stage, sensor_timestamp, start, end in events:
+            tid = tids.setdefault(stage, len(tids) + 1)
+            trace_events.append(
+                {
+                    "name": stage,
+                    "ph": "X",
+                    "pid": 1,
+                    "tid": tid,
+                    "ts": start / 1000,
+                    "dur": (end - start) / 1000,
+                    "args": {"SensorTimestamp": sensor_timestamp},
+                }
+            )
+        for stage, tid in tids.items():
+            trace_events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": stage}})
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def dump(self, file_output: Any) -> None:
+        """Save the recorded events as Chrome trace JSON, to a file name or a file-like object."""
+        if isinstance(file_output, (str, Path)):
+            with open(file_output, "w") as f:
+                json.dump(self.chrome_trace(), f)
+        else:
+            json.dump(self.chrome_trace(), file_output)
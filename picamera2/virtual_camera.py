@@ -0,0 +1,341 @@
+"""A software camera for running Picamera2 without any camera hardware.
+
+The virtual camera stands in for libcamera's camera manager, producing frames at a
+configurable rate (with optional timing jitter) into memfd buffers. Everything above
+that - CompletedRequests, process_requests, jobs, callbacks, encoders and outputs - is
+the real Picamera2 code, so this can be used to measure or regression-test the pipeline
+on any Linux machine. The libcamera Python bindings are still needed, for the control
+ids and other types that Picamera2 uses, but no camera or Raspberry Pi is.
+
+The camera looks like a USB camera to Picamera2, so raw streams are not available.
+
+Example::
+
+    from picamera2.virtual_camera import use_virtual_camera
+
+    use_virtual_camera(size=(1920, 1080), framerate=30, jitter=0.002)
+    picam2 = Picamera2()  # now a virtual camera
+"""
+
+import collections
+import logging
+import mmap
+import os
+import random
+import threading
+import time
+
+import libcamera
+import numpy as np
+from libcamera import controls, properties
+
+from .allocators.virtual_allocator import VirtualAllocator
+
+_log = logging.getLogger(__name__)
+
+# Bytes per pixel in the first plane, and the total frame size as a multiple of stride * height.
+_FORMATS = {
+    "XBGR8888": (4, 1),
+    "XRGB8888": (4, 1),
+    "BGR888": (3, 1),
+    "RGB888": (3, 1),
+    "YUYV": (2, 1),
+    "YVYU": (2, 1),
+    "UYVY": (2, 1),
+    "VYUY": (2, 1),
+    "YUV420": (1, 1.5),
+    "YVU420": (1, 1.5),
+    "NV12": (1, 1.5),
+    "NV21": (1, 1.5),
+}
+
+
+class VirtualControlInfo:
+    def __init__(self, min, max, default):
+        self.min = min
+        self.max = max
+        self.default = default
+
+
+class VirtualStreamFormats:
+    def __init__(self, size):
+        self._size = size
+        self.pixel_formats = [libcamera.PixelFormat(fmt) for fmt in _FORMATS]
+
+    def sizes(self, pixel_format):
+        return [self._size]
+
+
+class VirtualStream:
+    def __init__(self, configuration):
+        self.configuration = configuration
+
+
+class VirtualStreamConfiguration:
+    def __init__(self, sensor_size):
+        self._sensor_size = sensor_size
+        self.size = libcamera.Size(sensor_size.width, sensor_size.height)
+        self.pixel_format = libcamera.PixelFormat("XBGR8888")
+        self.stride = 0
+        self.frame_size = 0
+        self.buffer_count = 4
+        self.color_space = libcamera.ColorSpace.Sycc()
+        self.formats = VirtualStreamFormats(sensor_size)
+        self.stream = VirtualStream(self)
+
+    def validate(self):
+        adjusted = False
+        fmt = str(self.pixel_format)
+        if fmt not in _FORMATS:
+            self.pixel_format = libcamera.PixelFormat("XBGR8888")
+            fmt = "XBGR8888"
+            adjusted = True
+        width = min(self.size.width, self._sensor_size.width) & ~1
+        height = min(self.size.height, self._sensor_size.height) & ~1
+        if (width, height) != (self.size.width, self.size.height):
+            self.size = libcamera.Size(width, height)
+            adjusted = True
+        bytes_per_pixel, planes = _FORMATS[fmt]
+        # Like the Pi's ISP, we want rows to be a multiple of 64 bytes.
+        min_stride = (width * bytes_per_pixel + 63) & ~63
+        if self.stride < min_stride:
+            self.stride = min_stride
+        self.frame_size = int(self.stride * height * planes)
+        return adjusted
+
+
+class VirtualCameraConfiguration:
+    def __init__(self, sensor_size, count):
+        self._configs = [VirtualStreamConfiguration(sensor_size) for _ in range(count)]
+        self.orientation = libcamera.Orientation.Rotate0
+        self.sensor_config = None
+
+    def at(self, index):
+        return self._configs[index]
+
+    def __iter__(self):
+        return iter(self._configs)
+
+    def __len__(self):
+        return len(self._configs)
+
+    def validate(self):
+        adjusted = [config.validate() for config in self._configs]
+        if self.orientation != libcamera.Orientation.Rotate0:
+            self.orientation = libcamera.Orientation.Rotate0
+            adjusted.append(True)
+        return libcamera.CameraConfiguration.Status.Adjusted if any(adjusted) else libcamera.CameraConfiguration.Status.Valid
+
+
+class VirtualRequest:
+    def __init__(self, camera, cookie):
+        self.camera = camera
+        self.cookie = cookie
+        self.buffers = {}
+        self.metadata = {}
+        self.controls = {}
+        self.sequence = 0
+        self.status = libcamera.Request.Status.Pending
+
+    def add_buffer(self, stream, buffer):
+        self.buffers[stream] = buffer
+
+    def set_control(self, id, value):
+        self.controls[id] = value
+
+    def reuse(self):
+        self.metadata = {}
+        self.controls = {}
+        self.status = libcamera.Request.Status.Pending
+
+
+class VirtualCamera:
+    """A camera that produces frames of a fixed pattern at a steady rate, with optional jitter.
+
+    Frames are only produced while requests are queued. If a frame is due and there are
+    none, it is dropped (and counted in frames_dropped), just as a real sensor would skip it.
+    """
+
+    def __init__(self, manager, id, size, framerate, jitter, pattern):
+        self._manager = manager
+        self.id = id
+        self._size = libcamera.Size(*size)
+        self.jitter = jitter
+        self.pattern = pattern
+        frame_duration = int(1000000 / framerate)
+        self.properties = {
+            properties.Model: "virtual",
+            properties.Location: 2,
+            properties.Rotation: 0,
+            properties.PixelArraySize: self._size,
+            properties.PixelArrayActiveAreas: [libcamera.Rectangle(0, 0, *size)],
+        }
+        full_fov = libcamera.Rectangle(0, 0, *size)
+        self.controls = {
+            controls.FrameDurationLimits: VirtualControlInfo(min(frame_duration, 8333), 1000000, frame_duration),
+            controls.ExposureTime: VirtualControlInfo(100, 1000000, 10000),
+            controls.AnalogueGain: VirtualControlInfo(1.0, 16.0, 1.0),
+            controls.ScalerCrop: VirtualControlInfo(full_fov, full_fov, full_fov),
+        }
+        self.frame_duration = frame_duration
+        self.frames_produced = 0
+        self.frames_dropped = 0
+        self._values = {}
+        self._queue = collections.deque()
+        self._thread = None
+        self._running = False
+        self._filled = set()
+
+    def acquire(self):
+        pass
+
+    def release(self):
+        pass
+
+    def generate_configuration(self, roles):
+        return VirtualCameraConfiguration(self._size, len(roles))
+
+    def configure(self, config):
+        if config.validate() == libcamera.CameraConfiguration.Status.Invalid:
+            return -1
+        self._filled = set()
+        return 0
+
+    def create_request(self, cookie=0):
+        return VirtualRequest(self, cookie)
+
+    def start(self, initial_controls=None):
+        self._values = dict(initial_controls or {})
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="picamera2-virtual-camera", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        # Like libcamera, hand back anything still queued as cancelled.
+        while self._queue:
+            request = self._queue.popleft()
+            request.status = libcamera.Request.Status.Cancelled
+            self._manager._complete(request)
+
+    def queue_request(self, request):
+        self._queue.append(request)
+
+    def _frame_duration(self):
+        limits = self._values.get(controls.FrameDurationLimits)
+        if limits:
+            return max(limits[0], min(limits[1], self.frame_duration))
+        return self.frame_duration
+
+    def _fill(self, buffer):
+        # Write the pattern into each buffer just once, so that frames look like an image but cost nothing to produce.
+        plane = buffer.planes[0]
+        if (plane.fd, plane.length) in self._filled or self.pattern is None:
+            return
+        with mmap.mmap(plane.fd, plane.length, mmap.MAP_SHARED) as m:
+            if self.pattern == "noise":
+                data = np.random.randint(0, 256, plane.length, dtype=np.uint8)
+            else:
+                data = (np.arange(plane.length, dtype=np.uint32) % 251).astype(np.uint8)
+            m[:] = data.tobytes()
+        self._filled.add((plane.fd, plane.length))
+
+    def _run(self):
+        next_time = time.monotonic_ns()
+        while self._running:
+            frame_duration = self._frame_duration()
+            next_time += frame_duration * 1000
+            jitter = int(random.gauss(0, self.jitter) * 1e9) if self.jitter else 0
+            delay = (next_time + jitter - time.monotonic_ns()) / 1e9
+            if delay > 0:
+                time.sleep(delay)
+            if not self._queue:
+                self.frames_dropped += 1
+                continue
+            request = self._queue.popleft()
+            for id, value in request.controls.items():
+                self._values[id] = value
+            timestamp = time.monotonic_ns()
+            for buffer in request.buffers.values():
+                self._fill(buffer)
+                buffer.metadata.status = libcamera.FrameMetadata.Status.Success
+                buffer.metadata.sequence = self.frames_produced
+                buffer.metadata.timestamp = timestamp
+            request.sequence = self.frames_produced
+            request.metadata = {
+                controls.SensorTimestamp: timestamp,
+                controls.FrameDuration: frame_duration,
+                controls.ExposureTime: self._values.get(controls.ExposureTime) or min(frame_duration, 10000),
+                controls.AnalogueGain: self._values.get(controls.AnalogueGain) or 1.0,
+                controls.DigitalGain: 1.0,
+                controls.ScalerCrop: self.controls[controls.ScalerCrop].default,
+            }
+            request.status = libcamera.Request.Status.Complete
+            self.frames_produced += 1
+            self._manager._complete(request)
+
+
+class VirtualCameraManager:
+    """Stands in for libcamera.CameraManager, owning one or more virtual cameras."""
+
+    def __init__(self, num_cameras=1, size=(1920, 1080), framerate=30.0, jitter=0.0, pattern="gradient"):
+        """Create the virtual cameras.
+
+        :param size: Size of the (virtual) sensor, and the largest image it can produce
+        :param framerate: Default frames per second, which the FrameDurationLimits control can change
+        :param jitter: Standard deviation, in seconds, of random variations in frame timing
+        :param pattern: Image in the buffers, either "gradient", "noise" or None (left as zeroes)
+        """
+        self.cameras = [
+            VirtualCamera(self, f"/base/virtual/camera@{i}", size, framerate, jitter, pattern) for i in range(num_cameras)
+        ]
+        self._lock = threading.Lock()
+        self._ready = []
+        self._read_fd, self._write_fd = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+
+    @property
+    def event_fd(self):
+        return self._read_fd
+
+    def get(self, id):
+        return next(camera for camera in self.cameras if camera.id == id)
+
+    def find(self, id):
+        return next(camera for camera in self.cameras if id in camera.id)
+
+    def get_ready_requests(self):
+        try:
+            os.read(self._read_fd, 4096)
+        except BlockingIOError:
+            pass
+        with self._lock:
+            ready, self._ready = self._ready, []
+        return ready
+
+    def _complete(self, request):
+        with self._lock:
+            self._ready.append(request)
+        try:
+            os.write(self._write_fd, b"\x00")
+        except BlockingIOError:
+            pass  # there's already plenty to wake the reader
+
+    @staticmethod
+    def make_allocator():
+        return VirtualAllocator()
+
+
+def use_virtual_camera(**kwargs) -> VirtualCameraManager:
+    """Make all subsequently opened Picamera2 objects use virtual cameras.
+
+    The keyword arguments are passed to VirtualCameraManager. Call again with no
+    arguments to get a fresh set of cameras. Any open cameras must be closed first.
+    """
+    from .picamera2 import Picamera2
+
+    manager = VirtualCameraManager(**kwargs)
+    Picamera2._cm.set_backend(manager)
+    return manager
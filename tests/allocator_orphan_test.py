@@ -0,0 +1,46 @@
+#!/usr/bin/python3
+
+# Check that a request held across a reconfigure keeps its buffers mapped until it is
+# released, and that the allocators' mapping counts add up.
+
+from picamera2 import Picamera2
+from picamera2.allocators import DmaAllocator, PersistentAllocator
+
+
+def buffer_count(picam2):
+    return sum(len(picam2.allocator.buffers(stream)) for stream in picam2.streams)
+
+
+for allocator in [DmaAllocator(), PersistentAllocator()]:
+    name = type(allocator).__name__
+    picam2 = Picamera2()
+    picam2.allocator = allocator
+    picam2.configure(picam2.create_preview_configuration({"size": (640, 480)}, use_case="preview"))
+    if allocator.live_mappings != buffer_count(picam2):
+        raise RuntimeError(f"{name}: {allocator.live_mappings} mappings for {buffer_count(picam2)} buffers")
+    picam2.start()
+    request = picam2.capture_request()
+    picam2.stop()
+
+    picam2.configure(picam2.create_still_configuration({"size": (1280, 960)}, use_case="still"))
+    array = request.make_array("main")  # the old buffer must still be mapped
+    if array.shape[:2] != (480, 640):
+        raise RuntimeError(f"{name}: held request has the wrong array shape {array.shape}")
+    if isinstance(allocator, PersistentAllocator):
+        expected_orphans = 0  # the preview buffers are kept for next time
+    else:
+        expected_orphans = len(request.request.buffers)
+    if allocator.orphaned_mappings != expected_orphans:
+        raise RuntimeError(f"{name}: {allocator.orphaned_mappings} orphaned mappings, expected {expected_orphans}")
+    request.release()
+    if allocator.orphaned_mappings != 0:
+        raise RuntimeError(f"{name}: orphaned mappings left after release")
+
+    picam2.start()
+    picam2.capture_array("main")
+    picam2.stop()
+    picam2.close()
+    allocator.close()
+    if allocator.live_mappings != 0:
+        raise RuntimeError(f"{name}: {allocator.live_mappings} mappings left after close")
+    print(name, "passed")
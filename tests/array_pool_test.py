@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+
+# Check that capture_array can copy into caller-supplied arrays and reuse pooled ones.
+
+import numpy as np
+
+from picamera2 import Picamera2
+
+picam2 = Picamera2()
+config = picam2.create_preview_configuration({"format": "BGR888"}, lores={"format": "YUV420"})
+picam2.start(config)
+
+# Caller-supplied output arrays.
+reference = picam2.capture_array()
+out = np.empty_like(reference)
+if picam2.capture_array(out=out) is not out:
+    raise RuntimeError("capture_array did not use the out array")
+lores = np.empty_like(picam2.capture_array("lores"))
+arrays, metadata = picam2.capture_arrays(["main", "lores"], out=[out, lores])
+if arrays[0] is not out or arrays[1] is not lores:
+    raise RuntimeError("capture_arrays did not use the out arrays")
+try:
+    picam2.capture_array(out=np.empty((16, 16), dtype=np.uint8))
+    raise RuntimeError("Wrongly shaped out array was accepted")
+except RuntimeError as e:
+    if "shape" not in str(e):
+        raise
+
+# The pool.
+picam2.array_pool.enabled = True
+for _ in range(10):
+    array = picam2.capture_array()
+    picam2.array_pool.release(array)
+print("Pool hits", picam2.array_pool.hits, "misses", picam2.array_pool.misses)
+if picam2.array_pool.misses != 1 or picam2.array_pool.hits != 9:
+    raise RuntimeError("Array pool was not reused")
+
+# Reconfiguring must throw away the old arrays.
+picam2.stop()
+picam2.configure(picam2.create_preview_configuration({"size": (320, 240), "format": "BGR888"}))
+picam2.start()
+picam2.array_pool.release(array)
+array = picam2.capture_array()
+if array.shape != (240, 320, 3) or picam2.array_pool.misses != 2:
+    raise RuntimeError("Array pool was not invalidated by configure")
+
+picam2.stop()
+picam2.close()
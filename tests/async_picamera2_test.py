@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+
+# Drive the camera from asyncio, with several captures waiting at once.
+
+import asyncio
+
+from picamera2 import AsyncPicamera2, Picamera2
+
+
+async def main(picam2):
+    camera = AsyncPicamera2(picam2)
+
+    # Jobs can be awaited directly too.
+    metadata = await picam2.capture_metadata(wait=False)
+    print("ExposureTime", metadata["ExposureTime"])
+
+    array, metadata = await asyncio.gather(camera.capture_array("main"), camera.capture_metadata())
+    print("Array shape", array.shape)
+
+    async with camera.captured_request() as request:
+        print("Request", request)
+
+    # A cancelled capture must not keep hold of its request.
+    task = asyncio.ensure_future(camera.capture_request())
+    await asyncio.sleep(0)
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+
+    timestamps = []
+    async for request in camera:
+        timestamps.append(request.get_metadata()["SensorTimestamp"])
+        if len(timestamps) == 10:
+            break
+    if timestamps != sorted(timestamps):
+        raise RuntimeError("Requests arrived out of order")
+
+    array = await camera.switch_mode_and_capture_array(picam2.create_still_configuration())
+    print("Still shape", array.shape)
+
+
+picam2 = Picamera2()
+picam2.start(picam2.create_preview_configuration(buffer_count=4))
+asyncio.run(main(picam2))
+picam2.stop()
+picam2.close()
@@ -0,0 +1,35 @@
+#!/usr/bin/python3
+
+# Capture bursts of JPEG and DNG files, and check nothing is lost.
+
+import os
+import tempfile
+
+from picamera2 import Picamera2
+
+picam2 = Picamera2()
+config = picam2.create_still_configuration(buffer_count=4)
+picam2.start(config)
+
+with tempfile.TemporaryDirectory() as directory:
+    result = picam2.capture_burst(8, "main", os.path.join(directory, "burst{:03d}.jpg"))
+    print("Burst of 8 JPEGs took", result["elapsed"], "s, dropped", result["dropped"])
+    timestamps = [metadata["SensorTimestamp"] for metadata in result["metadata"]]
+    if timestamps != sorted(timestamps) or len(set(timestamps)) != 8:
+        raise RuntimeError("Burst frames are not consecutive")
+
+    result = picam2.capture_burst(3, "raw", os.path.join(directory, "burst{:03d}.dng"))
+    print("Burst of 3 DNGs took", result["elapsed"], "s, dropped", result["dropped"])
+
+    files = sorted(os.listdir(directory))
+    if len(files) != 11 or any(os.path.getsize(os.path.join(directory, file)) == 0 for file in files):
+        raise RuntimeError("Burst files were not all saved")
+
+frames = {}
+burst = picam2.capture_burst(4, sink=lambda index, data, metadata: frames.update({index: data}), wait=False)
+burst.get_result(timeout=10)
+if sorted(frames) != [0, 1, 2, 3] or not all(data.startswith(b"\xff\xd8") for data in frames.values()):
+    raise RuntimeError("Burst sink did not receive every JPEG")
+
+picam2.stop()
+picam2.close()
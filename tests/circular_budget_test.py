@@ -0,0 +1,46 @@
+#!/usr/bin/python3
+
+# Check that the circular outputs keep to their byte budgets, evicting whole GOPs from a
+# CircularOutput2 (or spilling them to disk), and that what gets written still starts on a
+# keyframe. No camera is needed.
+
+import io
+
+from picamera2.outputs import CircularOutput, CircularOutput2, EncodedPacket, FileOutput, SpillRing
+
+
+def send_frames(output, start, count, size, gop=4):
+    for i in range(start, start + count):
+        packet = EncodedPacket(bytes([65 + i % 26]) * size, i % gop == 0, i * 10000 + 1)
+        output.outputpacket(packet)
+        packet.release()
+
+
+circular = CircularOutput2(buffer_duration_ms=100000, max_bytes=100)
+circular.start()
+send_frames(circular, 0, 40, 10)
+if circular.buffered_bytes > 100 or not circular._circular[0][1]:
+    raise RuntimeError("CircularOutput2 did not evict whole GOPs to meet its budget")
+if circular.evicted_gops != 8 or circular.gops != 2:
+    raise RuntimeError(f"Unexpected GOP counts {circular.evicted_gops} {circular.gops}")
+
+ring = SpillRing(200)
+circular = CircularOutput2(buffer_duration_ms=100000, max_bytes=100, spill=ring)
+circular.start()
+send_frames(circular, 0, 40, 10)
+if circular.spilled_bytes != 200 or circular.buffered_bytes != 80:
+    raise RuntimeError(f"Unexpected spill {circular.spilled_bytes} {circular.buffered_bytes}")
+buffer = io.BytesIO()
+circular.open_output(FileOutput(buffer))
+circular.stop()
+# Frames 12 to 39 survive, 12 to 31 of them having been spilled to disk.
+expected = b"".join(bytes([65 + i % 26]) * 10 for i in range(12, 40))
+if buffer.getvalue() != expected:
+    raise RuntimeError("Spilled frames were not flushed correctly")
+ring.close()
+
+circular = CircularOutput(buffersize=100, max_bytes=50)
+circular.fileoutput = None
+send_frames(circular, 0, 20, 10)
+if circular.buffered_bytes != 50 or circular.evicted_frames != 15:
+    raise RuntimeError(f"CircularOutput did not meet its budget {circular.buffered_bytes} {circular.evicted_frames}")
@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+
+# Check that circular outputs start recordings from the right keyframe for a given pre-roll,
+# and that CircularOutput2 can write to several outputs at once. No camera is needed.
+
+import io
+
+from picamera2.outputs import CircularOutput, CircularOutput2, EncodedPacket, FileOutput
+
+
+def send_frames(output, start, count):
+    # One byte frames at 10fps, with a keyframe every second.
+    for i in range(start, start + count):
+        packet = EncodedPacket(bytes([65 + i % 26]), i % 10 == 0, i * 100000 + 1)
+        output.outputpacket(packet)
+        packet.release()
+
+
+def frames(start, stop):
+    return bytes(65 + i % 26 for i in range(start, stop))
+
+
+circular = CircularOutput2(buffer_duration_ms=5000)
+circular.start()
+send_frames(circular, 0, 60)
+three_seconds, one_second, shifted = io.BytesIO(), io.BytesIO(), io.BytesIO()
+circular.open_output(FileOutput(three_seconds), preroll_ms=3000)
+circular.open_output(FileOutput(one_second), preroll_ms=1000)
+circular.open_output(FileOutput(shifted))
+if three_seconds.getvalue() != frames(20, 60) or one_second.getvalue() != frames(40, 60):
+    raise RuntimeError("Pre-roll did not start from the expected keyframe")
+send_frames(circular, 60, 10)
+circular.stop()
+if three_seconds.getvalue() != frames(20, 70) or one_second.getvalue() != frames(40, 70):
+    raise RuntimeError("Live outputs did not receive new frames")
+if shifted.getvalue() != frames(10, 70):
+    raise RuntimeError("Time-shifted output did not receive the whole buffer")
+
+circular = CircularOutput(buffersize=50, preroll_ms=2000)
+circular.fileoutput = None
+send_frames(circular, 0, 60)
+buffer = io.BytesIO()
+circular.fileoutput = buffer
+circular.start()
+send_frames(circular, 60, 3)
+circular.stop()
+if buffer.getvalue() != frames(40, 63):
+    raise RuntimeError("CircularOutput pre-roll did not start from the expected keyframe")
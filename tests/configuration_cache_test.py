@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+
+# Check that warmed configurations are found again, by name and by contents, that switching to
+# them gives the same images as configuring from scratch, and that the buffers kept for them
+# are reused rather than allocated again.
+
+from picamera2 import Picamera2
+from picamera2.allocators import PersistentAllocator
+
+picam2 = Picamera2()
+preview_config = picam2.create_preview_configuration({"size": (640, 480)})
+still_config = picam2.create_still_configuration()
+picam2.configure(preview_config)
+picam2.start()
+cold_shape = picam2.switch_mode_and_capture_array(still_config).shape
+picam2.stop()
+
+cache = picam2.configuration_cache
+try:
+    cache.warm({"still": still_config})
+    raise RuntimeError("A configuration was warmed under a built-in name")
+except RuntimeError as e:
+    if "reserved" not in str(e):
+        raise
+cache.warm({"viewfinder": preview_config, "capture": still_config})
+if len(cache) != 2 or "capture" not in cache:
+    raise RuntimeError("Configurations were not warmed")
+if not isinstance(picam2.allocator, PersistentAllocator):
+    raise RuntimeError("Warming did not keep the buffers")
+if picam2.camera_config["main"]["size"] != (640, 480):
+    raise RuntimeError("Warming did not restore the previous configuration")
+still_buffers = dict(picam2.allocator.buffer_dict)
+
+picam2.start()
+hits = cache.hits
+for _ in range(3):
+    if picam2.switch_mode_and_capture_array(still_config).shape != cold_shape:
+        raise RuntimeError("Warmed still configuration gave a different image")
+    if picam2.switch_mode_and_capture_array("capture").shape != cold_shape:
+        raise RuntimeError("Still configuration warmed by name gave a different image")
+if cache.hits - hits < 6:
+    raise RuntimeError(f"Warmed configurations were not used, only {cache.hits - hits} hits")
+picam2.stop()
+
+for key, buffers in still_buffers.items():
+    if picam2.allocator.buffer_dict.get(key) is not buffers:
+        raise RuntimeError("Buffers for a warmed configuration were allocated again")
+
+stats = cache.stats()
+print("Switch times (ms): median", stats["median_switch_ms"], "max", stats["max_switch_ms"])
+
+# Other configurations must still work, even without a use case, and forgetting the warmed
+# ones releases their buffers.
+video_config = picam2.create_video_configuration({"size": (1280, 720)})
+del video_config["use_case"]
+picam2.configure(video_config)
+if picam2.allocator.buffer_key != cache.UNCACHED_USE_CASE:
+    raise RuntimeError("Configuration that was not warmed has no use case")
+picam2.start()
+if picam2.capture_array().shape[:2] != (720, 1280):
+    raise RuntimeError("Configuration that was not warmed gave the wrong image")
+picam2.stop()
+cache.clear()
+if len(cache) != 0:
+    raise RuntimeError("Configuration cache was not cleared")
+
+# Configurations that are warmed straight after being created must be found again by contents,
+# even though warming them fills in parts of their stream dictionaries.
+fresh_preview = picam2.create_preview_configuration({"size": (640, 480)})
+fresh_still = picam2.create_still_configuration()
+cache.warm({"viewfinder": fresh_preview, "capture": fresh_still})
+picam2.configure(fresh_preview)
+picam2.start()
+hits, misses = cache.hits, cache.misses
+for _ in range(3):
+    picam2.switch_mode_and_capture_array(fresh_still)
+if cache.misses != misses or cache.hits - hits < 3:
+    raise RuntimeError(f"Freshly warmed configurations were not found, {cache.misses - misses} misses")
+picam2.stop()
+picam2.close()
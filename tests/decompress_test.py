@@ -0,0 +1,41 @@
+#!/usr/bin/python3
+
+# Check that compressed raw frames decompress the same way however many threads are used.
+
+import io
+
+import numpy as np
+
+from picamera2 import Picamera2, Platform
+from picamera2.decompress import PispDecompressor
+from picamera2.sensor_format import SensorFormat
+
+# Only PiSP platforms produce compressed raw frames.
+if Picamera2.platform == Platform.VC4:
+    print("SKIPPED (VC4 platform)")
+    quit(0)
+
+picam2 = Picamera2()
+config = picam2.create_still_configuration(buffer_count=2)
+picam2.start(config)
+
+raw_config = picam2.camera_config["raw"]
+if SensorFormat(raw_config["format"]).packing != "PISP_COMP1":
+    print("SKIPPED (raw stream not compressed)")
+    quit(0)
+
+with picam2.captured_request() as request:
+    raw = request.make_array("raw")
+    request.save_dng(io.BytesIO())
+
+pixels = PispDecompressor(num_threads=1).decompress(raw)
+with PispDecompressor(num_threads=4, tile_rows=7) as decompressor:
+    out = np.zeros(raw.shape, dtype=np.uint16)
+    if decompressor.decompress(raw, out=out) is not out or not np.array_equal(out, pixels):
+        raise RuntimeError("Threaded decompression does not match")
+if not np.array_equal(picam2.helpers.decompress(raw), pixels.view(np.uint8)):
+    raise RuntimeError("Helpers.decompress does not match")
+print("Mean pixel level", pixels.mean())
+
+picam2.stop()
+picam2.close()
@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+
+# Check that FrameFanout shares frames between subscribers and gives the buffers back.
+
+import time
+
+from picamera2 import FrameFanout, Picamera2
+
+picam2 = Picamera2()
+config = picam2.create_preview_configuration(buffer_count=4)
+picam2.configure(config)
+
+fanout = FrameFanout(picam2, "main")
+sub1 = fanout.subscribe(maxlen=2)
+sub2 = fanout.subscribe(maxlen=1, policy="drop_newest")
+fanout.start()
+picam2.start()
+
+frame1 = sub1.get(timeout=2)
+frame2 = sub2.get(timeout=2)
+if frame1.array.shape[:2] != config["main"]["size"][::-1]:
+    raise RuntimeError(f"Unexpected frame shape {frame1.array.shape}")
+if frame1.array.flags.writeable:
+    raise RuntimeError("Shared frames should not be writeable")
+if "SensorTimestamp" not in frame1.get_metadata():
+    raise RuntimeError("Frame metadata is missing")
+frame1.release()
+frame2.release()
+
+# Neither subscriber is reading now, so frames must be dropped rather than stalling the camera.
+time.sleep(1)
+if sub1.dropped == 0 or sub2.dropped == 0:
+    raise RuntimeError("Expected idle subscribers to drop frames")
+picam2.capture_metadata()
+
+sub2.close()
+for _ in range(5):
+    with sub1.get(timeout=2):
+        pass
+
+fanout.stop()
+picam2.stop()
+picam2.close()
@@ -0,0 +1,46 @@
+#!/usr/bin/python3
+
+# Iterate over frames with Picamera2.frame_stream, both synchronously and with asyncio.
+
+import asyncio
+import time
+
+from picamera2 import Picamera2
+
+picam2 = Picamera2()
+picam2.start(picam2.create_preview_configuration(buffer_count=4))
+
+timestamps = []
+with picam2.frame_stream("main", maxsize=2, policy="drop_oldest") as frames:
+    for request in frames:
+        timestamps.append(request.get_metadata()["SensorTimestamp"])
+        if len(timestamps) == 10:
+            break
+if timestamps != sorted(timestamps):
+    raise RuntimeError("Frames arrived out of order")
+
+# A slow consumer should see frames dropped rather than holding up the camera.
+with picam2.frame_stream(maxsize=1, policy="drop_newest") as frames:
+    for n, _ in enumerate(frames):
+        time.sleep(0.2)
+        if n == 5:
+            break
+    print("Slow consumer: delivered", frames.delivered, "dropped", frames.dropped)
+    if frames.dropped == 0:
+        raise RuntimeError("Slow consumer should have dropped frames")
+
+
+async def main():
+    async with picam2.frame_stream("main") as frames:
+        n = 0
+        async for _ in frames:
+            n += 1
+            if n == 10:
+                break
+    print("Async consumer: delivered", frames.delivered, "dropped", frames.dropped)
+
+
+asyncio.run(main())
+
+picam2.stop()
+picam2.close()
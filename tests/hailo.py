@@ -1,9 +1,10 @@
 #!/bin/python3
 
 import os
+import time
 
 try:
-    from picamera2.devices import Hailo, hailo_architecture
+    from picamera2.devices import Hailo, HailoStream, hailo_architecture
 except ImportError:
     print("SKIPPED (hailo_platform not installed)")
     quit()
@@ -91,3 +92,68 @@ with Hailo(pose_model) as hailo:
             print("Pose model: all", NUM_FRAMES, "frames returned results")
 
         picam2.stop()
+
+# Test streaming, batched detection from a lores stream of a different size to the model.
+print("Testing HailoStream with batches of 2:", detect_model)
+with Hailo(detect_model, batch_size=2) as hailo:
+    results = []
+
+    def on_result(output, metadata):
+        results.append(metadata["SensorTimestamp"])
+
+    with Picamera2() as picam2:
+        config = picam2.create_preview_configuration(
+            main={'size': (1920, 1080), 'format': 'XRGB8888'}, lores={'size': (640, 360), 'format': 'RGB888'}
+        )
+        picam2.configure(config)
+        picam2.start()
+
+        stream = HailoStream(hailo, picam2, "lores", on_result=on_result)
+        with stream:
+            picam2.capture_metadata()
+            while len(results) < NUM_FRAMES:
+                picam2.capture_metadata()
+        picam2.stop()
+
+    stats = stream.stats()
+    print("HailoStream:", stats)
+    if results != sorted(results):
+        print("ERROR: HailoStream results arrived out of order")
+    if stats["queue_depth"] != 0:
+        print("ERROR: HailoStream left frames unfinished:", stats["queue_depth"])
+    if stats["errors"]:
+        print("ERROR: HailoStream inference failed on", stats["errors"], "batches")
+    if hailo.bindings_created > hailo.max_free_bindings + 2:
+        print("ERROR: HailoStream created", hailo.bindings_created, "sets of bindings")
+
+# Frames that can't be prepared must be dropped without sending empty batches to the device,
+# and stopping must not wait for them.
+print("Testing HailoStream with frames that fail to prepare:", detect_model)
+with Hailo(detect_model, batch_size=2) as hailo:
+
+    def broken_letterbox(image, out):
+        raise RuntimeError("frame could not be prepared")
+
+    with Picamera2() as picam2:
+        config = picam2.create_preview_configuration(lores={'size': (640, 360), 'format': 'RGB888'})
+        picam2.configure(config)
+        picam2.start()
+
+        stream = HailoStream(hailo, picam2, "lores")
+        stream.letterbox = broken_letterbox
+        stream.start()
+        for _ in range(5):
+            picam2.capture_metadata()
+        start = time.monotonic()
+        stream.stop(timeout=5)
+        stop_time = time.monotonic() - start
+        picam2.stop()
+
+    stats = stream.stats()
+    print("HailoStream with failing frames:", stats)
+    if stop_time >= 5:
+        print("ERROR: HailoStream did not stop after frames failed")
+    if stats["batches"] or stats["completed"]:
+        print("ERROR: HailoStream ran batches with no frames in them")
+    if not stats["errors"] or stats["dropped"] != stats["received"]:
+        print("ERROR: HailoStream did not drop and count every failed frame")
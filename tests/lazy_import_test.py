@@ -0,0 +1,36 @@
+#!/usr/bin/python3
+
+# Check that "import picamera2" leaves the heavy optional modules alone, that everything it
+# exports can still be imported, and that it stays within its startup time budget, which can
+# be changed with PICAMERA2_IMPORT_BUDGET_MS.
+
+import os
+import subprocess
+import sys
+
+benchmark = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks", "import_time.py")
+budget_ms = os.environ.get("PICAMERA2_IMPORT_BUDGET_MS", "1500")
+result = subprocess.run([sys.executable, benchmark, "--budget-ms", budget_ms, "--top", "5"], capture_output=True, text=True)
+print(result.stdout)
+if result.returncode:
+    raise RuntimeError(f"import picamera2 is too slow or imports too much:\n{result.stdout}{result.stderr}")
+
+# The deferred names must all still be there, from the package and from its subpackages.
+check = """
+import picamera2, picamera2.encoders, picamera2.outputs, picamera2.previews
+for module in (picamera2.encoders, picamera2.outputs, picamera2.previews):
+    for name in module.__all__:
+        getattr(module, name)
+from picamera2 import AsyncPicamera2, Picamera2, Pool, Preview, Process, RemoteMappedArray, RemoteRequest
+from picamera2.encoders import H264Encoder, JpegEncoder, MJPEGEncoder, Quality
+from picamera2.outputs import CircularOutput, FfmpegOutput, FileOutput, PyavOutput
+for preview in Preview:
+    if not isinstance(preview.value, type):
+        raise RuntimeError(f"{preview} does not give a preview class")
+    if Preview(preview.value) is not preview:
+        raise RuntimeError(f"{preview.value} does not give back {preview}")
+"""
+result = subprocess.run([sys.executable, "-c", check], capture_output=True, text=True)
+if result.returncode:
+    raise RuntimeError(f"Names exported by picamera2 could not be imported:\n{result.stderr}")
+print("Lazy imports passed")
@@ -0,0 +1,48 @@
+#!/usr/bin/python3
+
+# Check the MotionDetector sees motion in synthetic frames, with the expected hysteresis, and
+# that it runs on the lores stream of a (virtual) camera.
+
+import time
+
+import numpy as np
+
+from picamera2 import Picamera2
+from picamera2.motion import MotionDetector
+from picamera2.virtual_camera import use_virtual_camera
+
+events = []
+detector = MotionDetector(
+    None,
+    start_frames=2,
+    stop_frames=10,
+    on_start=lambda d: events.append(("start", d.frames)),
+    on_stop=lambda d: events.append(("stop", d.frames)),
+)
+rng = np.random.default_rng(0)
+background = rng.integers(60, 120, (240, 320), dtype=np.uint8)
+for i in range(100):
+    frame = background + rng.integers(0, 4, background.shape, dtype=np.uint8)
+    if 20 <= i < 40:
+        frame[100:160, 100:180] = 250
+    detector.detect(frame)
+if [event for event, _ in events] != ["start", "stop"] or events[0][1] != 22:
+    raise RuntimeError(f"Unexpected motion events {events}")
+
+start = time.perf_counter()
+for _ in range(100):
+    detector.detect(background)
+print("Motion detection takes", (time.perf_counter() - start) * 10, "ms per frame")
+
+use_virtual_camera(size=(1280, 720), framerate=30)
+picam2 = Picamera2()
+picam2.configure(picam2.create_video_configuration(lores={"size": (320, 240), "format": "YUV420"}))
+detector = MotionDetector(picam2, "lores")
+picam2.start()
+with detector:
+    time.sleep(1)
+picam2.stop()
+picam2.close()
+Picamera2._cm.set_backend(None)
+if detector.frames < 10 or detector.motion:
+    raise RuntimeError(f"Detector saw {detector.frames} frames, motion {detector.motion}")
@@ -0,0 +1,51 @@
+#!/usr/bin/python3
+
+# Check that an ordered remote.Pool completes its results in frame order even when some
+# frames take much longer than others, and that a capped pool drops requests rather than
+# holding on to more camera buffers than it's allowed.
+
+import time
+
+from picamera2 import Picamera2, Pool
+
+
+def run(request):
+    timestamp = request.get_metadata()["SensorTimestamp"]
+    # Every fourth frame is slow, so results would otherwise come back out of order.
+    time.sleep(0.2 if (timestamp // 1000) % 4 == 0 else 0.01)
+    return timestamp
+
+
+if __name__ == "__main__":
+    picam2 = Picamera2()
+    picam2.configure(picam2.create_preview_configuration(buffer_count=8))
+
+    completed = []
+    with Pool(run, 4, picam2, max_in_flight=6, ordered=True) as pool:
+        picam2.start()
+        futures = []
+        for _ in range(40):
+            with picam2.captured_request() as request:
+                future = pool.send(request)
+            future.add_done_callback(lambda f: completed.append(f.result()))
+            futures.append(future)
+            if pool.in_flight > 6:
+                raise RuntimeError("Too many requests in flight")
+        results = [future.result() for future in futures]
+        picam2.stop()
+    if results != sorted(results) or completed != results:
+        raise RuntimeError("Results were not delivered in frame order")
+
+    with Pool(run, 2, picam2, max_in_flight=2, policy="drop_newest") as pool:
+        picam2.start()
+        futures = []
+        for _ in range(20):
+            with picam2.captured_request() as request:
+                futures.append(pool.send(request))
+        for future in futures:
+            if not future.cancelled():
+                future.result()
+        picam2.stop()
+        if pool.dropped == 0 or pool.dropped != sum(future.cancelled() for future in futures):
+            raise RuntimeError(f"Unexpected number of dropped requests {pool.dropped}")
+    picam2.close()
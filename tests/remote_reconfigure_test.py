@@ -0,0 +1,34 @@
+#!/usr/bin/python3
+
+# Check that one remote Process keeps working as the camera is reconfigured, as the buffers
+# it has mapped (and the configuration it has been sent) must then be replaced, and that
+# keyword arguments and metadata reach the child intact.
+
+from picamera2 import Picamera2, Process
+
+
+def run(request, tag=None):
+    array = request.make_array("main")
+    return request.config["main"]["size"], array.shape, request.get_metadata()["SensorTimestamp"], tag
+
+
+if __name__ == "__main__":
+    picam2 = Picamera2()
+    process = Process(run, picam2)
+    for size in [(1920, 1080), (640, 480), (1280, 720)]:
+        picam2.configure(picam2.create_preview_configuration({"size": size, "format": "RGB888"}))
+        picam2.start()
+        futures = []
+        for i in range(10):
+            with picam2.captured_request() as request:
+                futures.append((request.get_metadata()["SensorTimestamp"], i, process.send(request, tag=i)))
+        for timestamp, i, future in futures:
+            result_size, shape, result_timestamp, tag = future.result()
+            if result_size != size or shape != (size[1], size[0], 3):
+                raise RuntimeError(f"Wrong size {result_size} {shape} for {size}")
+            if result_timestamp != timestamp or tag != i:
+                raise RuntimeError("Metadata or keyword arguments did not arrive intact")
+        picam2.stop()
+        print(f"Size {size} passed")
+    process.close()
+    picam2.close()
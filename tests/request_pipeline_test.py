@@ -0,0 +1,36 @@
+#!/usr/bin/python3
+
+# Check that a slow post_callback no longer holds up the encoder once the
+# request pipeline is running its stages on separate threads.
+
+import time
+
+from picamera2 import Picamera2
+from picamera2.encoders import Encoder
+from picamera2.outputs import Output
+
+
+def slow_callback(request):
+    time.sleep(0.1)
+
+
+picam2 = Picamera2()
+picam2.configure(picam2.create_video_configuration(controls={"FrameRate": 30}))
+picam2.post_callback = slow_callback
+picam2.request_pipeline.start_threads(maxlen=2)
+encoder = Encoder()
+picam2.start_recording(encoder, Output())
+time.sleep(3)
+picam2.stop_recording()
+
+stats = picam2.request_pipeline.stats
+print("Frames", picam2.frames, "encoded", encoder.frames_encoded, "dropped", picam2.request_pipeline.dropped)
+print("Encoder latency", stats["encoders"].summary())
+print("Histograms", picam2.request_pipeline.histograms())
+if encoder.frames_encoded < picam2.frames * 0.9:
+    raise RuntimeError("Encoder was held up by the post_callback")
+if picam2.request_pipeline.dropped["post_callback"] == 0:
+    raise RuntimeError("Slow post_callback should have dropped frames")
+
+picam2.request_pipeline.stop_threads()
+picam2.close()
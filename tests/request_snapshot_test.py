@@ -0,0 +1,44 @@
+#!/usr/bin/python3
+
+# Check that the requests from one configuration share a single read-only copy of it, that a
+# new configuration gets a new one, and that controls still reach the camera now that they are
+# only sent when they have changed.
+
+from picamera2 import Picamera2
+
+picam2 = Picamera2()
+previous = None
+for size in [(640, 480), (1280, 720)]:
+    picam2.configure(picam2.create_video_configuration({"size": size}, lores={"size": (320, 240)}))
+    picam2.start()
+    with picam2.captured_request() as first:
+        config, stream_map = first.config, first.stream_map
+    with picam2.captured_request() as second:
+        if second.config is not config or second.stream_map is not stream_map:
+            raise RuntimeError("Requests from one configuration do not share it")
+    if config["main"]["size"] != size or config is previous:
+        raise RuntimeError("Requests still have the old configuration")
+    try:
+        config["main"] = None
+    except TypeError:
+        pass
+    else:
+        raise RuntimeError("Request configuration is not read-only")
+    previous = config
+
+    picam2.set_controls({"ExposureTime": 5000, "AnalogueGain": 2.0})
+    for _ in range(30):
+        metadata = picam2.capture_metadata()
+        if abs(metadata["ExposureTime"] - 5000) < 200:
+            break
+    else:
+        raise RuntimeError(f"ExposureTime was never applied, got {metadata['ExposureTime']}")
+    # Nothing has changed since, so the following frames must keep the same settings.
+    for _ in range(10):
+        if abs(picam2.capture_metadata()["ExposureTime"] - 5000) >= 200:
+            raise RuntimeError("ExposureTime did not stay fixed")
+    picam2.set_controls({"ExposureTime": 0, "AnalogueGain": 0})
+    picam2.stop()
+    print(f"Size {size} passed")
+
+picam2.close()
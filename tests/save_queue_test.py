@@ -0,0 +1,39 @@
+#!/usr/bin/python3
+
+# Save a quick burst of images in the background using a SaveQueue.
+
+import os
+import tempfile
+
+from picamera2 import Picamera2, SaveQueue
+
+picam2 = Picamera2()
+config = picam2.create_still_configuration(buffer_count=3)
+picam2.start(config)
+
+with tempfile.TemporaryDirectory() as directory:
+    futures = []
+    with SaveQueue(num_workers=2, max_pending=4) as save_queue:
+        for i in range(6):
+            with picam2.captured_request() as request:
+                futures.append(save_queue.submit(request, os.path.join(directory, f"image{i}.jpg")))
+                if i == 0:
+                    futures.append(save_queue.submit(request, os.path.join(directory, "image.png")))
+                    futures.append(save_queue.submit_dng(request, os.path.join(directory, "image.dng")))
+    print("Maximum queue depth", save_queue.max_depth)
+    print("Encode times (ms)", save_queue.encode_time.summary())
+
+    with SaveQueue(copy=False) as save_queue:
+        with picam2.captured_request() as request:
+            futures.append(save_queue.submit(request, os.path.join(directory, "held.jpg")))
+
+    for future in futures:
+        future.result()
+    for file in os.listdir(directory):
+        if os.path.getsize(os.path.join(directory, file)) == 0:
+            raise RuntimeError(f"{file} is empty")
+    if len(os.listdir(directory)) != 9:
+        raise RuntimeError("Some images were not saved")
+
+picam2.stop()
+picam2.close()
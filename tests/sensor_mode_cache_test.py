@@ -0,0 +1,42 @@
+#!/usr/bin/python3
+
+# Check that sensor modes are only worked out when they are looked at, that a second Picamera2
+# reads them all back from the cache without reconfiguring the camera, and that they come out
+# the same either way.
+
+import os
+import tempfile
+
+with tempfile.TemporaryDirectory() as cache_dir:
+    os.environ["PICAMERA2_SENSOR_MODE_CACHE"] = cache_dir
+    from picamera2 import Picamera2
+
+    picam2 = Picamera2()
+    modes = picam2.sensor_modes
+    if modes.stats()["probed"] != 0:
+        raise RuntimeError("Sensor modes were worked out before they were looked at")
+    modes[0]
+    if modes.stats()["probed"] > 1:
+        raise RuntimeError("Looking at one sensor mode worked out others too")
+    cold = [dict(mode, format=str(mode["format"])) for mode in modes]
+    cold_stats = modes.stats()
+    picam2.close()
+
+    picam2 = Picamera2()
+    modes = picam2.sensor_modes
+    warm = [dict(mode, format=str(mode["format"])) for mode in modes]
+    warm_stats = modes.stats()
+    if warm != cold:
+        raise RuntimeError(f"Cached sensor modes differ: {warm} != {cold}")
+    if warm_stats["probed"] != 0:
+        raise RuntimeError("Cached sensor modes were worked out again")
+    print("Cold enumeration:", cold_stats)
+    print("Warm enumeration:", warm_stats)
+
+    # The camera must still work normally in a cached mode.
+    mode = modes[-1]
+    picam2.configure(picam2.create_preview_configuration(raw={"size": mode["size"], "format": mode["format"].format}))
+    picam2.start()
+    picam2.capture_metadata()
+    picam2.stop()
+    picam2.close()
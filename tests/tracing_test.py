@@ -0,0 +1,39 @@
+#!/usr/bin/python3
+
+# Trace frames through the callbacks, an encoder and its output, and save a Chrome trace.
+
+import json
+import os
+import tempfile
+import time
+
+from picamera2 import Picamera2, Tracer
+from picamera2.encoders import H264Encoder
+from picamera2.outputs import FileOutput
+
+picam2 = Picamera2()
+picam2.configure(picam2.create_video_configuration())
+picam2.tracer = Tracer()
+picam2.post_callback = lambda request: None
+
+with tempfile.TemporaryDirectory() as directory:
+    picam2.start_recording(H264Encoder(), FileOutput(os.path.join(directory, "test.h264")))
+    time.sleep(2)
+    picam2.stop_recording()
+
+    summary = picam2.tracer.summary()
+    for stage, stats in summary.items():
+        print(stage, stats)
+    for stage in ("handle_request", "process_requests", "post_callback", "encoder_submit:H264Encoder(main)"):
+        if summary.get(stage, {}).get("count", 0) == 0:
+            raise RuntimeError(f"No frames traced for {stage}")
+    if not any(stage.startswith("output:") for stage in summary):
+        raise RuntimeError("Encoded frames were not traced to the output")
+
+    trace_file = os.path.join(directory, "trace.json")
+    picam2.tracer.dump(trace_file)
+    with open(trace_file) as f:
+        if not json.load(f)["traceEvents"]:
+            raise RuntimeError("Chrome trace has no events")
+
+picam2.close()
@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+
+# Check that the V4L2 encoders can send the same encoded buffers to a FileOutput and to a
+# CircularOutput2 at once, that both see every frame, and that every capture buffer has been
+# given back to the codec by the time the encoder stops.
+
+import io
+import time
+
+from picamera2 import Picamera2
+from picamera2.encoders import H264Encoder, MJPEGEncoder
+from picamera2.outputs import CircularOutput2, FileOutput
+
+
+class CountingOutput(FileOutput):
+    def __init__(self):
+        super().__init__(io.BytesIO())
+        self.count = 0
+
+    def outputframe(self, frame, keyframe=True, timestamp=None, packet=None, audio=False):
+        self.count += 1
+        super().outputframe(frame, keyframe, timestamp, packet, audio)
+
+
+def counting(encoder_class):
+    # Count the capture buffers handed to the outputs, and the ones given back to the codec.
+    class CountingEncoder(encoder_class):
+        def _start(self):
+            self.dequeued = 0
+            self.requeued = 0
+            self.outstanding = None
+            super()._start()
+
+        def _output_capture_buffer(self, buf):
+            self.dequeued += 1
+            super()._output_capture_buffer(buf)
+
+        def _requeue(self, index, frame):
+            if self.vd is not None and not self.vd.closed and index in self._requeue_bufs:
+                self.requeued += 1
+            super()._requeue(index, frame)
+
+        def _stop(self):
+            self.thread.join()
+            self.outstanding = self.dequeued - self.requeued
+            super()._stop()
+
+    return CountingEncoder
+
+
+picam2 = Picamera2()
+picam2.configure(picam2.create_video_configuration({"size": (640, 480)}))
+picam2.start()
+
+for encoder_class in (H264Encoder, MJPEGEncoder):
+    encoder = counting(encoder_class)(10000000)
+    direct = CountingOutput()
+    circular = CircularOutput2(buffer_duration_ms=1000)
+    encoder.output = [direct, circular]
+    picam2.start_encoder(encoder)
+    circular_copy = CountingOutput()
+    circular.open_output(circular_copy)
+    time.sleep(2)
+    picam2.stop_encoder()
+
+    name = encoder_class.__name__
+    print(f"{name}: {encoder.dequeued} encoded, {direct.count} to file, {circular_copy.count} through circular buffer")
+    if direct.count < 30:
+        raise RuntimeError(f"{name} only wrote {direct.count} frames")
+    if encoder.dequeued - direct.count > 2:
+        raise RuntimeError(f"{name} encoded {encoder.dequeued} frames but only wrote {direct.count}")
+    if abs(circular_copy.count - direct.count) > 2:
+        raise RuntimeError(f"{name} wrote {direct.count} frames but {circular_copy.count} went through the circular buffer")
+    if encoder.outstanding != 0:
+        raise RuntimeError(f"{name} stopped with {encoder.outstanding} capture buffers not requeued")
+
+picam2.stop()
+picam2.close()
@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+
+# Run Picamera2 on a virtual camera, checking frames, jobs, encoders and outputs all work
+# without any camera hardware.
+
+import io
+import time
+
+from picamera2 import Picamera2
+from picamera2.encoders import JpegEncoder
+from picamera2.outputs import FileOutput
+from picamera2.virtual_camera import use_virtual_camera
+
+manager = use_virtual_camera(size=(1280, 720), framerate=30, jitter=0.001)
+picam2 = Picamera2()
+if picam2.camera_properties["Model"] != "virtual":
+    raise RuntimeError("Virtual camera was not used")
+
+picam2.configure(picam2.create_video_configuration({"size": (640, 480), "format": "YUV420"}))
+picam2.start()
+
+array = picam2.capture_array("main")
+if array.shape != (720, 640):
+    raise RuntimeError(f"Unexpected array shape {array.shape}")
+
+timestamps = []
+for _ in range(10):
+    timestamps.append(picam2.capture_metadata()["SensorTimestamp"])
+if timestamps != sorted(timestamps):
+    raise RuntimeError("Timestamps out of order")
+
+picam2.set_controls({"FrameRate": 60})
+time.sleep(0.2)
+duration = picam2.capture_metadata()["FrameDuration"]
+if abs(duration - 16666) > 100:
+    raise RuntimeError(f"FrameRate control not applied, frame duration {duration}")
+
+buffer = io.BytesIO()
+picam2.start_encoder(JpegEncoder(), FileOutput(buffer))
+time.sleep(1)
+picam2.stop_encoder()
+if not buffer.getvalue().startswith(b"\xff\xd8"):
+    raise RuntimeError("Encoder produced no JPEG output")
+
+picam2.stop()
+picam2.close()
+print("Frames produced", manager.cameras[0].frames_produced, "dropped", manager.cameras[0].frames_dropped)
+
+# Go back to real cameras for anything else.
+Picamera2._cm.set_backend(None)
@@ -0,0 +1,34 @@
+#!/usr/bin/python3
+
+# Check the YUV to RGB converter against the RGB image that the ISP produces for the same frame.
+
+import numpy as np
+
+from picamera2 import Picamera2, YUV420_to_RGB, YUVToRGBConverter
+
+picam2 = Picamera2()
+size = (640, 480)
+config = picam2.create_preview_configuration({"size": size, "format": "RGB888"}, lores={"size": size, "format": "YUV420"})
+picam2.start(config)
+
+(rgb, yuv), _ = picam2.capture_arrays(["main", "lores"])
+rgb = rgb[..., :3].astype(np.int16)
+lores_config = picam2.camera_config["lores"]
+
+with YUVToRGBConverter.from_config(lores_config, num_threads=2) as converter:
+    converted = converter.convert(yuv)
+if converted.shape != (size[1], size[0], 3):
+    raise RuntimeError(f"Unexpected shape {converted.shape}")
+diff = np.abs(converted.astype(np.int16) - rgb).mean()
+print("Full resolution mean difference", diff)
+if diff > 10:
+    raise RuntimeError("Converted image does not match the RGB image")
+
+half = YUV420_to_RGB(yuv, (lores_config["stride"], size[1]), final_width=size[0] // 2)
+diff = np.abs(half.astype(np.int16) - rgb[::2, ::2]).mean()
+print("Half resolution mean difference", diff)
+if diff > 10:
+    raise RuntimeError("Converted half resolution image does not match the RGB image")
+
+picam2.stop()
+picam2.close()